@@ -1,62 +1,233 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, inspect, text
+from sqlalchemy import (Column, Integer, String, Unicode, DateTime, Index, PrimaryKeyConstraint, and_,
+                        bindparam, column, delete, insert, inspect, or_, select, table, text, update)
+from sqlalchemy.exc import NoSuchTableError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+import base64
+import hashlib
+import json
+import os
 import re
+import threading
+from collections import OrderedDict
+from datetime import datetime
 import pymssql
 
+from Models.AuditRetention import AuditRetention
+from Models.DmlParser import analizar_sentencia, convertir_literal, dividir_nombre, nombre_calificado, nombre_sql
+from Models.IdAllocator import obtener_asignador_ids
+from services.EngineRegistry import engine_registry, EngineRegistry
+from services.SchemaCache import get_schema_snapshot
+
 Base = declarative_base()
 
+TRIGGER_VERSION = 1
+
+# Tablas con triggers vigentes en este proceso: evita consultar el catálogo en cada sentencia.
+# LRU acotada como las demás cachés por base
+_tablas_instrumentadas = OrderedDict()
+MAX_TABLAS_INSTRUMENTADAS = int(os.environ.get('AUDITORIA_MAX_TABLAS_CACHE', 4096))
+_logs_verificados = set()
+_cache_lock = threading.Lock()
+
+LIMITE_MAXIMO_LOG = 1000
+
+MODOS_TRIGGER = ('completo', 'diferencial')
+
+# Tipos que no admiten comparación con INTERSECT o que cambian en cada UPDATE
+TIPOS_SIN_DIFERENCIA = ('text', 'ntext', 'image', 'xml', 'geography', 'geometry', 'hierarchyid',
+                        'sql_variant', 'timestamp', 'rowversion')
+
 class AuditoriaLog(Base):
     __tablename__ = 'auditoria_log'
-    id = Column(Integer, primary_key=True)
-    tabla = Column(String)
-    operacion = Column(String)
-    usuario = Column(String)
+    # Clustered por tiempo (inserciones al final, archivado por rangos) y un índice cubriente
+    # para las búsquedas por tabla/operación ordenadas por fecha
+    __table_args__ = (
+        PrimaryKeyConstraint('id', mssql_clustered=False),
+        Index('ix_auditoria_log_fecha', 'fecha_hora', 'id', mssql_clustered=True),
+        Index('ix_auditoria_log_tabla_operacion_fecha', 'tabla', 'operacion', 'fecha_hora', 'id',
+              mssql_include=['usuario']),
+    )
+    id = Column(Integer)
+    tabla = Column(Unicode(128))
+    operacion = Column(String(16))
+    usuario = Column(Unicode(128))
     fecha_hora = Column(DateTime)
-    datos = Column(String)
+    datos = Column(Unicode)
 
 class AuditModel:
-    def __init__(self, server, database, username, password):
-        self.engine = create_engine(f'mssql+pymssql://{username}:{password}@{server}/{database}')
+    def __init__(self, server, database, username, password, modo_trigger='completo'):
+        if modo_trigger not in MODOS_TRIGGER:
+            raise ValueError(f"Modo de trigger no válido, use uno de: {', '.join(MODOS_TRIGGER)}")
+        self.engine = engine_registry.get_engine(server, database, username, password)
+        self.modo_trigger = modo_trigger
         self.Session = sessionmaker(bind=self.engine)
+        self.asignador_ids = obtener_asignador_ids(self.engine)
         self.crear_tabla_auditoria()
 
     def crear_tabla_auditoria(self):
         inspector = inspect(self.engine)
         if 'auditoria_log' not in inspector.get_table_names():
             Base.metadata.create_all(self.engine)
-            with self.engine.connect() as conn:
-                conn.execute(text("ALTER TABLE auditoria_log ADD datos NVARCHAR(MAX)"))
             print("Tabla auditoria_log creada")
         else:
             print("La tabla auditoria_log ya existe")
+            self.verificar_indices_auditoria()
+
+    def indices_faltantes(self):
+        existentes = {indice['name'] for indice in inspect(self.engine).get_indexes('auditoria_log')}
+        return [indice for indice in AuditoriaLog.__table__.indexes
+                if indice.name not in existentes and not indice.dialect_options['mssql']['clustered']]
+
+    def verificar_indices_auditoria(self):
+        # Solo lee el catálogo; las tablas antiguas se migran aparte con 'flask auditoria_dml migrar'
+        clave = EngineRegistry.make_key(self.engine.url)
+        with _cache_lock:
+            if clave in _logs_verificados:
+                return
+        faltantes = self.indices_faltantes()
+        if faltantes:
+            print(f"A auditoria_log le faltan los índices {', '.join(indice.name for indice in faltantes)}: "
+                  f"ejecute 'flask auditoria_dml migrar'")
+        with _cache_lock:
+            _logs_verificados.add(clave)
+
+    def migrar_tabla_auditoria(self):
+        # Paso explícito: ALTER COLUMN reescribe la tabla y la bloquea mientras dura
+        faltantes = self.indices_faltantes()
+        if faltantes:
+            with self.engine.begin() as conn:
+                if self.engine.dialect.name == 'mssql':
+                    # Las tablas antiguas tienen columnas VARCHAR(MAX), que no pueden ser clave de un índice
+                    conn.execute(text("ALTER TABLE auditoria_log ALTER COLUMN tabla NVARCHAR(128) NULL"))
+                    conn.execute(text("ALTER TABLE auditoria_log ALTER COLUMN operacion VARCHAR(16) NULL"))
+                    conn.execute(text("ALTER TABLE auditoria_log ALTER COLUMN usuario NVARCHAR(128) NULL"))
+                for indice in faltantes:
+                    indice.create(conn)
+                    print(f"Índice {indice.name} creado en auditoria_log")
+        return [indice.name for indice in faltantes]
 
     def recrear_tabla_auditoria(self):
-        with self.engine.connect() as conn:
+        with self.engine.begin() as conn:
             conn.execute(text("DROP TABLE IF EXISTS auditoria_log"))
         Base.metadata.create_all(self.engine)
-        with self.engine.connect() as conn:
-            conn.execute(text("ALTER TABLE auditoria_log ADD datos NVARCHAR(MAX)"))
         print("Tabla auditoria_log recreada")
 
+    @staticmethod
+    def codificar_cursor(registro):
+        valor = json.dumps([registro['fecha_hora'].isoformat(), registro['id']])
+        return base64.urlsafe_b64encode(valor.encode('utf-8')).decode('ascii')
+
+    @staticmethod
+    def decodificar_cursor(cursor):
+        try:
+            posicion = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        except (AttributeError, ValueError):
+            raise ValueError("Cursor no válido")
+        # Un cursor bien codificado pero ajeno no debe llegar a la consulta como un error de tipos
+        if (not isinstance(posicion, list) or len(posicion) != 2 or not isinstance(posicion[0], str)
+                or not isinstance(posicion[1], int) or isinstance(posicion[1], bool)):
+            raise ValueError("Cursor no válido")
+        try:
+            return datetime.fromisoformat(posicion[0]), posicion[1]
+        except ValueError:
+            raise ValueError("Cursor no válido")
+
+    def consultar_log(self, tabla=None, operacion=None, usuario=None, desde=None, hasta=None,
+                      columnas=None, limite=100, cursor=None, incluir_archivo=False, decodificar=False):
+        log = AuditoriaLog.__table__
+        columnas = list(columnas or log.c.keys())
+        desconocidas = set(columnas) - set(log.c.keys())
+        if desconocidas:
+            raise ValueError(f"Columnas no válidas: {', '.join(sorted(desconocidas))}")
+        # fecha_hora e id siempre se leen: forman el cursor
+        seleccion = list(dict.fromkeys(columnas + ['fecha_hora', 'id', 'tabla', 'operacion', 'usuario']
+                                       + (['datos'] if decodificar else [])))
+        try:
+            limite = int(limite)
+        except (TypeError, ValueError):
+            raise ValueError("limite debe ser un número entero")
+        if not 1 <= limite <= LIMITE_MAXIMO_LOG:
+            raise ValueError(f"limite debe estar entre 1 y {LIMITE_MAXIMO_LOG}")
+        operacion = operacion.upper() if operacion else None
+        posicion = self.decodificar_cursor(cursor) if cursor else None
+
+        condiciones = []
+        if tabla:
+            condiciones.append(log.c.tabla == tabla)
+        if operacion:
+            condiciones.append(log.c.operacion == operacion)
+        if usuario:
+            condiciones.append(log.c.usuario == usuario)
+        if desde:
+            condiciones.append(log.c.fecha_hora >= desde)
+        if hasta:
+            condiciones.append(log.c.fecha_hora < hasta)
+        if posicion:
+            condiciones.append(or_(log.c.fecha_hora < posicion[0],
+                                   and_(log.c.fecha_hora == posicion[0], log.c.id < posicion[1])))
+
+        consulta = (select(*[log.c[nombre] for nombre in seleccion])
+                    .where(and_(*condiciones))
+                    .order_by(log.c.fecha_hora.desc(), log.c.id.desc())
+                    .limit(limite + 1))
+        with self.engine.connect() as conn:
+            filas = [dict(fila._mapping) for fila in conn.execute(consulta)]
+
+        if incluir_archivo:
+            # Los mismos filtros sobre los segmentos archivados, y mezcla ordenada con la tabla
+            def filtro(fila):
+                return ((not tabla or fila['tabla'] == tabla)
+                        and (not operacion or fila['operacion'] == operacion)
+                        and (not usuario or fila['usuario'] == usuario)
+                        and (not desde or fila['fecha_hora'] >= desde)
+                        and (not hasta or fila['fecha_hora'] < hasta)
+                        and (not posicion or (fila['fecha_hora'], fila['id']) < posicion))
+
+            archivadas = self.retencion().consultar(filtro, limite + 1, desde, hasta, tabla, posicion)
+            ids = {fila['id'] for fila in filas}
+            filas = sorted(filas + [fila for fila in archivadas if fila['id'] not in ids],
+                           key=lambda fila: (fila['fecha_hora'], fila['id']), reverse=True)[:limite + 1]
+
+        siguiente_cursor = self.codificar_cursor(filas[limite - 1]) if len(filas) > limite else None
+        registros = [{nombre: fila.get(nombre) for nombre in columnas} for fila in filas[:limite]]
+        if decodificar:
+            # Se decodifica con la fila completa: tabla y operación pueden no estar entre las columnas pedidas
+            claves = {}
+            for fila, registro in zip(filas, registros):
+                if fila.get('datos') is None or not fila.get('operacion'):
+                    continue
+                if fila['tabla'] not in claves:
+                    claves[fila['tabla']] = self.clave_primaria(fila['tabla'])
+                registro['cambios'] = self.decodificar_datos(fila['operacion'], fila['datos'], claves[fila['tabla']])
+        return {"registros": registros, "siguiente_cursor": siguiente_cursor}
+
+    def retencion(self, directorio=None, ventana='dia'):
+        return AuditRetention(self.engine, AuditoriaLog.__table__, directorio, ventana)
+
+    def archivar_log(self, antes_de, tamano_lote=5000, ventana='dia', directorio=None, max_lotes=None):
+        return self.retencion(directorio, ventana).archivar(antes_de, tamano_lote, max_lotes)
+
+    def nombre_destino(self, esquema, tabla):
+        # Un solo nombre por tabla para el log, los triggers y el asignador de ids: el esquema se conserva
+        # ('[ventas].[Order Details]' -> 'ventas.[Order Details]') salvo que sea el esquema por defecto
+        por_defecto = getattr(self.engine.dialect, 'default_schema_name', None)
+        if esquema and por_defecto and esquema.lower() == por_defecto.lower():
+            esquema = None
+        return nombre_calificado(esquema, tabla)
+
     def analizar_consulta(self, query):
-        insert_pattern = r"INSERT\s+INTO\s+(\w+)\s*\((.*?)\)\s*VALUES\s*\((.*?)\)"
-        update_pattern = r"UPDATE\s+(\w+)\s+SET\s+(.*?)\s*WHERE\s+(.*)"
-        delete_pattern = r"DELETE\s+FROM\s+(\w+)\s*WHERE\s+(.*)"
-
-        if re.match(insert_pattern, query, re.IGNORECASE):
-            match = re.match(insert_pattern, query, re.IGNORECASE)
-            return 'INSERT', match.group(1), dict(
-                zip(map(str.strip, match.group(2).split(',')), map(str.strip, match.group(3).split(','))))
-        elif re.match(update_pattern, query, re.IGNORECASE):
-            match = re.match(update_pattern, query, re.IGNORECASE)
-            return 'UPDATE', match.group(1), {item.split('=')[0].strip(): item.split('=')[1].strip() for item in
-                                              match.group(2).split(',')}
-        elif re.match(delete_pattern, query, re.IGNORECASE):
-            match = re.match(delete_pattern, query, re.IGNORECASE)
-            return 'DELETE', match.group(1), match.group(2)
-        else:
+        # INSERT: {columna: literal}, o una lista de ellos si la sentencia trae varias filas;
+        # UPDATE: {columna: valor asignado}; DELETE: el texto del WHERE
+        sentencia = analizar_sentencia(query)
+        if sentencia is None:
             return None, None, None
+        tabla = self.nombre_destino(sentencia.esquema, sentencia.tabla)
+        if sentencia.operacion == 'INSERT':
+            return 'INSERT', tabla, sentencia.filas[0] if len(sentencia.filas) == 1 else sentencia.filas
+        if sentencia.operacion == 'UPDATE':
+            return 'UPDATE', tabla, sentencia.valores
+        return 'DELETE', tabla, sentencia.donde
 
     def auditar_operacion(self, query):
         operacion, tabla, valores = self.analizar_consulta(query)
@@ -68,36 +239,31 @@ class AuditModel:
             return {"status": "error", "message": f"La tabla {tabla} no existe o no tiene columnas"}
 
         if operacion == 'INSERT':
-            columnas_query = set(valores.keys())
+            filas = valores if isinstance(valores, list) else [valores]
+            columnas_query = set(filas[0].keys())
             columnas_tabla = set(columnas_info.keys())
             columnas_faltantes = columnas_query - columnas_tabla
             if columnas_faltantes:
                 return {"status": "error",
                         "message": f"Las siguientes columnas no existen en la tabla: {', '.join(columnas_faltantes)}"}
 
-            if 'id' in columnas_tabla and 'id' not in valores:
-                siguiente_id = self.obtener_siguiente_id(tabla)
-                valores['id'] = str(siguiente_id)
+            if 'id' in columnas_tabla and 'id' not in columnas_query:
+                for fila, siguiente_id in zip(filas, self.asignador_ids.siguientes_ids(tabla, len(filas))):
+                    fila['id'] = str(siguiente_id)
 
-            # Reconstruir la consulta con el nuevo ID
-            columnas = ', '.join(valores.keys())
-            valores_str = ', '.join(f"'{v}'" if not v.isnumeric() else v for v in valores.values())
-            query = f"INSERT INTO {tabla} ({columnas}) VALUES ({valores_str})"
+            # Reconstruir la consulta con el nuevo ID; los valores ya son literales SQL
+            preparer = self.engine.dialect.identifier_preparer
+            columnas = ', '.join(preparer.quote(columna) for columna in filas[0].keys())
+            valores_str = ', '.join(f"({', '.join(fila.values())})" for fila in filas)
+            query = f"INSERT INTO {nombre_sql(tabla, preparer)} ({columnas}) VALUES {valores_str}"
 
-        self.crear_trigger_auditoria(tabla)
+        self.asegurar_trigger_auditoria(tabla)
 
         try:
-            with self.engine.connect() as conn:
+            with self.engine.begin() as conn:
                 conn.execute(text(query))
 
-            log_query = text(f"""
-            SELECT TOP 1 * FROM auditoria_log
-            WHERE tabla = :tabla AND operacion = :operacion
-            ORDER BY fecha_hora DESC
-            """)
-            with self.engine.connect() as conn:
-                result = conn.execute(log_query, {"tabla": tabla, "operacion": operacion})
-                log = result.fetchone()
+            registros = self.consultar_log(tabla=tabla, operacion=operacion, limite=1)["registros"]
 
             return {
                 "status": "success",
@@ -106,61 +272,439 @@ class AuditModel:
                 "tabla": tabla,
                 "valores": valores,
                 "query_ejecutada": query,
-                "log_auditoria": dict(log) if log else None
+                "log_auditoria": registros[0] if registros else None
             }
         except Exception as e:
             return {"status": "error", "message": f"Error al ejecutar la consulta: {str(e)}", "query_intentada": query}
 
+    @staticmethod
+    def convertir_literal(valor):
+        return convertir_literal(valor)
+
+    def normalizar_operaciones(self, consultas=None, filas=None):
+        operaciones = []
+        for query in consultas or []:
+            sentencia = analizar_sentencia(query)
+            if sentencia is None:
+                raise ValueError(f"Consulta no reconocida o no compatible con la auditoría: {query}")
+            operacion, tabla = sentencia.operacion, self.nombre_destino(sentencia.esquema, sentencia.tabla)
+            if not sentencia.parametrizable:
+                # Expresiones o WHERE libre: se ejecutan tal cual, pero en la misma transacción
+                operaciones.append({"operacion": operacion, "tabla": tabla, "sql": query})
+            elif operacion == 'INSERT':
+                # Un INSERT de varias filas se reparte en filas sueltas que se agrupan con las demás
+                operaciones.extend({"operacion": operacion, "tabla": tabla, "valores": valores}
+                                   for valores in sentencia.parametros())
+            else:
+                # WHERE por igualdad con literales: entra en el executemany como una fila de parámetros
+                valores, donde = sentencia.parametros()
+                operaciones.append({"operacion": operacion, "tabla": tabla, "valores": valores, "donde": donde})
+        for fila in filas or []:
+            operacion = fila.get("operacion", "").upper()
+            if operacion not in ('INSERT', 'UPDATE', 'DELETE') or not fila.get("tabla"):
+                raise ValueError(f"Fila de parámetros no válida: {fila}")
+            if operacion != 'INSERT' and not fila.get("donde"):
+                raise ValueError(f"Las filas {operacion} requieren 'donde' con la clave de la fila")
+            operaciones.append({"operacion": operacion, "tabla": self.nombre_destino(*dividir_nombre(fila["tabla"])),
+                                "valores": dict(fila.get("valores") or {}), "donde": dict(fila.get("donde") or {})})
+        return operaciones
+
+    def agrupar_operaciones(self, operaciones):
+        # Solo se agrupan operaciones consecutivas de la misma forma, para respetar el orden del lote
+        grupos = []
+        for operacion in operaciones:
+            if "sql" in operacion:
+                # El SQL sin parámetros no se agrupa: dos copias de un UPDATE no idempotente son dos cambios
+                grupos.append(((operacion["tabla"], operacion["operacion"], ("sql", operacion["sql"])), [operacion]))
+                continue
+            forma = (tuple(sorted(operacion["valores"])), tuple(sorted(operacion.get("donde") or ())))
+            clave = (operacion["tabla"], operacion["operacion"], forma)
+            if grupos and grupos[-1][0] == clave:
+                grupos[-1][1].append(operacion)
+            else:
+                grupos.append((clave, [operacion]))
+        return grupos
+
+    def construir_sentencia(self, tabla, operacion, forma):
+        if forma[0] == "sql":
+            return text(forma[1])
+        columnas_valores, columnas_donde = forma
+        esquema, nombre = dividir_nombre(tabla)
+        destino = table(nombre, *[column(c) for c in set(columnas_valores) | set(columnas_donde)], schema=esquema)
+        condicion = and_(*[destino.c[c] == bindparam(f"w_{c}") for c in columnas_donde])
+        if operacion == 'INSERT':
+            return insert(destino)
+        if operacion == 'UPDATE':
+            return update(destino).where(condicion).values({c: bindparam(f"v_{c}") for c in columnas_valores})
+        return delete(destino).where(condicion)
+
+    @staticmethod
+    def parametros(operacion):
+        if "sql" in operacion:
+            return {}
+        if operacion["operacion"] == 'INSERT':
+            return operacion["valores"]
+        parametros = {f"v_{c}": v for c, v in operacion["valores"].items()}
+        parametros.update({f"w_{c}": v for c, v in operacion["donde"].items()})
+        return parametros
+
+    def auditar_lote(self, consultas=None, filas=None, tamano_commit=1000):
+        try:
+            operaciones = self.normalizar_operaciones(consultas, filas)
+        except ValueError as e:
+            return {"status": "error", "message": str(e)}
+
+        estructuras = {}
+        for tabla in {operacion["tabla"] for operacion in operaciones}:
+            estructuras[tabla] = self.verificar_estructura_tabla(tabla)
+            if not estructuras[tabla]:
+                return {"status": "error", "message": f"La tabla {tabla} no existe o no tiene columnas"}
+
+        sin_id = {}
+        for operacion in operaciones:
+            if operacion["operacion"] != 'INSERT' or "sql" in operacion:
+                continue
+            tabla, valores = operacion["tabla"], operacion["valores"]
+            columnas_faltantes = set(valores) - set(estructuras[tabla])
+            if columnas_faltantes:
+                return {"status": "error",
+                        "message": f"Las siguientes columnas no existen en la tabla {tabla}: {', '.join(columnas_faltantes)}"}
+            if 'id' in estructuras[tabla] and 'id' not in valores:
+                sin_id.setdefault(tabla, []).append(valores)
+
+        # Un solo rango de ids por tabla para todo el lote
+        for tabla, filas_sin_id in sin_id.items():
+            for valores, nuevo_id in zip(filas_sin_id, self.asignador_ids.siguientes_ids(tabla, len(filas_sin_id))):
+                valores['id'] = nuevo_id
+
+        for tabla in estructuras:
+            self.asegurar_trigger_auditoria(tabla)
+
+        lotes = []
+        confirmados = 0
+        pendientes = 0
+        with self.engine.connect() as conn:
+            # Los registros de auditoria_log no se atribuyen a cada lote: otras sesiones escriben en la misma
+            # ventana y los IDENTITY no llegan en orden, así que solo se informa lo que devuelve el motor
+            def confirmar():
+                nonlocal confirmados, pendientes
+                conn.commit()
+                confirmados = len(lotes)
+                pendientes = 0
+
+            try:
+                for (tabla, operacion, forma), grupo in self.agrupar_operaciones(operaciones):
+                    sentencia = self.construir_sentencia(tabla, operacion, forma)
+                    for inicio in range(0, len(grupo), tamano_commit):
+                        parte = grupo[inicio:inicio + tamano_commit]
+                        if forma[0] == "sql":
+                            afectadas = sum(conn.execute(text(o["sql"])).rowcount for o in parte)
+                        else:
+                            afectadas = conn.execute(sentencia, [self.parametros(o) for o in parte]).rowcount
+                        lotes.append({"lote": len(lotes) + 1, "tabla": tabla, "operacion": operacion,
+                                      "filas": len(parte), "filas_afectadas": afectadas})
+                        pendientes += len(parte)
+                        if pendientes >= tamano_commit:
+                            confirmar()
+                if pendientes:
+                    confirmar()
+            except Exception as e:
+                conn.rollback()
+                return {"status": "error", "message": f"Error al ejecutar el lote: {str(e)}",
+                        "lotes_confirmados": lotes[:confirmados]}
+
+        return {
+            "status": "success",
+            "message": f"Se ejecutaron {len(operaciones)} operaciones en {len(lotes)} lotes",
+            "total_operaciones": len(operaciones),
+            "lotes": lotes,
+        }
+
     def verificar_estructura_tabla(self, tabla):
-        inspector = inspect(self.engine)
-        columns = inspector.get_columns(tabla)
+        esquema, nombre = dividir_nombre(tabla)
+        try:
+            columns = inspect(self.engine).get_columns(nombre, schema=esquema)
+        except NoSuchTableError:
+            return None
         if not columns:
             return None
         return {col['name']: col['type'] for col in columns}
 
     def obtener_siguiente_id(self, tabla):
-        query = text(f"SELECT ISNULL(MAX(id), 0) + 1 as next_id FROM {tabla}")
-        with self.engine.connect() as conn:
-            result = conn.execute(query)
-            next_id = result.fetchone()
-        return next_id[0] if next_id else 1
+        return self.asignador_ids.siguiente_id(tabla)
 
-    def crear_trigger_auditoria(self, tabla):
+    def nombre_trigger(self, tabla, tipo):
+        # Identificador saneado: los espacios o corchetes del nombre de la tabla no llegan al del trigger
+        _, nombre = dividir_nombre(tabla)
+        base = re.sub(r'\W+', '_', nombre).strip('_') or 'tabla'
+        if base != nombre:
+            # Dos nombres que se sanean igual no comparten trigger
+            base = f"{base}_{hashlib.sha1(nombre.encode('utf-8')).hexdigest()[:8]}"
+        return f"tr_{base}_{tipo}"
+
+    def encabezado_trigger(self, tabla, tipo):
+        # El trigger vive en el esquema de su tabla; CREATE TRIGGER solo admite esquema.nombre
+        preparer = self.engine.dialect.identifier_preparer
+        esquema, _ = dividir_nombre(tabla)
+        trigger = preparer.quote(self.nombre_trigger(tabla, tipo))
+        if esquema:
+            trigger = f"{preparer.quote(esquema.split('.')[-1])}.{trigger}"
+        return f"CREATE OR ALTER TRIGGER {trigger} ON {nombre_sql(tabla, preparer)}"
+
+    def definiciones_trigger(self, tabla):
+        literal = "N'" + tabla.replace("'", "''") + "'"
         triggers = {
             'insert': f"""
-            CREATE TRIGGER tr_{tabla}_insert ON {tabla}
+            {self.encabezado_trigger(tabla, 'insert')}
             AFTER INSERT
             AS
             BEGIN
                 INSERT INTO auditoria_log (tabla, operacion, usuario, fecha_hora, datos)
-                SELECT '{tabla}', 'INSERT', SYSTEM_USER, GETDATE(), (SELECT * FROM inserted FOR JSON PATH)
+                SELECT {literal}, 'INSERT', SYSTEM_USER, GETDATE(), (SELECT * FROM inserted FOR JSON PATH)
             END
             """,
             'update': f"""
-            CREATE TRIGGER tr_{tabla}_update ON {tabla}
+            {self.encabezado_trigger(tabla, 'update')}
             AFTER UPDATE
             AS
             BEGIN
                 INSERT INTO auditoria_log (tabla, operacion, usuario, fecha_hora, datos)
-                SELECT '{tabla}', 'UPDATE', SYSTEM_USER, GETDATE(), 
+                SELECT {literal}, 'UPDATE', SYSTEM_USER, GETDATE(), 
                        (SELECT * FROM deleted FOR JSON PATH) + ' -> ' + (SELECT * FROM inserted FOR JSON PATH)
             END
             """,
             'delete': f"""
-            CREATE TRIGGER tr_{tabla}_delete ON {tabla}
+            {self.encabezado_trigger(tabla, 'delete')}
             AFTER DELETE
             AS
             BEGIN
                 INSERT INTO auditoria_log (tabla, operacion, usuario, fecha_hora, datos)
-                SELECT '{tabla}', 'DELETE', SYSTEM_USER, GETDATE(), (SELECT * FROM deleted FOR JSON PATH)
+                SELECT {literal}, 'DELETE', SYSTEM_USER, GETDATE(), (SELECT * FROM deleted FOR JSON PATH)
             END
             """
         }
+        if getattr(self, 'modo_trigger', 'completo') == 'diferencial':
+            trigger_diferencial = self.definicion_trigger_diferencial(tabla, triggers['update'])
+            if trigger_diferencial:
+                triggers['update'] = trigger_diferencial
+
+        # La huella del cuerpo queda dentro del trigger para detectar versiones desactualizadas
+        versionados = {}
+        for trigger_type, trigger_sql in triggers.items():
+            huella = hashlib.sha1(f"{TRIGGER_VERSION}:{trigger_sql}".encode('utf-8')).hexdigest()
+            versionados[trigger_type] = (huella, f"{trigger_sql.rstrip()}\n            -- auditoria:{huella}\n")
+        return versionados
+
+    def definicion_trigger_diferencial(self, tabla, trigger_completo):
+        tabla_info = self.info_tabla(tabla)
+        if tabla_info is None or not tabla_info.primary_key:
+            return None
+        clave = list(tabla_info.primary_key)
+        columnas = [c.name for c in tabla_info.columns
+                    if c.name not in clave and c.type not in TIPOS_SIN_DIFERENCIA]
+        omitidas = [c.name for c in tabla_info.columns if c.name not in clave and c.type in TIPOS_SIN_DIFERENCIA]
+        if not columnas:
+            return None
+
+        def q(nombre):
+            return '[' + nombre.replace(']', ']]') + ']'
+
+        def n(nombre):
+            return "N'" + nombre.replace("'", "''") + "'"
+
+        literal = n(tabla)
+
+        def cambio(columna):
+            return f"NOT EXISTS (SELECT i.{q(columna)} INTERSECT SELECT d.{q(columna)})"
 
+        # Si cambia la PK no se puede emparejar inserted con deleted: se guarda el formato completo
+        cuerpo_completo = trigger_completo[trigger_completo.index('INSERT INTO'):trigger_completo.rindex('END')].strip()
+        pk_actualizada = ' OR '.join(f"UPDATE({q(c)})" for c in clave)
+        # Alias por ordinal: FOR JSON PATH anidaría los nombres de columna que contienen un punto
+        claves_json = ', '.join(f"{n(c)} AS [k.{i}.n], i.{q(c)} AS [k.{i}.v]" for i, c in enumerate(clave))
+        cambios_json = ',\n                           '.join(
+            f"CASE WHEN {cambio(c)} THEN {n(c)} END AS [c.{i}.n], "
+            f"CASE WHEN {cambio(c)} THEN d.{q(c)} END AS [c.{i}.a], "
+            f"CASE WHEN {cambio(c)} THEN i.{q(c)} END AS [c.{i}.d]"
+            for i, c in enumerate(columnas))
+        if omitidas:
+            # Columnas que no se pueden comparar: quedan fuera de la diferencia, pero se deja constancia
+            cambios_json += f",\n                           JSON_QUERY({n(json.dumps(omitidas))}) AS [omitidas]"
+        union = ' AND '.join(f"i.{q(c)} = d.{q(c)}" for c in clave)
+        alguno = (f"NOT EXISTS (SELECT {', '.join('i.' + q(c) for c in columnas)} "
+                  f"INTERSECT SELECT {', '.join('d.' + q(c) for c in columnas)})")
+        if omitidas:
+            # Un UPDATE que solo asigna columnas omitidas se registra igual, con la clave y la lista
+            alguno = ' OR '.join([alguno] + [f"UPDATE({q(c)})" for c in omitidas])
+        return f"""
+            {self.encabezado_trigger(tabla, 'update')}
+            AFTER UPDATE
+            AS
+            BEGIN
+                SET NOCOUNT ON;
+                IF {pk_actualizada}
+                BEGIN
+                    {cuerpo_completo}
+                    RETURN;
+                END
+                INSERT INTO auditoria_log (tabla, operacion, usuario, fecha_hora, datos)
+                SELECT {literal}, 'UPDATE', SYSTEM_USER, GETDATE(),
+                       (SELECT {claves_json},
+                           {cambios_json}
+                        FOR JSON PATH, WITHOUT_ARRAY_WRAPPER)
+                FROM inserted i
+                JOIN deleted d ON {union}
+                WHERE {alguno}
+            END
+            """
+
+    @staticmethod
+    def decodificar_datos(operacion, datos, clave=None):
+        if not datos:
+            return []
+        if datos.lstrip().startswith('{'):
+            # Formato diferencial: {"k": {i: {"n", "v"}}, "c": {i: {"n", "a", "d"}}, "omitidas": [...]};
+            # los registros anteriores indexaban por nombre de columna: {"k": {pk}, "c": {columna: {"a", "d"}}}
+            registro = json.loads(datos)
+            clave_registro = {}
+            for columna, valor in registro.get('k', {}).items():
+                if isinstance(valor, dict) and 'n' in valor:
+                    columna, valor = valor['n'], valor.get('v')
+                clave_registro[columna] = valor
+            cambios = {valores.get('n', columna): valores for columna, valores in registro.get('c', {}).items()}
+            resultado = {
+                "clave": clave_registro,
+                "antes": {columna: valores.get('a') for columna, valores in cambios.items()},
+                "despues": {columna: valores.get('d') for columna, valores in cambios.items()},
+            }
+            if 'omitidas' in registro:
+                resultado["omitidas"] = registro['omitidas']
+            return [resultado]
+
+        decoder = json.JSONDecoder()
+        if operacion == 'UPDATE':
+            antes, fin = decoder.raw_decode(datos.lstrip())
+            resto = datos.lstrip()[fin:].lstrip()
+            despues = decoder.raw_decode(resto[2:].lstrip())[0] if resto.startswith('->') else []
+        elif operacion == 'INSERT':
+            antes, despues = [], json.loads(datos)
+        else:
+            antes, despues = json.loads(datos), []
+
+        if operacion == 'UPDATE' and not clave and max(len(antes), len(despues)) > 1:
+            # Sin PK no hay forma fiable de emparejar deleted e inserted: SQL Server no garantiza su orden
+            return [{"clave": None, "antes": antes, "despues": despues}]
+
+        def clave_de(fila, posicion):
+            return {c: fila.get(c) for c in clave} if clave else {"posicion": posicion}
+
+        registros = {}
+        for posicion, fila in enumerate(antes):
+            k = clave_de(fila, posicion)
+            registros.setdefault(json.dumps(k, sort_keys=True, default=str), {"clave": k, "antes": None, "despues": None})["antes"] = fila
+        for posicion, fila in enumerate(despues):
+            k = clave_de(fila, posicion)
+            registros.setdefault(json.dumps(k, sort_keys=True, default=str), {"clave": k, "antes": None, "despues": None})["despues"] = fila
+        return list(registros.values())
+
+    def info_tabla(self, tabla):
+        if not tabla:
+            return None
+        esquema, nombre = dividir_nombre(tabla)
+        # El snapshot solo cubre el esquema por defecto de la conexión
+        por_defecto = getattr(self.engine.dialect, 'default_schema_name', None)
+        if esquema and por_defecto and esquema.split('.')[-1].lower() != por_defecto.lower():
+            return None
+        nombre = nombre.lower()
+        for table_info in get_schema_snapshot(self.engine).tables.values():
+            if table_info.name.lower() == nombre:
+                return table_info
+        return None
+
+    def clave_primaria(self, tabla):
+        # PK de la tabla auditada según el snapshot; None si la tabla ya no existe o no tiene PK
+        table_info = self.info_tabla(tabla)
+        if table_info is None:
+            return None
+        return tuple(table_info.primary_key) or None
+
+    def _clave_cache(self, tabla):
+        modo = getattr(self, 'modo_trigger', 'completo')
+        # El trigger diferencial enumera columnas: basta la firma de la propia tabla, así el DDL de otras
+        # tablas (o los triggers recién instalados) no obliga a revisar todos los triggers
+        firma = None
+        if modo == 'diferencial':
+            table_info = self.info_tabla(tabla)
+            if table_info is not None:
+                firma = hashlib.sha1(repr(table_info.signature()).encode('utf-8')).hexdigest()
+        return EngineRegistry.make_key(self.engine.url), tabla.lower(), TRIGGER_VERSION, modo, firma
+
+    def crear_trigger_auditoria(self, tabla):
+        return self.instrumentar_tablas([tabla], forzar=True)[tabla]
+
+    def asegurar_trigger_auditoria(self, tabla):
+        clave = self._clave_cache(tabla)
+        with _cache_lock:
+            instrumentada = clave in _tablas_instrumentadas
+            if instrumentada:
+                _tablas_instrumentadas.move_to_end(clave)
+        if instrumentada:
+            return "sin cambios"
+        return self.instrumentar_tablas([tabla])[tabla]
+
+    def obtener_huellas_trigger(self, tablas):
+        # Trigger identificado por esquema y nombre: dos tablas homónimas en esquemas distintos no se confunden
+        nombres = {}
+        for tabla in tablas:
+            esquema, _ = dividir_nombre(tabla)
+            for tipo in ('insert', 'update', 'delete'):
+                esquema_trigger = esquema.split('.')[-1].lower() if esquema else None
+                nombres[(esquema_trigger, self.nombre_trigger(tabla, tipo).lower())] = (tabla, tipo)
+        huellas = {}
         with self.engine.connect() as conn:
-            for trigger_type, trigger_sql in triggers.items():
+            result = conn.execute(text("""
+            SELECT OBJECT_SCHEMA_NAME(t.object_id), SCHEMA_NAME(), t.name, m.definition
+            FROM sys.triggers t
+            JOIN sys.sql_modules m ON m.object_id = t.object_id
+            WHERE t.parent_class = 1 AND t.name LIKE 'tr[_]%'
+            """))
+            for esquema, por_defecto, nombre, definicion in result:
+                clave = nombres.get((esquema.lower(), nombre.lower()))
+                if clave is None and esquema.lower() == por_defecto.lower():
+                    clave = nombres.get((None, nombre.lower()))
+                if clave:
+                    marca = definicion.rfind('-- auditoria:')
+                    huellas[clave] = definicion[marca + 13:].strip() if marca >= 0 else None
+        return huellas
+
+    def instrumentar_tablas(self, tablas, forzar=False):
+        definiciones = {tabla: self.definiciones_trigger(tabla) for tabla in tablas}
+        huellas = {} if forzar else self.obtener_huellas_trigger(tablas)
+        resultado = {}
+
+        for tabla, triggers in definiciones.items():
+            estado = "sin cambios"
+            for trigger_type, (huella, trigger_sql) in triggers.items():
+                actual = huellas.get((tabla, trigger_type), False)
+                if actual == huella:
+                    continue
                 try:
-                    conn.execute(text(f"DROP TRIGGER IF EXISTS tr_{tabla}_{trigger_type}"))
-                    conn.execute(text(trigger_sql))
+                    # Una transacción por trigger: un CREATE fallido no deja la conexión a medias para el resto
+                    with self.engine.begin() as conn:
+                        conn.execute(text(trigger_sql))
                 except Exception as e:
                     print(f"Error al crear trigger {trigger_type} para {tabla}: {str(e)}")
+                    # Se abandona la tabla al primer error: queda en 'error', fuera de la caché, y se reintenta
+                    estado = "error"
+                    break
+                estado = "instalado" if actual is False else "actualizado"
+            resultado[tabla] = estado
+
+        claves = [self._clave_cache(tabla) for tabla, estado in resultado.items() if estado != "error"]
+        with _cache_lock:
+            for clave in claves:
+                _tablas_instrumentadas[clave] = True
+                _tablas_instrumentadas.move_to_end(clave)
+            while len(_tablas_instrumentadas) > MAX_TABLAS_INSTRUMENTADAS:
+                _tablas_instrumentadas.popitem(last=False)
+        return resultado
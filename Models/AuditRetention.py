@@ -0,0 +1,153 @@
+import gzip
+import hashlib
+import heapq
+import json
+import os
+import re
+import threading
+from datetime import datetime
+
+from sqlalchemy import delete, select
+
+VENTANAS = {
+    'hora': '%Y%m%d%H',
+    'dia': '%Y%m%d',
+    'mes': '%Y%m',
+}
+
+INDICE = 'indice.json'
+
+_indice_lock = threading.Lock()
+
+
+def _sanear(nombre):
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', str(nombre or '')).strip('._') or 'local'
+
+
+def identificador_base(url):
+    # Servidor y base legibles más un hash: dos bases con ids solapados nunca comparten archivos
+    huella = hashlib.sha256(repr((url.drivername, url.host, url.port, url.database)).encode('utf-8')).hexdigest()
+    return f"{_sanear(url.host)}_{_sanear(os.path.basename(url.database or ''))}_{huella[:8]}"
+
+
+def _serializar(valor):
+    return valor.isoformat() if isinstance(valor, datetime) else valor
+
+
+class AuditRetention:
+    def __init__(self, engine, tabla_log, directorio=None, ventana='dia'):
+        if ventana not in VENTANAS:
+            raise ValueError(f"Ventana no válida, use una de: {', '.join(VENTANAS)}")
+        self.engine = engine
+        self.log = tabla_log
+        raiz = directorio or os.environ.get('AUDITORIA_ARCHIVO_DIR', 'archivo_auditoria')
+        # Un subdirectorio y un índice por base de datos
+        self.base = identificador_base(engine.url)
+        self.directorio = os.path.join(raiz, self.base)
+        self.ventana = ventana
+
+    def _ruta(self, nombre):
+        return os.path.join(self.directorio, nombre)
+
+    def leer_indice(self):
+        try:
+            with open(self._ruta(INDICE), encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+
+    def _guardar_indice(self, indice):
+        temporal = self._ruta(INDICE + '.tmp')
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump(indice, f, ensure_ascii=False, indent=1)
+        os.replace(temporal, self._ruta(INDICE))
+
+    def _escribir_segmento(self, ventana, filas):
+        nombre = f"auditoria_{self.base}_{ventana}_{filas[0]['id']}-{filas[-1]['id']}.ndjson.gz"
+        temporal = self._ruta(nombre + '.tmp')
+        with gzip.open(temporal, 'wt', encoding='utf-8') as f:
+            for fila in filas:
+                f.write(json.dumps({k: _serializar(v) for k, v in fila.items()}, ensure_ascii=False) + '\n')
+        os.replace(temporal, self._ruta(nombre))
+        return {
+            "archivo": nombre,
+            "ventana": ventana,
+            "desde": min(fila['fecha_hora'] for fila in filas).isoformat(),
+            "hasta": max(fila['fecha_hora'] for fila in filas).isoformat(),
+            "id_min": min(fila['id'] for fila in filas),
+            "id_max": max(fila['id'] for fila in filas),
+            "filas": len(filas),
+            "tablas": sorted({fila['tabla'] for fila in filas if fila['tabla']}),
+        }
+
+    def archivar(self, antes_de, tamano_lote=5000, max_lotes=None):
+        os.makedirs(self.directorio, exist_ok=True)
+        log = self.log
+        formato = VENTANAS[self.ventana]
+        resumen = {"lotes": 0, "filas": 0, "segmentos": []}
+
+        while max_lotes is None or resumen["lotes"] < max_lotes:
+            with self.engine.begin() as conn:
+                filas = [dict(fila._mapping) for fila in conn.execute(
+                    select(log).where(log.c.fecha_hora < antes_de)
+                    .order_by(log.c.fecha_hora, log.c.id)
+                    .limit(tamano_lote))]
+                if not filas:
+                    break
+
+                por_ventana = {}
+                for fila in filas:
+                    por_ventana.setdefault(fila['fecha_hora'].strftime(formato), []).append(fila)
+                # Los segmentos se escriben antes de borrar: si algo falla, la transacción no elimina nada
+                segmentos = [self._escribir_segmento(ventana, grupo) for ventana, grupo in por_ventana.items()]
+
+                ids = [fila['id'] for fila in filas]
+                for inicio in range(0, len(ids), 1000):
+                    conn.execute(delete(log).where(log.c.id.in_(ids[inicio:inicio + 1000])))
+
+                with _indice_lock:
+                    self._guardar_indice(self.leer_indice() + segmentos)
+
+            resumen["lotes"] += 1
+            resumen["filas"] += len(filas)
+            resumen["segmentos"].extend(segmento["archivo"] for segmento in segmentos)
+            print(f"Archivadas {len(filas)} filas de auditoria_log en {len(segmentos)} segmentos")
+
+        return resumen
+
+    def leer_segmento(self, nombre):
+        with gzip.open(self._ruta(nombre), 'rt', encoding='utf-8') as f:
+            for linea in f:
+                fila = json.loads(linea)
+                if fila.get('fecha_hora'):
+                    fila['fecha_hora'] = datetime.fromisoformat(fila['fecha_hora'])
+                yield fila
+
+    def consultar(self, filtro, limite, desde=None, hasta=None, tabla=None, cursor=None):
+        # Devuelve hasta `limite` filas archivadas ordenadas por (fecha_hora, id) descendente
+        segmentos = []
+        for segmento in self.leer_indice():
+            inicio, fin = datetime.fromisoformat(segmento['desde']), datetime.fromisoformat(segmento['hasta'])
+            if desde and fin < desde or hasta and inicio >= hasta or cursor and inicio > cursor[0]:
+                continue
+            if tabla and tabla not in segmento['tablas']:
+                continue
+            segmentos.append((fin, segmento['archivo'], inicio))
+        segmentos.sort(reverse=True)
+
+        mejores = []
+        vistos = set()
+        for fin, archivo, inicio in segmentos:
+            # Si ya tenemos `limite` filas más recientes que todo este segmento, no hace falta leerlo
+            if len(mejores) >= limite and mejores[0][0] > (fin, float('inf')):
+                break
+            for fila in self.leer_segmento(archivo):
+                if fila['id'] in vistos or not filtro(fila):
+                    continue
+                vistos.add(fila['id'])
+                clave = (fila['fecha_hora'], fila['id'])
+                if len(mejores) < limite:
+                    heapq.heappush(mejores, (clave, fila))
+                elif clave > mejores[0][0]:
+                    heapq.heapreplace(mejores, (clave, fila))
+        return [fila for _, fila in sorted(mejores, key=lambda item: item[0], reverse=True)]
@@ -0,0 +1,437 @@
+import functools
+import operator
+import os
+import re
+
+NUMERO = r"0[xX][0-9a-fA-F]*|(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?"
+
+# Un solo patrón compilado: cada match es un token y `lastgroup` dice de qué tipo es
+TOKEN = re.compile(rf"""
+    (?P<espacio>\s+|--[^\n]*|/\*.*?\*/)
+  | (?P<cadena>[Nn]?'(?:[^']|'')*')
+  | (?P<numero>{NUMERO})
+  | (?P<parametro>[:@]\w+|\?)
+  | (?P<identificador>\[(?:[^\]]|\]\])+\]|"(?:[^"]|"")+"|(?:[^\W\d]|\#)[\w@#$]*)
+  | (?P<operador><>|!=|<=|>=|[=<>(),.;*+\-/%])
+  | (?P<otro>.)
+""", re.VERBOSE | re.DOTALL)
+
+# Literales sueltos: LITERAL.split separa en una pasada la forma de la sentencia y sus literales
+# (la anticipación deja al motor saltar hasta el primer carácter posible antes de mirar hacia atrás)
+LITERAL = re.compile(rf"(?=[Nn'\d.])(?<![\w@#$.])([Nn]?'[^']*(?:''[^']*)*'|{NUMERO})")
+MARCA = '\x00'
+RELLENO = ' 0 '
+
+LITERALES = ('cadena', 'numero')
+
+MAX_PLANTILLAS = int(os.environ.get('AUDITORIA_CACHE_PLANTILLAS', 1024))
+
+
+class ConsultaNoSoportada(ValueError):
+    pass
+
+
+def tokenizar(query):
+    # forma: (tipo, texto) por token, con los literales reducidos a (tipo, None) para que sentencias
+    # de la misma estructura compartan plantilla; posiciones: (inicio, fin) de cada token en la consulta
+    forma, posiciones = [], []
+    for match in TOKEN.finditer(query):
+        tipo = match.lastgroup
+        if tipo == 'espacio':
+            continue
+        if tipo == 'otro':
+            raise ConsultaNoSoportada(f"Carácter no reconocido en la posición {match.start()}")
+        texto = match.group()
+        if tipo == 'identificador' and texto.upper() == 'NULL':
+            tipo = 'nulo'
+        forma.append((tipo, None if tipo in LITERALES else texto))
+        posiciones.append(match.span())
+    return tuple(forma), posiciones
+
+
+def nombre_identificador(texto):
+    if texto[0] == '[':
+        return texto[1:-1].replace(']]', ']')
+    if texto[0] == '"':
+        return texto[1:-1].replace('""', '"')
+    return texto
+
+
+PARTE_NOMBRE = re.compile(r'\[((?:[^\]]|\]\])*)\]|([^.\[\]]+)')
+NOMBRE_SIMPLE = re.compile(r'(?:[^\W\d]|\#)[\w@#$]*')
+
+
+def nombre_calificado(esquema, tabla):
+    # Forma canónica de un destino: corchetes solo en las partes que los necesitan, separable sin ambigüedad
+    partes = (esquema.split('.') if esquema else []) + [tabla]
+    return '.'.join(parte if NOMBRE_SIMPLE.fullmatch(parte) else '[' + parte.replace(']', ']]') + ']'
+                    for parte in partes)
+
+
+def dividir_nombre(nombre):
+    partes, pos = [], 0
+    while True:
+        match = PARTE_NOMBRE.match(nombre, pos)
+        if match is None or (match.group(2) is not None and not match.group(2).strip()):
+            raise ConsultaNoSoportada(f"Nombre de tabla no válido: {nombre}")
+        partes.append(match.group(1).replace(']]', ']') if match.group(1) is not None else match.group(2).strip())
+        pos = match.end()
+        if pos == len(nombre):
+            return ('.'.join(partes[:-1]) or None), partes[-1]
+        if nombre[pos] != '.':
+            raise ConsultaNoSoportada(f"Nombre de tabla no válido: {nombre}")
+        pos += 1
+
+
+def nombre_sql(nombre, preparer):
+    # Cada parte citada con las reglas del dialecto: el nombre nunca se interpola tal cual
+    esquema, tabla = dividir_nombre(nombre)
+    return '.'.join(preparer.quote(parte) for parte in (esquema.split('.') if esquema else []) + [tabla])
+
+
+def convertir_literal(valor):
+    valor = valor.strip()
+    if valor.upper() == 'NULL':
+        return None
+    if valor[:2].upper() == "N'" and valor.endswith("'"):
+        valor = valor[1:]
+    if len(valor) >= 2 and valor.startswith("'") and valor.endswith("'"):
+        return valor[1:-1].replace("''", "'")
+    try:
+        return int(valor)
+    except ValueError:
+        pass
+    try:
+        return float(valor)
+    except ValueError:
+        return valor
+
+
+class Plantilla:
+    __slots__ = ('operacion', 'esquema', 'tabla', 'columnas', 'filas', 'asignaciones', 'inicio_donde', 'claves')
+
+    def __init__(self, operacion, esquema, tabla, columnas=(), filas=(), asignaciones=(), inicio_donde=None,
+                 claves=None):
+        self.operacion = operacion
+        self.esquema = esquema
+        self.tabla = tabla
+        self.columnas = columnas
+        # Cada valor es un hueco (primer token, último token + 1, es_literal)
+        self.filas = filas
+        self.asignaciones = asignaciones
+        self.inicio_donde = inicio_donde
+        # Condición 'col = literal [AND ...]': permite ejecutar la sentencia con parámetros
+        self.claves = claves
+
+
+class Analizador:
+    def __init__(self, forma):
+        self.forma = forma
+        self.pos = 0
+
+    def fin(self):
+        # Fin de la sentencia, admitiendo un ';' final
+        restantes = len(self.forma) - self.pos
+        return restantes <= 0 or (restantes == 1 and self.forma[self.pos] == ('operador', ';'))
+
+    def actual(self):
+        return self.forma[self.pos] if self.pos < len(self.forma) else (None, None)
+
+    def es_palabra(self, palabra):
+        tipo, texto = self.actual()
+        return tipo == 'identificador' and texto.upper() == palabra
+
+    def palabra(self, palabra, opcional=False):
+        if self.es_palabra(palabra):
+            self.pos += 1
+            return True
+        if opcional:
+            return False
+        raise ConsultaNoSoportada(f"Se esperaba {palabra}")
+
+    def operador(self, simbolo, opcional=False):
+        if self.actual() == ('operador', simbolo):
+            self.pos += 1
+            return True
+        if opcional:
+            return False
+        raise ConsultaNoSoportada(f"Se esperaba '{simbolo}'")
+
+    def identificador(self):
+        tipo, texto = self.actual()
+        if tipo != 'identificador':
+            raise ConsultaNoSoportada("Se esperaba un identificador")
+        self.pos += 1
+        return nombre_identificador(texto)
+
+    def nombre_tabla(self):
+        partes = [self.identificador()]
+        while self.operador('.', opcional=True):
+            partes.append(self.identificador())
+        return ('.'.join(partes[:-1]) or None), partes[-1]
+
+    def valor(self):
+        # Literal (con signo opcional) o expresión balanceada hasta ',' o ')' del mismo nivel
+        inicio = self.pos
+        if self.actual() in (('operador', '-'), ('operador', '+')) and \
+                self.pos + 1 < len(self.forma) and self.forma[self.pos + 1][0] == 'numero':
+            self.pos += 1
+        if self.actual()[0] in LITERALES + ('nulo',):
+            self.pos += 1
+            if self.actual() in (('operador', ','), ('operador', ')')) or self.fin() or \
+                    self.es_palabra('WHERE') or self.es_palabra('AND'):
+                return inicio, self.pos, True
+        self.pos = inicio
+        profundidad = 0
+        while self.pos < len(self.forma):
+            tipo, texto = self.forma[self.pos]
+            if tipo == 'operador' and texto in (',', ')', ';') and profundidad == 0:
+                break
+            if tipo == 'identificador' and texto.upper() == 'WHERE' and profundidad == 0:
+                break
+            if texto == '(':
+                profundidad += 1
+            elif texto == ')':
+                profundidad -= 1
+            self.pos += 1
+        if self.pos == inicio or profundidad:
+            raise ConsultaNoSoportada("Valor vacío o paréntesis sin cerrar")
+        return inicio, self.pos, False
+
+    def lista(self, elemento):
+        self.operador('(')
+        elementos = [elemento()]
+        while self.operador(',', opcional=True):
+            elementos.append(elemento())
+        self.operador(')')
+        return elementos
+
+    def donde(self):
+        self.palabra('WHERE')
+        inicio = self.pos
+        if self.fin():
+            raise ConsultaNoSoportada("WHERE sin condición")
+        claves = []
+        while claves is not None:
+            if self.actual()[0] != 'identificador':
+                claves = None
+                break
+            columna = self.identificador()
+            hueco = self.valor() if self.operador('=', opcional=True) else None
+            if hueco is None or not hueco[2]:
+                claves = None
+                break
+            claves.append((columna, hueco))
+            if not self.palabra('AND', opcional=True):
+                break
+        simple = claves is not None and self.fin()
+        self.pos = len(self.forma)
+        return inicio, tuple(claves) if simple else None
+
+    def analizar(self):
+        if self.palabra('INSERT', opcional=True):
+            self.palabra('INTO', opcional=True)
+            esquema, tabla = self.nombre_tabla()
+            columnas = tuple(self.lista(self.identificador))
+            self.palabra('VALUES')
+            filas = [tuple(self.lista(self.valor))]
+            while self.operador(',', opcional=True):
+                filas.append(tuple(self.lista(self.valor)))
+            if any(len(fila) != len(columnas) for fila in filas):
+                raise ConsultaNoSoportada("El número de valores no coincide con el de columnas")
+            self.operador(';', opcional=True)
+            if self.pos != len(self.forma):
+                raise ConsultaNoSoportada("Texto inesperado después de VALUES")
+            return Plantilla('INSERT', esquema, tabla, columnas, tuple(filas))
+        if self.palabra('UPDATE', opcional=True):
+            esquema, tabla = self.nombre_tabla()
+            self.palabra('SET')
+            asignaciones = []
+            while True:
+                columna = self.identificador()
+                self.operador('=')
+                asignaciones.append((columna, self.valor()))
+                if not self.operador(',', opcional=True):
+                    break
+            inicio_donde, claves = self.donde()
+            return Plantilla('UPDATE', esquema, tabla, asignaciones=tuple(asignaciones),
+                             inicio_donde=inicio_donde, claves=claves)
+        if self.palabra('DELETE', opcional=True):
+            self.palabra('FROM', opcional=True)
+            esquema, tabla = self.nombre_tabla()
+            inicio_donde, claves = self.donde()
+            return Plantilla('DELETE', esquema, tabla, inicio_donde=inicio_donde, claves=claves)
+        raise ConsultaNoSoportada("Solo se admiten INSERT, UPDATE y DELETE")
+
+
+@functools.lru_cache(maxsize=MAX_PLANTILLAS)
+def compilar_plantilla(forma):
+    # Sentencias con la misma forma reutilizan la plantilla sin volver a recorrer la gramática;
+    # las no soportadas también se recuerdan, como None
+    try:
+        return Analizador(forma).analizar()
+    except ConsultaNoSoportada:
+        return None
+
+
+class SentenciaDml:
+    __slots__ = ('operacion', 'esquema', 'tabla', 'columnas', 'filas', 'valores', 'donde', 'claves', 'parametrizable')
+
+    def __init__(self, operacion, esquema, tabla, columnas, filas, valores, donde, claves, parametrizable):
+        self.operacion = operacion
+        self.esquema = esquema
+        self.tabla = tabla
+        self.columnas = columnas
+        self.filas = filas
+        self.valores = valores
+        self.donde = donde
+        self.claves = claves
+        self.parametrizable = parametrizable
+
+    def parametros(self):
+        # Literales convertidos a valores de Python: filas para INSERT, (valores, donde) para UPDATE/DELETE
+        if self.operacion == 'INSERT':
+            return [{c: convertir_literal(v) for c, v in fila.items()} for fila in self.filas]
+        return ({c: convertir_literal(v) for c, v in self.valores.items()},
+                {c: convertir_literal(v) for c, v in self.claves.items()})
+
+
+def extractor(huecos):
+    # huecos: (prefijo, índice del literal), o (texto, None) para NULL; devuelve literales -> tupla de textos
+    if huecos and all(prefijo == '' and indice is not None for prefijo, indice in huecos):
+        if len(huecos) == 1:
+            indice = huecos[0][1]
+            return lambda literales: (literales[indice],)
+        return operator.itemgetter(*(indice for _, indice in huecos))
+
+    def extraer(literales):
+        return tuple(prefijo if indice is None else prefijo + literales[indice] for prefijo, indice in huecos)
+    return extraer
+
+
+class PlantillaLiterales:
+    # Plantilla de una sentencia sin expresiones ni WHERE libre: se aplica directamente a los
+    # literales de LITERAL.split, sin tokenizar
+    __slots__ = ('operacion', 'esquema', 'tabla', 'columnas', 'filas', 'columnas_asignadas', 'asignaciones',
+                 'columnas_claves', 'claves', 'donde')
+
+    def __init__(self, plantilla, forma, posiciones, texto):
+        indices, contador = {}, 0
+        for i, (tipo, _) in enumerate(forma):
+            if tipo in LITERALES:
+                indices[i] = contador
+                contador += 1
+
+        def hueco(h):
+            inicio, fin, _ = h
+            if forma[fin - 1][0] == 'nulo':
+                return texto[posiciones[fin - 1][0]:posiciones[fin - 1][1]], None
+            return (forma[inicio][1] if fin - inicio == 2 else ''), indices[fin - 1]
+
+        self.operacion = plantilla.operacion
+        self.esquema = plantilla.esquema
+        self.tabla = plantilla.tabla
+        self.columnas = plantilla.columnas
+        self.filas = tuple(extractor([hueco(h) for h in fila]) for fila in plantilla.filas)
+        self.columnas_asignadas = tuple(c for c, _ in plantilla.asignaciones)
+        self.asignaciones = extractor([hueco(h) for _, h in plantilla.asignaciones])
+        self.columnas_claves = tuple(c for c, _ in plantilla.claves or ())
+        self.claves = extractor([hueco(h) for _, h in plantilla.claves or ()])
+        self.donde = None
+        if plantilla.inicio_donde is not None:
+            # Posición del WHERE en la forma normalizada (una MARCA por literal) y literales que lo preceden
+            anteriores = sum(1 for tipo, _ in forma[:plantilla.inicio_donde] if tipo in LITERALES)
+            self.donde = (posiciones[plantilla.inicio_donde][0] - anteriores * (len(RELLENO) - 1), anteriores)
+
+    def aplicar(self, query, literales):
+        filas = [dict(zip(self.columnas, extraer(literales))) for extraer in self.filas]
+        valores = dict(zip(self.columnas_asignadas, self.asignaciones(literales)))
+        donde = claves = None
+        if self.donde is not None:
+            desplazamiento, anteriores = self.donde
+            inicio = desplazamiento + sum(map(len, literales[:anteriores])) - anteriores
+            donde = query[inicio:].strip().rstrip(';').rstrip()
+            claves = dict(zip(self.columnas_claves, self.claves(literales)))
+        return SentenciaDml(self.operacion, self.esquema, self.tabla, self.columnas, filas, valores, donde, claves,
+                            True)
+
+
+def es_parametrizable(plantilla):
+    return (all(h[2] for fila in plantilla.filas for h in fila)
+            and all(h[2] for _, h in plantilla.asignaciones)
+            and (plantilla.inicio_donde is None or plantilla.claves is not None))
+
+
+@functools.lru_cache(maxsize=MAX_PLANTILLAS)
+def plantilla_literales(forma_normalizada):
+    # Se analiza la forma con un literal de relleno en cada MARCA; la plantilla solo vale si el
+    # tokenizador ve exactamente esos literales, y si no hay expresiones ni WHERE libre
+    partes = forma_normalizada.split(MARCA)
+    texto = RELLENO.join(partes)
+    esperadas, posicion = [], 0
+    for parte in partes[:-1]:
+        posicion += len(parte)
+        esperadas.append(posicion + 1)
+        posicion += len(RELLENO)
+    try:
+        forma, posiciones = tokenizar(texto)
+    except ConsultaNoSoportada:
+        return None
+    if [inicio for (tipo, _), (inicio, _) in zip(forma, posiciones) if tipo in LITERALES] != esperadas:
+        return None
+    plantilla = compilar_plantilla(forma)
+    if plantilla is None or not es_parametrizable(plantilla):
+        return None
+    return PlantillaLiterales(plantilla, forma, posiciones, texto)
+
+
+def analizar_completo(query):
+    try:
+        forma, posiciones = tokenizar(query)
+    except ConsultaNoSoportada:
+        return None
+    plantilla = compilar_plantilla(forma)
+    if plantilla is None:
+        return None
+
+    def texto(hueco):
+        inicio, fin, literal = hueco
+        if literal and fin - inicio == 2:
+            # Signo y número, sin el espacio que pudiera haber entre ellos
+            return forma[inicio][1] + query[posiciones[inicio + 1][0]:posiciones[inicio + 1][1]]
+        return query[posiciones[inicio][0]:posiciones[fin - 1][1]]
+
+    filas = [{c: texto(h) for c, h in zip(plantilla.columnas, fila)} for fila in plantilla.filas]
+    valores = {c: texto(h) for c, h in plantilla.asignaciones}
+    donde = claves = None
+    if plantilla.inicio_donde is not None:
+        donde = query[posiciones[plantilla.inicio_donde][0]:].strip().rstrip(';').rstrip()
+        if plantilla.claves is not None:
+            claves = {c: texto(h) for c, h in plantilla.claves}
+    return SentenciaDml(plantilla.operacion, plantilla.esquema, plantilla.tabla, plantilla.columnas, filas, valores,
+                        donde, claves, es_parametrizable(plantilla))
+
+
+def analizar_sentencia(query):
+    # Ruta rápida: la forma normalizada sale de una sola pasada de LITERAL.split y, si su plantilla
+    # ya está en caché, la sentencia no se tokeniza. Con identificadores delimitados, comentarios
+    # o NUL los literales no se reconocen sin tokenizar
+    if not ('[' in query or '"' in query or '--' in query or '/*' in query or MARCA in query):
+        partes = LITERAL.split(query)
+        plantilla = plantilla_literales(MARCA.join(partes[::2]))
+        if plantilla is not None:
+            return plantilla.aplicar(query, partes[1::2])
+    return analizar_completo(query)
+
+
+def estadisticas_cache():
+    def resumen(funcion):
+        info = funcion.cache_info()
+        return {"aciertos": info.hits, "fallos": info.misses, "plantillas": info.currsize,
+                "max_plantillas": info.maxsize}
+    return {"normalizadas": resumen(plantilla_literales), "tokens": resumen(compilar_plantilla)}
+
+
+def limpiar_cache():
+    plantilla_literales.cache_clear()
+    compilar_plantilla.cache_clear()
@@ -0,0 +1,120 @@
+import threading
+
+from sqlalchemy import text
+
+from Models.DmlParser import nombre_sql
+from services.EngineRegistry import EngineRegistry, engine_registry
+
+HILO_TABLA = 'auditoria_id_hilo'
+
+_asignadores = {}
+_asignadores_lock = threading.Lock()
+
+
+class IdAllocator:
+    def __init__(self, engine, tamano_bloque=100):
+        self.engine = engine
+        self.tamano_bloque = tamano_bloque
+        self._rangos = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        self._tabla_hilo_creada = False
+        self._sincronizadas = set()
+
+    def crear_tabla_hilo(self):
+        if self.engine.dialect.name == 'mssql':
+            ddl = f"""
+            IF OBJECT_ID('{HILO_TABLA}', 'U') IS NULL
+                CREATE TABLE {HILO_TABLA} (tabla NVARCHAR(128) PRIMARY KEY, siguiente BIGINT NOT NULL)
+            """
+        else:
+            ddl = f"CREATE TABLE IF NOT EXISTS {HILO_TABLA} (tabla VARCHAR(128) PRIMARY KEY, siguiente BIGINT NOT NULL)"
+        with self.engine.begin() as conn:
+            conn.execute(text(ddl))
+        self._tabla_hilo_creada = True
+
+    def _lock_tabla(self, tabla):
+        with self._lock:
+            return self._locks.setdefault(tabla, threading.Lock())
+
+    def _sincronizar(self, conn, tabla):
+        # Una vez por proceso y tabla: el contador nunca queda por debajo de MAX(id) + 1
+        tabla_sql = nombre_sql(tabla, self.engine.dialect.identifier_preparer)
+        if self.engine.dialect.name == 'mssql':
+            conn.execute(text(f"""
+            DECLARE @maximo BIGINT = (SELECT ISNULL(MAX(id), 0) FROM {tabla_sql});
+            MERGE {HILO_TABLA} WITH (HOLDLOCK) AS h
+            USING (SELECT :tabla AS tabla) AS s ON h.tabla = s.tabla
+            WHEN MATCHED AND h.siguiente <= @maximo THEN UPDATE SET siguiente = @maximo + 1
+            WHEN NOT MATCHED THEN INSERT (tabla, siguiente) VALUES (s.tabla, @maximo + 1);
+            """), {"tabla": tabla})
+            return
+        maximo = conn.execute(text(f"SELECT COALESCE(MAX(id), 0) FROM {tabla_sql}")).scalar()
+        actual = conn.execute(text(f"SELECT siguiente FROM {HILO_TABLA} WHERE tabla = :tabla"),
+                              {"tabla": tabla}).scalar()
+        if actual is None:
+            conn.execute(text(f"INSERT INTO {HILO_TABLA} (tabla, siguiente) VALUES (:tabla, :siguiente)"),
+                         {"tabla": tabla, "siguiente": maximo + 1})
+        elif actual <= maximo:
+            conn.execute(text(f"UPDATE {HILO_TABLA} SET siguiente = :siguiente WHERE tabla = :tabla"),
+                         {"tabla": tabla, "siguiente": maximo + 1})
+
+    def _reservar(self, tabla, cantidad):
+        if not self._tabla_hilo_creada:
+            self.crear_tabla_hilo()
+        with self.engine.begin() as conn:
+            if tabla not in self._sincronizadas:
+                self._sincronizar(conn, tabla)
+            if self.engine.dialect.name == 'mssql':
+                inicio = conn.execute(text(f"""
+                UPDATE {HILO_TABLA} WITH (ROWLOCK) SET siguiente = siguiente + :cantidad
+                OUTPUT deleted.siguiente
+                WHERE tabla = :tabla
+                """), {"tabla": tabla, "cantidad": cantidad}).scalar()
+            else:
+                # Portátil: el UPDATE toma el bloqueo de escritura antes de leer el nuevo valor
+                conn.execute(text(f"UPDATE {HILO_TABLA} SET siguiente = siguiente + :cantidad WHERE tabla = :tabla"),
+                             {"tabla": tabla, "cantidad": cantidad})
+                inicio = conn.execute(text(f"SELECT siguiente FROM {HILO_TABLA} WHERE tabla = :tabla"),
+                                      {"tabla": tabla}).scalar() - cantidad
+        self._sincronizadas.add(tabla)
+        return inicio, inicio + cantidad
+
+    def siguientes_ids(self, tabla, cantidad):
+        ids = []
+        with self._lock_tabla(tabla):
+            inicio, fin = self._rangos.get(tabla, (0, 0))
+            disponibles = min(fin - inicio, cantidad)
+            ids.extend(range(inicio, inicio + disponibles))
+            inicio += disponibles
+            faltantes = cantidad - disponibles
+            if faltantes:
+                inicio, fin = self._reservar(tabla, max(faltantes, self.tamano_bloque))
+                ids.extend(range(inicio, inicio + faltantes))
+                inicio += faltantes
+            self._rangos[tabla] = (inicio, fin)
+        return ids
+
+    def siguiente_id(self, tabla):
+        return self.siguientes_ids(tabla, 1)[0]
+
+
+def obtener_asignador_ids(engine, tamano_bloque=100):
+    clave = EngineRegistry.make_key(engine.url)
+    with _asignadores_lock:
+        asignador = _asignadores.get(clave)
+        if asignador is None:
+            asignador = _asignadores[clave] = IdAllocator(engine, tamano_bloque)
+        return asignador
+
+
+def descartar_asignador(engine):
+    # El registro liberó el engine: el asignador se descarta con él y sus rangos sin usar quedan como huecos
+    clave = EngineRegistry.make_key(engine.url)
+    with _asignadores_lock:
+        asignador = _asignadores.get(clave)
+        if asignador is not None and asignador.engine is engine:
+            del _asignadores[clave]
+
+
+engine_registry.add_dispose_listener(descartar_asignador)
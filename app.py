@@ -4,6 +4,13 @@ from flask_cors import CORS
 from routes.AnomaliasEnDatos import anomalia_en_datos
 from routes.IntegridadReferencialRelaciones import auditoria
 from routes.IntegridadReferencailRoute import integridad_referencial
+from routes.HuerfanosRoute import huerfanos
+from routes.AuditoriaRoute import auditoria_dml
+from routes.TrabajosRoute import trabajos
+from routes.CorridasRoute import corridas
+from routes.FlotaRoute import flota
+from routes.MetricasRoute import metricas
+from routes.AuditoriaCompletaRoute import auditoria_completa
 
 app = Flask(__name__)
 
@@ -13,6 +20,13 @@ app.register_blueprint(auditoria)
 
 app.register_blueprint(anomalia_en_datos)
 app.register_blueprint(integridad_referencial)
+app.register_blueprint(huerfanos)
+app.register_blueprint(auditoria_dml)
+app.register_blueprint(trabajos)
+app.register_blueprint(corridas)
+app.register_blueprint(flota)
+app.register_blueprint(metricas)
+app.register_blueprint(auditoria_completa)
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,73 @@
+# benchmarks/bench_false_fks.py
+#
+# Uso: python -m benchmarks.bench_false_fks --tablas 2000 --columnas 20
+
+import argparse
+import random
+import time
+
+from services.DataAnomaly import DataAnomaly, DataAnomalyService
+from services.SchemaSnapshot import ColumnInfo, ForeignKeyInfo, SchemaSnapshot, TableInfo
+
+
+def build_synthetic_snapshot(num_tables, columns_per_table, fk_ratio=0.3, seed=42):
+    rng = random.Random(seed)
+    tables = []
+    for i in range(num_tables):
+        name = f"tabla_{i}"
+        pk_name = f"{name}_id"
+        columns = [ColumnInfo(pk_name, 'int', False)]
+        foreign_keys = []
+        for j in range(1, columns_per_table):
+            if i > 0 and rng.random() < 0.2:
+                parent = rng.randrange(i)
+                column_name = f"tabla_{parent}_id"
+                columns.append(ColumnInfo(column_name, 'int'))
+                if rng.random() < fk_ratio:
+                    foreign_keys.append(ForeignKeyInfo(f"fk_{name}_{j}", name, [column_name], f"tabla_{parent}",
+                                                       [column_name]))
+            else:
+                columns.append(ColumnInfo(rng.choice(['nombre', 'codigo', 'fecha', f"dato_{j}"]), 'varchar'))
+        unique_columns = {column.name: column for column in columns}
+        tables.append(TableInfo(name, unique_columns.values(), [pk_name], foreign_keys))
+    return SchemaSnapshot('sintetico', tables)
+
+
+def legacy_false_fks(service):
+    all_columns = set(service.get_all_columns())
+    pk_columns = set(service.get_all_pk_columns())
+    fk_columns = set(service.get_all_fk_columns())
+    non_fk_columns = all_columns - fk_columns
+    return [DataAnomaly("Clave Foránea Falsa", table, col,
+                        f"Esta columna podría hacer referencia a {pk_table}.{pk_col} pero no es una clave foránea")
+            for pk_table, pk_col in pk_columns
+            for table, col in non_fk_columns
+            if col == pk_col and table != pk_table]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara la detección de claves foráneas falsas")
+    parser.add_argument('--tablas', type=int, default=2000)
+    parser.add_argument('--columnas', type=int, default=20)
+    args = parser.parse_args()
+
+    snapshot = build_synthetic_snapshot(args.tablas, args.columnas)
+    service = DataAnomalyService(None, snapshot)
+    print(f"Esquema sintético: {len(snapshot.tables)} tablas, {snapshot.count_columns()} columnas")
+
+    start = time.perf_counter()
+    legacy = legacy_false_fks(service)
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    indexed = list(service.iter_false_fks())
+    indexed_time = time.perf_counter() - start
+
+    assert len(legacy) == len(indexed)
+    print(f"Comparación por pares: {legacy_time:.3f}s ({len(legacy)} hallazgos)")
+    print(f"Índice por nombre:     {indexed_time:.3f}s ({len(indexed)} hallazgos)")
+    print(f"Aceleración: x{legacy_time / max(indexed_time, 1e-9):.1f}")
+
+
+if __name__ == '__main__':
+    main()
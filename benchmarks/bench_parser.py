@@ -0,0 +1,111 @@
+# benchmarks/bench_parser.py
+#
+# Uso: python -m benchmarks.bench_parser --sentencias 50000 --formas 40
+
+import argparse
+import random
+import re
+import time
+
+from Models.DmlParser import analizar_completo, analizar_sentencia, estadisticas_cache, limpiar_cache
+
+
+def legacy_analizar_consulta(query):
+    # Ruta anterior: hasta tres re.match repetidos y VALUES partido por comas
+    insert_pattern = r"INSERT\s+INTO\s+(\w+)\s*\((.*?)\)\s*VALUES\s*\((.*?)\)"
+    update_pattern = r"UPDATE\s+(\w+)\s+SET\s+(.*?)\s*WHERE\s+(.*)"
+    delete_pattern = r"DELETE\s+FROM\s+(\w+)\s*WHERE\s+(.*)"
+
+    if re.match(insert_pattern, query, re.IGNORECASE):
+        match = re.match(insert_pattern, query, re.IGNORECASE)
+        return 'INSERT', match.group(1), dict(
+            zip(map(str.strip, match.group(2).split(',')), map(str.strip, match.group(3).split(','))))
+    elif re.match(update_pattern, query, re.IGNORECASE):
+        match = re.match(update_pattern, query, re.IGNORECASE)
+        return 'UPDATE', match.group(1), {item.split('=')[0].strip(): item.split('=')[1].strip() for item in
+                                          match.group(2).split(',')}
+    elif re.match(delete_pattern, query, re.IGNORECASE):
+        match = re.match(delete_pattern, query, re.IGNORECASE)
+        return 'DELETE', match.group(1), match.group(2)
+    else:
+        return None, None, None
+
+
+def nuevo_analizar_consulta(query):
+    sentencia = analizar_sentencia(query)
+    if sentencia is None:
+        return None, None, None
+    if sentencia.operacion == 'INSERT':
+        return 'INSERT', sentencia.tabla, sentencia.filas[0] if len(sentencia.filas) == 1 else sentencia.filas
+    if sentencia.operacion == 'UPDATE':
+        return 'UPDATE', sentencia.tabla, sentencia.valores
+    return 'DELETE', sentencia.tabla, sentencia.donde
+
+
+def generar_sentencias(cantidad, formas, columnas, seed=42):
+    rng = random.Random(seed)
+    # Cada forma fija tabla, operación y columnas; los literales cambian en cada sentencia
+    plantillas = []
+    for k in range(formas):
+        tabla = f"tabla_{k}"
+        cols = [f"col_{j}" for j in range(rng.randint(2, columnas))]
+        plantillas.append((('INSERT', 'UPDATE', 'DELETE')[k % 3], tabla, cols))
+
+    sentencias = []
+    for i in range(cantidad):
+        operacion, tabla, cols = plantillas[rng.randrange(formas)]
+        literales = [str(rng.randint(1, 10 ** 6)) if j % 2 else f"'valor {i}-{j}'" for j in range(len(cols))]
+        if operacion == 'INSERT':
+            sentencias.append(f"INSERT INTO {tabla} ({', '.join(cols)}) VALUES ({', '.join(literales)})")
+        elif operacion == 'UPDATE':
+            asignaciones = ', '.join(f"{c} = {v}" for c, v in zip(cols[1:], literales[1:]))
+            sentencias.append(f"UPDATE {tabla} SET {asignaciones} WHERE {cols[0]} = {i}")
+        else:
+            sentencias.append(f"DELETE FROM {tabla} WHERE {cols[0]} = {i}")
+    return sentencias
+
+
+def medir(funcion, sentencias, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        start = time.perf_counter()
+        for sentencia in sentencias:
+            funcion(sentencia)
+        tiempos.append(time.perf_counter() - start)
+    return min(tiempos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara el analizador DML por tokens con la ruta de expresiones regulares")
+    parser.add_argument('--sentencias', type=int, default=50000)
+    parser.add_argument('--formas', type=int, default=40, help="Formas distintas de sentencia en la carga")
+    parser.add_argument('--columnas', type=int, default=8)
+    parser.add_argument('--repeticiones', type=int, default=3)
+    args = parser.parse_args()
+
+    sentencias = generar_sentencias(args.sentencias, args.formas, args.columnas)
+    # Sin comas dentro de las cadenas las dos rutas deben coincidir
+    for sentencia in sentencias[:1000]:
+        assert legacy_analizar_consulta(sentencia) == nuevo_analizar_consulta(sentencia), sentencia
+
+    legacy = medir(legacy_analizar_consulta, sentencias, args.repeticiones)
+    limpiar_cache()
+    nuevo = medir(nuevo_analizar_consulta, sentencias, args.repeticiones)
+    cache = estadisticas_cache()["normalizadas"]
+    # Siempre por el tokenizador: lo que cuesta una sentencia cuya forma no está en caché
+    completo = medir(lambda sentencia: analizar_completo(sentencia), sentencias, args.repeticiones)
+
+    print(f"{len(sentencias)} sentencias, {args.formas} formas distintas")
+    print(f"Expresiones regulares:            {legacy:.3f}s")
+    print(f"Forma normalizada + plantilla:    {nuevo:.3f}s (x{legacy / max(nuevo, 1e-9):.2f})")
+    print(f"Tokenizador completo:             {completo:.3f}s (x{legacy / max(completo, 1e-9):.2f})")
+    print(f"Caché: {cache['aciertos']} aciertos, {cache['fallos']} fallos")
+
+    filas = ', '.join(f"({i}, 'nombre, con coma {i}')" for i in range(1000))
+    start = time.perf_counter()
+    sentencia = analizar_sentencia(f"INSERT INTO clientes (id, nombre) VALUES {filas}")
+    print(f"INSERT de {len(sentencia.filas)} filas con comas en las cadenas: {time.perf_counter() - start:.4f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+# benchmarks/bench_relaciones.py
+#
+# Uso: python -m benchmarks.bench_relaciones --tablas 2000 --columnas 20
+
+import argparse
+import subprocess
+import sys
+import time
+
+from benchmarks.bench_false_fks import build_synthetic_snapshot
+from services.IntegridadReferencialRelacionalService import IntegridadReferencialRelacionalService
+
+
+def legacy_analysis(snapshot):
+    # Ruta anterior: DataFrames, iterrows() y las claves existentes/potenciales calculadas dos veces
+    import pandas as pd
+
+    def existing():
+        return pd.DataFrame([{
+            'tabla_hija': fk.table,
+            'columna_hija': fk.constrained_columns[0],
+            'tabla_padre': fk.referred_table,
+            'columna_padre': fk.referred_columns[0],
+            'nombre_fk': fk.name
+        } for fk in snapshot.iter_foreign_keys()])
+
+    def potential():
+        rows = []
+        for table, column in snapshot.iter_columns():
+            if column.name.endswith('_id') or column.name.startswith('id_'):
+                parent = column.name.replace('_id', '').replace('id_', '')
+                if parent in snapshot.tables:
+                    rows.append({'tabla_hija': table, 'columna_hija': column.name,
+                                 'tabla_padre_potencial': parent, 'columna_padre_potencial': 'id'})
+        return pd.DataFrame(rows)
+
+    def missing():
+        existing_set = set((r['tabla_hija'], r['columna_hija'], r['tabla_padre'], r['columna_padre'])
+                           for _, r in existing().iterrows())
+        rows = []
+        for _, r in potential().iterrows():
+            key = (r['tabla_hija'], r['columna_hija'], r['tabla_padre_potencial'], r['columna_padre_potencial'])
+            if key not in existing_set:
+                rows.append({'tabla_hija': r['tabla_hija'], 'columna_hija': r['columna_hija'],
+                             'tabla_padre_potencial': r['tabla_padre_potencial'],
+                             'columna_padre_potencial': r['columna_padre_potencial']})
+        return pd.DataFrame(rows)
+
+    existing_fks, potential_fks, missing_fks = existing(), potential(), missing()
+    return {
+        "existing_foreign_keys": existing_fks.to_dict(orient='records'),
+        "potential_foreign_keys": potential_fks.to_dict(orient='records'),
+        "missing_foreign_keys": missing_fks.to_dict(orient='records'),
+    }
+
+
+def import_time(*modules):
+    # Proceso nuevo para medir el arranque en frío
+    code = f"import time; t = time.perf_counter(); import {', '.join(modules)}; print(time.perf_counter() - t)"
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    return float(output.stdout.strip())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara el análisis relacional con y sin pandas")
+    parser.add_argument('--tablas', type=int, default=2000)
+    parser.add_argument('--columnas', type=int, default=20)
+    parser.add_argument('--repeticiones', type=int, default=3)
+    args = parser.parse_args()
+
+    snapshot = build_synthetic_snapshot(args.tablas, args.columnas)
+    # Las columnas hijas se llaman 'tabla_N_id', así que la heurística por nombre encuentra candidatas
+    print(f"Esquema sintético: {len(snapshot.tables)} tablas, {snapshot.count_columns()} columnas, "
+          f"{snapshot.count_foreign_keys()} claves foráneas")
+
+    legacy_times, fused_times = [], []
+    for _ in range(args.repeticiones):
+        start = time.perf_counter()
+        legacy = legacy_analysis(snapshot)
+        legacy_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        fused = IntegridadReferencialRelacionalService(None, snapshot).analyze_referential_relationships()
+        fused_times.append(time.perf_counter() - start)
+
+    for section in ("existing_foreign_keys", "potential_foreign_keys", "missing_foreign_keys"):
+        assert len(legacy[section]) == len(fused[section]), section
+
+    legacy_time, fused_time = min(legacy_times), min(fused_times)
+    print(f"pandas + iterrows: {legacy_time:.3f}s")
+    print(f"Pasada única:      {fused_time:.3f}s")
+    print(f"Aceleración: x{legacy_time / max(fused_time, 1e-9):.1f}")
+
+    module = 'services.IntegridadReferencialRelacionalService'
+    # Antes el servicio importaba pandas al cargarse; ahora solo si se pide un DataFrame
+    before_import = import_time('pandas', module)
+    after_import = import_time(module)
+    print(f"Importar servicio con pandas: {before_import:.3f}s")
+    print(f"Importar servicio sin pandas: {after_import:.3f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,265 @@
+# benchmarks/bench_servicios.py
+#
+# Uso: python -m benchmarks.bench_servicios --tablas 500 --columnas 12 --filas 200 --huerfanos 0.05
+#      python -m benchmarks.bench_servicios --comparar benchmarks/resultados/anterior.json
+#
+# Genera un esquema sintético en SQLite, mide cada fase de los servicios (tiempo, consultas al
+# motor y memoria pico) y guarda el resultado en JSON para compararlo entre commits.
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, event, insert, text
+
+from Models.AuditModel import AuditModel, AuditoriaLog
+from services.ColumnProfileService import ColumnProfileService
+from services.DataAnomaly import DataAnomalyService
+from services.IntegridadReferencialRelacionalService import IntegridadReferencialRelacionalService
+from services.IntegridadReferencialService import IntegridadReferencialService
+from services.Metrics import es_consulta_catalogo
+from services.OrphanScanService import OrphanScanService
+from services.SchemaCache import SchemaSnapshotCache
+
+PATRONES = ('sufijo', 'prefijo', 'pk_nombrada')
+
+
+def nombres(patron, tabla):
+    # (nombre de la PK, nombre de una columna hija que apunta a `tabla`)
+    if patron == 'sufijo':
+        return 'id', f"{tabla}_id"
+    if patron == 'prefijo':
+        return 'id', f"id_{tabla}"
+    return f"{tabla}_id", f"{tabla}_id"
+
+
+def generar_esquema(engine, tablas, columnas, densidad_fk, patron, filas, tasa_huerfanos, seed=42):
+    rng = random.Random(seed)
+    definiciones = []
+    for i in range(tablas):
+        tabla = f"t{i}"
+        pk, _ = nombres(patron, tabla)
+        cols = [f"{pk} INTEGER PRIMARY KEY"]
+        fks, hijas = [], []
+        usadas = {pk}
+        for j in range(1, columnas):
+            if i > 0 and rng.random() < densidad_fk:
+                padre = f"t{rng.randrange(i)}"
+                pk_padre, hija = nombres(patron, padre)
+                if hija in usadas:
+                    continue
+                usadas.add(hija)
+                cols.append(f"{hija} INTEGER")
+                hijas.append((hija, padre))
+                # La mitad de las relaciones se declaran; el resto queda para la detección por nombre
+                if rng.random() < 0.5:
+                    fks.append(f"FOREIGN KEY ({hija}) REFERENCES {padre} ({pk_padre})")
+            else:
+                cols.append(f"dato_{j} VARCHAR(50)")
+        definiciones.append((tabla, pk, cols, fks, hijas))
+
+    with engine.begin() as conn:
+        for tabla, _, cols, fks, _ in definiciones:
+            conn.execute(text(f"CREATE TABLE {tabla} ({', '.join(cols + fks)})"))
+        if filas:
+            for tabla, pk, cols, _, hijas in definiciones:
+                otras = [c.split()[0] for c in cols[1:] if c.split()[0] not in {h for h, _ in hijas}]
+                registros = []
+                for k in range(1, filas + 1):
+                    registro = {pk: k}
+                    for hija, _ in hijas:
+                        # Una fracción controlada de valores apunta fuera del rango de la tabla padre
+                        registro[hija] = filas + k if rng.random() < tasa_huerfanos else rng.randint(1, filas)
+                    for otra in otras:
+                        registro[otra] = f"v{k}"
+                    registros.append(registro)
+                columnas_sql = list(registros[0])
+                conn.execute(text(f"INSERT INTO {tabla} ({', '.join(columnas_sql)}) "
+                                  f"VALUES ({', '.join(':' + c for c in columnas_sql)})"), registros)
+    return sum(len(h) for *_, h in definiciones)
+
+
+class Medidor:
+    def __init__(self, engine, memoria=True):
+        self.memoria = memoria
+        self.consultas = 0
+        self.catalogo = 0
+        self.fases = {}
+        event.listen(engine, 'before_cursor_execute', self._contar)
+
+    def _contar(self, conn, cursor, statement, parameters, context, executemany):
+        self.consultas += 1
+        if es_consulta_catalogo(statement):
+            self.catalogo += 1
+
+    def medir(self, fase, funcion, *args, **kwargs):
+        consultas, catalogo = self.consultas, self.catalogo
+        # tracemalloc encarece el código Python: los tiempos solo son comparables con el mismo ajuste
+        if self.memoria:
+            tracemalloc.start()
+        start = time.perf_counter()
+        resultado = funcion(*args, **kwargs)
+        tiempo = time.perf_counter() - start
+        pico = 0
+        if self.memoria:
+            _, pico = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        self.fases[fase] = {
+            "tiempo": round(tiempo, 4),
+            "consultas": self.consultas - consultas,
+            "consultas_catalogo": self.catalogo - catalogo,
+            "memoria_pico_kb": round(pico / 1024, 1),
+        }
+        memoria = f"{pico / 1024 / 1024:8.2f} MB" if self.memoria else ''
+        print(f"{fase:<32} {tiempo:8.3f}s {self.consultas - consultas:6d} consultas {memoria}")
+        return resultado
+
+
+def bench_auditoria(medidor, engine, operaciones):
+    modelo = AuditModel.__new__(AuditModel)
+    modelo.engine = engine
+    AuditoriaLog.__table__.create(engine)
+
+    consultas = []
+    for k in range(operaciones):
+        tabla = f"t{k % 50}"
+        if k % 3 == 0:
+            consultas.append(f"INSERT INTO {tabla} (id, nombre, monto) VALUES ({k}, 'n{k}', {k * 1.5})")
+        elif k % 3 == 1:
+            consultas.append(f"UPDATE {tabla} SET nombre = 'm{k}', monto = {k} WHERE id = {k}")
+        else:
+            consultas.append(f"DELETE FROM {tabla} WHERE id = {k}")
+
+    medidor.medir('auditoria.analizar_consulta', lambda: [modelo.analizar_consulta(c) for c in consultas])
+    operaciones_norm = medidor.medir('auditoria.normalizar_operaciones', modelo.normalizar_operaciones, consultas)
+    medidor.medir('auditoria.agrupar_operaciones', modelo.agrupar_operaciones, operaciones_norm)
+
+    inicio = datetime(2024, 1, 1)
+    with engine.begin() as conn:
+        conn.execute(insert(AuditoriaLog.__table__), [
+            {"id": k, "tabla": f"t{k % 50}", "operacion": ('INSERT', 'UPDATE', 'DELETE')[k % 3],
+             "usuario": 'bench', "fecha_hora": inicio + timedelta(seconds=k), "datos": '[]'}
+            for k in range(1, operaciones + 1)])
+
+    def paginar():
+        cursor, paginas = None, 0
+        while True:
+            pagina = modelo.consultar_log(tabla='t7', limite=20, cursor=cursor)
+            paginas += 1
+            cursor = pagina["siguiente_cursor"]
+            if not cursor:
+                return paginas
+
+    medidor.medir('auditoria.consultar_log', paginar)
+
+
+def commit_actual():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def comparar(actual, anterior, umbral):
+    print(f"\nComparación con {anterior.get('commit')} ({anterior.get('fecha')})")
+    regresiones = 0
+    for fase, medida in actual["fases"].items():
+        previa = anterior["fases"].get(fase)
+        if not previa:
+            continue
+        ratio = medida["tiempo"] / max(previa["tiempo"], 1e-6)
+        marca = ''
+        if ratio > 1 + umbral and medida["tiempo"] - previa["tiempo"] > 0.005:
+            marca = '  <-- regresión'
+            regresiones += 1
+        consultas = medida["consultas"] - previa["consultas"]
+        print(f"{fase:<32} {previa['tiempo']:8.3f}s -> {medida['tiempo']:8.3f}s (x{ratio:.2f}) "
+              f"consultas {consultas:+d}{marca}")
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mide los servicios de análisis sobre esquemas sintéticos")
+    parser.add_argument('--tablas', type=int, default=500)
+    parser.add_argument('--columnas', type=int, default=12)
+    parser.add_argument('--densidad-fk', type=float, default=0.25)
+    parser.add_argument('--patron', choices=PATRONES, default='sufijo')
+    parser.add_argument('--filas', type=int, default=0, help="Filas por tabla (0: solo esquema)")
+    parser.add_argument('--huerfanos', type=float, default=0.0, help="Fracción de valores hijos sin padre")
+    parser.add_argument('--operaciones', type=int, default=5000, help="Operaciones DML para AuditModel")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--sin-memoria', action='store_true', help="No mide memoria pico (tiempos sin tracemalloc)")
+    parser.add_argument('--salida', default=os.path.join('benchmarks', 'resultados'))
+    parser.add_argument('--comparar', help="JSON de una ejecución anterior")
+    parser.add_argument('--umbral', type=float, default=0.2, help="Aumento relativo que cuenta como regresión")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directorio:
+        engine = create_engine(f"sqlite:///{os.path.join(directorio, 'bench.db')}")
+        relaciones = generar_esquema(engine, args.tablas, args.columnas, args.densidad_fk, args.patron,
+                                     args.filas, args.huerfanos, args.seed)
+        print(f"Esquema sintético: {args.tablas} tablas, {args.columnas} columnas por tabla, "
+              f"{relaciones} relaciones, {args.filas} filas por tabla\n")
+
+        medidor = Medidor(engine, memoria=not args.sin_memoria)
+        cache = SchemaSnapshotCache()
+        snapshot = medidor.medir('esquema.carga_fria', cache.get_snapshot, engine)
+        medidor.medir('esquema.carga_cache', cache.get_snapshot, engine)
+
+        medidor.medir('esquema.grafo_fk', snapshot.fk_graph)
+
+        anomalias = DataAnomalyService(engine, snapshot)
+        medidor.medir('anomalias.tablas_aisladas', anomalias.get_isolated_tables)
+        medidor.medir('anomalias.claves_foraneas_falsas', anomalias.get_false_fks)
+        medidor.medir('anomalias.ciclos_claves_foraneas', anomalias.get_fk_cycles)
+        medidor.medir('anomalias.cascadas_profundas', anomalias.get_deep_cascades)
+
+        integridad = IntegridadReferencialService(engine, snapshot)
+        medidor.medir('integridad.anomalias', integridad.verificar_integridad_referencial)
+        medidor.medir('integridad.acciones_definidas', integridad.verificar_acciones_definidas)
+
+        relacional = IntegridadReferencialRelacionalService(engine, snapshot)
+        medidor.medir('relacional.nombres', relacional.analyze_referential_relationships)
+
+        if args.filas:
+            relacional_datos = IntegridadReferencialRelacionalService(engine, snapshot, 'datos')
+            medidor.medir('relacional.datos', relacional_datos.analyze_referential_relationships)
+            medidor.medir('huerfanos.declaradas', OrphanScanService(engine, snapshot).scan, 'declaradas')
+            # Sin caché: se mide la consulta agregada por tabla, no la lectura de la caché
+            medidor.medir('perfilado.columnas', ColumnProfileService(engine, snapshot, use_cache=False).profile)
+
+        if args.operaciones:
+            bench_auditoria(medidor, engine, args.operaciones)
+        engine.dispose()
+
+    resultado = {
+        "commit": commit_actual(),
+        "fecha": datetime.now().isoformat(timespec='seconds'),
+        "parametros": {clave: valor for clave, valor in vars(args).items()
+                       if clave not in ('salida', 'comparar', 'umbral')},
+        "fases": medidor.fases,
+    }
+    os.makedirs(args.salida, exist_ok=True)
+    archivo = os.path.join(args.salida, f"{datetime.now():%Y%m%d_%H%M%S}_{resultado['commit'] or 'local'}.json")
+    with open(archivo, 'w', encoding='utf-8') as f:
+        json.dump(resultado, f, indent=1)
+    print(f"\nResultados guardados en {archivo}")
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as f:
+            anterior = json.load(f)
+        if anterior.get("parametros") != resultado["parametros"]:
+            print("Aviso: los parámetros de las dos ejecuciones no coinciden")
+        if comparar(resultado, anterior, args.umbral):
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
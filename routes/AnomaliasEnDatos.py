@@ -1,40 +1,101 @@
 # routes/AnomaliasEnDatos.py
 
-from flask import Blueprint, request, jsonify
-from sqlalchemy import create_engine
+from flask import Blueprint, Response, request, jsonify
 from sqlalchemy.exc import SQLAlchemyError
 
-from services.DataAnomaly import check_data_anomalies
+from services.ColumnProfileService import profile_columns
+from services.DataAnomaly import check_data_anomalies, iter_data_anomalies
+from services.EngineRegistry import engine_registry
+from services.IncrementalAnalysis import analizar_incremental, es_incremental
+from services.RunStore import run_store
+from services.SchemaCache import get_schema_snapshot
+from services.Streaming import a_ndjson, es_streaming
+from routes.TrabajosRoute import es_asincrono, encolar_trabajo
 
 anomalia_en_datos = Blueprint('anomalia_en_datos', __name__, url_prefix='/auditoria')
 
-def get_connection_string(request):
+def get_engine(request):
     server = request.form.get('server')
     database = request.form.get('database')
     username = request.form.get('username')
     password = request.form.get('password')
-    return f"mssql+pymssql://{username}:{password}@{server}/{database}"
+    return engine_registry.get_engine(server, database, username, password)
+
+def es_perfilado(request):
+    return str(request.form.get('perfilado', '')).lower() in ('1', 'true', 'si')
+
+def analizar_anomalias(engine, incremental=False, perfilar=False):
+    if incremental:
+        anomalies, cambios, run_id, _ = analizar_incremental(engine, 'anomalias')
+        return {"status": "success", "run_id": run_id, "anomalies": anomalies, "cambios": cambios}
+    anomalies, logs, run_id = check_data_anomalies(engine, perfilar=perfilar)
+    return {"status": "success", "run_id": run_id, "anomalies": anomalies}
 
 @anomalia_en_datos.route('/check_anomalies', methods=['POST'])
 def check_anomalies():
-    connection_string = get_connection_string(request)
+    incremental, perfilar = es_incremental(request), es_perfilado(request)
+    if incremental and perfilar:
+        return jsonify({"status": "error", "message": "El análisis incremental no admite el perfilado de columnas"}), 400
+    if incremental and es_streaming(request):
+        return jsonify({"status": "error", "message": "El análisis incremental no admite la respuesta en streaming"}), 400
+    try:
+        engine = get_engine(request)
+        if es_asincrono(request):
+            return encolar_trabajo('check_anomalies', analizar_anomalias, engine, incremental, perfilar)
+        if es_streaming(request):
+            return Response(a_ndjson(iter_data_anomalies(engine, perfilar=perfilar)),
+                            mimetype='application/x-ndjson')
+        return jsonify(analizar_anomalias(engine, incremental, perfilar)), 200
+    except SQLAlchemyError as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+def perfilar_columnas(engine, **opciones):
+    return {"status": "success", "perfiles": profile_columns(engine, **opciones)}
+
+@anomalia_en_datos.route('/perfil_columnas', methods=['POST'])
+def perfil_columnas():
+    # Nulos, distintos, mínimo y máximo por columna, con una consulta agregada por tabla
+    opciones = {
+        "max_workers": request.form.get('max_workers', 4, type=int),
+        "sample_rows": request.form.get('muestra_filas', 1000000, type=int),
+        "sample_fraction": request.form.get('fraccion_muestra', None, type=float),
+        "query_timeout": request.form.get('timeout', 30, type=int),
+    }
+    if opciones["sample_fraction"] is not None and not 0 < opciones["sample_fraction"] <= 1:
+        return jsonify({"status": "error", "message": "La fracción de muestra debe estar entre 0 y 1"}), 400
+    try:
+        engine = get_engine(request)
+        if es_asincrono(request):
+            return encolar_trabajo('perfil_columnas', perfilar_columnas, engine, **opciones)
+        return jsonify(perfilar_columnas(engine, **opciones)), 200
+    except SQLAlchemyError as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
 
+@anomalia_en_datos.route('/grafo_fk', methods=['POST'])
+def grafo_fk():
+    # Grados, ciclos, orden de carga y profundidad de cascada del grafo de claves foráneas
     try:
-        engine = create_engine(connection_string)
-        anomalies, logs = check_data_anomalies(engine)
-        return jsonify({"status": "success", "anomalies": anomalies}), 200
+        engine = get_engine(request)
+        return jsonify({"status": "success", "grafo": get_schema_snapshot(engine).fk_graph().resumen()}), 200
     except SQLAlchemyError as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
 @anomalia_en_datos.route('/get_anomaly_logs', methods=['POST'])
 def get_anomaly_logs():
-    connection_string = get_connection_string(request)
+    run_id = request.form.get('run_id')
+    if run_id:
+        # Los logs de una corrida previa se leen del almacén, sin volver a analizar la base
+        corrida = run_store.obtener_logs(run_id)
+        if corrida is None:
+            return jsonify({"status": "error", "logs": f"Corrida {run_id} no encontrada o expirada"}), 404
+        return jsonify({"status": "success", "run_id": run_id, "logs": corrida["logs"]}), 200
 
     try:
-        engine = create_engine(connection_string)
-        _, logs = check_data_anomalies(engine)
+        engine = get_engine(request)
+        _, logs, run_id = check_data_anomalies(engine)
         return jsonify({
             "status": "success",
+            "run_id": run_id,
             "logs": logs
         }), 200
     except SQLAlchemyError as e:
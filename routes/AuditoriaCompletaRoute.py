@@ -0,0 +1,51 @@
+# routes/AuditoriaCompletaRoute.py
+
+from flask import Blueprint, request, jsonify
+from sqlalchemy.exc import SQLAlchemyError
+
+from services.EngineRegistry import engine_registry
+from services.UnifiedAuditService import ANALISIS, UnifiedAuditService
+from routes.TrabajosRoute import es_asincrono, encolar_trabajo
+
+auditoria_completa = Blueprint('auditoria_completa', __name__, url_prefix='/auditoria_completa')
+
+def get_engine(request):
+    server = request.form.get('server')
+    database = request.form.get('database')
+    username = request.form.get('username')
+    password = request.form.get('password')
+    return engine_registry.get_engine(server, database, username, password)
+
+def get_secciones(request):
+    # Acepta 'secciones=anomalias,relaciones' o el campo repetido; sin valor se ejecutan todas
+    secciones = [s.strip() for valor in request.form.getlist('secciones') for s in valor.split(',') if s.strip()]
+    return secciones or list(ANALISIS)
+
+@auditoria_completa.route('/check', methods=['POST'])
+def check_auditoria_completa():
+    modo = request.form.get('modo', 'nombres')
+    if modo not in ('nombres', 'datos'):
+        return jsonify({"status": "error", "message": "Modo no válido, use 'nombres' o 'datos'"}), 400
+    try:
+        service = UnifiedAuditService(
+            get_engine(request),
+            get_secciones(request),
+            opciones={
+                'anomalias': {'perfilar': str(request.form.get('perfilado', '')).lower() in ('1', 'true', 'si')},
+                'relaciones': {'modo_descubrimiento': modo},
+            },
+            detalle=str(request.form.get('detalle', '1')).lower() in ('1', 'true', 'si'),
+        )
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    try:
+        if es_asincrono(request):
+            return encolar_trabajo('auditoria_completa', service.ejecutar)
+        return jsonify({"status": "success", **service.ejecutar()}), 200
+
+    except SQLAlchemyError as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
@@ -0,0 +1,123 @@
+# routes/AuditoriaRoute.py
+
+import json
+from datetime import datetime, timedelta
+
+import click
+from flask import Blueprint, request, jsonify
+from sqlalchemy.exc import SQLAlchemyError
+
+from Models.AuditModel import AuditModel
+
+auditoria_dml = Blueprint('auditoria_dml', __name__, url_prefix='/auditoria_dml')
+
+def get_datos(request):
+    return request.get_json(silent=True) or request.form
+
+def get_audit_model(datos):
+    return AuditModel(datos.get('server'), datos.get('database'), datos.get('username'), datos.get('password'),
+                      modo_trigger=datos.get('modo_trigger') or 'completo')
+
+def get_lote(request):
+    datos = request.get_json(silent=True)
+    if datos is None:
+        # Formulario: 'consultas' se repite una vez por sentencia y 'filas' viaja como texto JSON
+        consultas = request.form.getlist('consultas')
+        try:
+            filas = json.loads(request.form['filas']) if request.form.get('filas') else []
+        except ValueError:
+            raise ValueError("'filas' debe ser una lista JSON de objetos")
+        datos = request.form
+    else:
+        consultas = datos.get('consultas') or []
+        filas = datos.get('filas') or []
+
+    if not isinstance(consultas, list) or not all(isinstance(c, str) for c in consultas):
+        raise ValueError("'consultas' debe ser una lista de sentencias SQL")
+    if not isinstance(filas, list) or not all(isinstance(f, dict) for f in filas):
+        raise ValueError("'filas' debe ser una lista de objetos")
+    try:
+        tamano_commit = int(datos.get('tamano_commit', 1000))
+    except (TypeError, ValueError):
+        raise ValueError("'tamano_commit' debe ser un número entero")
+    if tamano_commit < 1:
+        raise ValueError("'tamano_commit' debe ser mayor que cero")
+    return datos, consultas, filas, tamano_commit
+
+@auditoria_dml.route('/lote', methods=['POST'])
+def auditar_lote():
+    try:
+        datos, consultas, filas, tamano_commit = get_lote(request)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    if not consultas and not filas:
+        return jsonify({"status": "error", "message": "Debe enviar 'consultas' o 'filas'"}), 400
+
+    try:
+        model = get_audit_model(datos)
+        resultado = model.auditar_lote(consultas, filas, tamano_commit=tamano_commit)
+        status_code = 200 if resultado["status"] == "success" else 400
+        return jsonify(resultado), status_code
+    except SQLAlchemyError as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@auditoria_dml.route('/log', methods=['POST'])
+def consultar_log():
+    datos = get_datos(request)
+    columnas = datos.get('columnas')
+    if isinstance(columnas, str):
+        columnas = [c.strip() for c in columnas.split(',') if c.strip()]
+
+    try:
+        desde = datetime.fromisoformat(datos['desde']) if datos.get('desde') else None
+        hasta = datetime.fromisoformat(datos['hasta']) if datos.get('hasta') else None
+        model = get_audit_model(datos)
+        resultado = model.consultar_log(
+            tabla=datos.get('tabla'),
+            operacion=datos.get('operacion'),
+            usuario=datos.get('usuario'),
+            desde=desde,
+            hasta=hasta,
+            columnas=columnas,
+            limite=datos.get('limite', 100),
+            cursor=datos.get('cursor'),
+            incluir_archivo=str(datos.get('incluir_archivo', '')).lower() in ('1', 'true', 'si'),
+            decodificar=str(datos.get('decodificar', '')).lower() in ('1', 'true', 'si'),
+        )
+        return jsonify({"status": "success", **resultado}), 200
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except SQLAlchemyError as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@auditoria_dml.route('/archivar', methods=['POST'])
+def archivar_log():
+    datos = get_datos(request)
+
+    try:
+        if datos.get('antes_de'):
+            antes_de = datetime.fromisoformat(datos['antes_de'])
+        else:
+            antes_de = datetime.now() - timedelta(days=int(datos.get('dias_retencion', 90)))
+        model = get_audit_model(datos)
+        resultado = model.archivar_log(
+            antes_de,
+            tamano_lote=int(datos.get('tamano_lote', 5000)),
+            ventana=datos.get('ventana', 'dia'),
+            max_lotes=int(datos['max_lotes']) if datos.get('max_lotes') else None,
+        )
+        return jsonify({"status": "success", "antes_de": antes_de.isoformat(), **resultado}), 200
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except (SQLAlchemyError, OSError) as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@auditoria_dml.cli.command('migrar')
+@click.option('--server', required=True)
+@click.option('--database', required=True)
+@click.option('--username')
+@click.option('--password', envvar='AUDITORIA_PASSWORD')
+def migrar_auditoria_cli(server, database, username, password):
+    # Adapta auditoria_log creadas con versiones anteriores: columnas indexables e índices nuevos
+    creados = AuditModel(server, database, username, password).migrar_tabla_auditoria()
+    click.echo(f"Índices creados: {', '.join(creados)}" if creados else "auditoria_log ya está migrada")
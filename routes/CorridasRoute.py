@@ -0,0 +1,24 @@
+# routes/CorridasRoute.py
+
+from flask import Blueprint, jsonify
+
+from services.RunStore import run_store
+
+corridas = Blueprint('corridas', __name__, url_prefix='/corridas')
+
+def corrida_no_encontrada(run_id):
+    return jsonify({"status": "error", "message": f"Corrida {run_id} no encontrada o expirada"}), 404
+
+@corridas.route('/<run_id>', methods=['GET'])
+def obtener_corrida(run_id):
+    corrida = run_store.obtener(run_id)
+    if corrida is None:
+        return corrida_no_encontrada(run_id)
+    return jsonify({"status": "success", **corrida}), 200
+
+@corridas.route('/<run_id>/logs', methods=['GET'])
+def obtener_logs_corrida(run_id):
+    corrida = run_store.obtener_logs(run_id)
+    if corrida is None:
+        return corrida_no_encontrada(run_id)
+    return jsonify({"status": "success", **corrida}), 200
@@ -0,0 +1,65 @@
+# routes/FlotaRoute.py
+
+import json
+
+import click
+from flask import Blueprint, Response, request, jsonify
+
+from services.FleetAnalysisService import ANALISIS, FleetAnalysisService
+from services.Streaming import a_ndjson
+
+flota = Blueprint('flota', __name__, url_prefix='/flota')
+
+def get_objetivos(datos):
+    # Objetivos explícitos, o un servidor cuyas bases se descubren con sys.databases
+    objetivos = datos.get('objetivos') or []
+    if not objetivos and datos.get('server'):
+        bases = datos.get('databases') or ['*']
+        objetivos = [{"server": datos['server'], "database": base, "username": datos.get('username'),
+                      "password": datos.get('password')} for base in bases]
+    return objetivos
+
+@flota.route('/analizar', methods=['POST'])
+def analizar_flota():
+    datos = request.get_json(silent=True) or {}
+    # Las URLs de conexión arbitrarias solo se aceptan desde la CLI
+    objetivos = [{k: v for k, v in objetivo.items() if k != 'url'} for objetivo in get_objetivos(datos)]
+    if not objetivos:
+        return jsonify({"status": "error", "message": "Debe enviar 'objetivos' o un 'server'"}), 400
+
+    try:
+        service = FleetAnalysisService(
+            objetivos,
+            analisis=datos.get('analisis') or tuple(ANALISIS),
+            max_workers=int(datos.get('max_workers', 8)),
+            max_por_servidor=int(datos.get('max_por_servidor', 2)),
+            detalle=bool(datos.get('detalle', False)),
+        )
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    return Response(a_ndjson(service.iter_resultados()), mimetype='application/x-ndjson')
+
+@flota.cli.command('analizar')
+@click.option('--objetivos', 'archivo', type=click.File('r'), help="Archivo JSON con la lista de objetivos")
+@click.option('--server', help="Servidor cuyas bases se analizan")
+@click.option('--database', 'databases', multiple=True, help="Base a analizar; sin valor se descubren todas")
+@click.option('--username')
+@click.option('--password', envvar='FLOTA_PASSWORD')
+@click.option('--analisis', multiple=True, type=click.Choice(list(ANALISIS)))
+@click.option('--max-workers', default=8, show_default=True, type=click.IntRange(min=1))
+@click.option('--max-por-servidor', default=2, show_default=True, type=click.IntRange(min=1))
+@click.option('--detalle', is_flag=True, help="Incluye el resultado completo de cada análisis")
+def analizar_flota_cli(archivo, server, databases, username, password, analisis, max_workers, max_por_servidor,
+                       detalle):
+    datos = {"objetivos": json.load(archivo) if archivo else [], "server": server, "databases": list(databases),
+             "username": username, "password": password}
+    objetivos = get_objetivos(datos)
+    if not objetivos:
+        raise click.UsageError("Debe indicar --objetivos o --server")
+    try:
+        service = FleetAnalysisService(objetivos, analisis=analisis or tuple(ANALISIS), max_workers=max_workers,
+                                       max_por_servidor=max_por_servidor, detalle=detalle)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    for linea in a_ndjson(service.iter_resultados()):
+        click.echo(linea, nl=False)
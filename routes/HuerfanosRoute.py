@@ -0,0 +1,40 @@
+# routes/HuerfanosRoute.py
+
+from flask import Blueprint, request, jsonify
+from sqlalchemy.exc import SQLAlchemyError
+
+from services.EngineRegistry import engine_registry
+from services.OrphanScanService import check_orphans
+
+huerfanos = Blueprint('huerfanos', __name__, url_prefix='/huerfanos')
+
+ORIGENES = ('declaradas', 'potenciales', 'ambas')
+
+def get_engine(request):
+    server = request.form.get('server')
+    database = request.form.get('database')
+    username = request.form.get('username')
+    password = request.form.get('password')
+    return engine_registry.get_engine(server, database, username, password)
+
+@huerfanos.route('/check', methods=['POST'])
+def check_huerfanos():
+    origen = request.form.get('origen', 'declaradas')
+    if origen not in ORIGENES:
+        return jsonify({"status": "error", "message": f"Origen no válido, use uno de: {', '.join(ORIGENES)}"}), 400
+
+    opciones = {
+        "chunk_size": request.form.get('chunk_size', 50000, type=int),
+        "sample_size": request.form.get('muestra', 10, type=int),
+        "query_timeout": request.form.get('timeout', 30, type=int),
+        "row_budget": request.form.get('max_filas', 5000000, type=int),
+    }
+    if opciones["chunk_size"] < 1 or opciones["query_timeout"] < 1:
+        return jsonify({"status": "error", "message": "chunk_size y timeout deben ser al menos 1"}), 400
+
+    try:
+        engine = get_engine(request)
+        resultado = check_orphans(engine, origen, **opciones)
+        return jsonify({"status": "success", "resultado": resultado}), 200
+    except SQLAlchemyError as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
@@ -1,30 +1,49 @@
 # routes/IntegridadReferencialRoute.py
 
-from flask import Blueprint, request, jsonify
-from sqlalchemy import create_engine
+from flask import Blueprint, Response, request, jsonify
 from sqlalchemy.exc import SQLAlchemyError
-from services.IntegridadReferencialService import check_integridad_referencial
+from services.EngineRegistry import engine_registry
+from services.IncrementalAnalysis import analizar_incremental, es_incremental
+from services.IntegridadReferencialService import check_integridad_referencial, iter_integridad_referencial
+from services.Streaming import a_ndjson, es_streaming
+from routes.TrabajosRoute import es_asincrono, encolar_trabajo
 
 integridad_referencial = Blueprint('integridad_referencial', __name__, url_prefix='/integridad_referencialgi')
 
-def get_connection_string(request):
+def get_engine(request):
     server = request.form.get('server')
     database = request.form.get('database')
     username = request.form.get('username')
     password = request.form.get('password')
-    return f"mssql+pymssql://{username}:{password}@{server}/{database}"
+    return engine_registry.get_engine(server, database, username, password)
+
+def analizar_integridad(engine, incremental=False):
+    if incremental:
+        result, cambios, run_id, _ = analizar_incremental(engine, 'integridad_referencial')
+        return {"status": "success", "run_id": run_id, "resultado": result, "cambios": cambios}
+    result, error, run_id = check_integridad_referencial(engine)
+    if error:
+        raise RuntimeError(error)
+    return {"status": "success", "run_id": run_id, "resultado": result}
 
 @integridad_referencial.route('/check', methods=['POST'])
 def check_integridad():
-    connection_string = get_connection_string(request)
-
+    if es_incremental(request) and es_streaming(request):
+        return jsonify({"status": "error", "message": "El análisis incremental no admite la respuesta en streaming"}), 400
     try:
-        engine = create_engine(connection_string)
-        result, error = check_integridad_referencial(engine)
+        engine = get_engine(request)
+        if es_asincrono(request):
+            return encolar_trabajo('integridad_referencial', analizar_integridad, engine, es_incremental(request))
+        if es_streaming(request):
+            return Response(a_ndjson(iter_integridad_referencial(engine)), mimetype='application/x-ndjson')
+        if es_incremental(request):
+            return jsonify(analizar_integridad(engine, incremental=True)), 200
+        result, error, run_id = check_integridad_referencial(engine)
         if error:
-            return jsonify({"status": "error", "message": error}), 500
+            return jsonify({"status": "error", "run_id": run_id, "message": error}), 500
         return jsonify({
             "status": "success",
+            "run_id": run_id,
             "resultado": result
         }), 200
     except SQLAlchemyError as e:
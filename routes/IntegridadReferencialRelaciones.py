@@ -1,27 +1,49 @@
-from flask import Blueprint, request, jsonify
-from sqlalchemy import create_engine
+from flask import Blueprint, Response, request, jsonify
 from sqlalchemy.exc import SQLAlchemyError
 
+from services.EngineRegistry import engine_registry
+from services.IncrementalAnalysis import analizar_incremental, es_incremental
+from services.Streaming import a_ndjson, es_streaming
+from routes.TrabajosRoute import es_asincrono, encolar_trabajo
+
 
 auditoria = Blueprint('auditoria', __name__, url_prefix='/integridad_relacional')
 
-def get_connection_string(request):
+def get_engine(request):
     server = request.form.get('server')
     database = request.form.get('database')
     username = request.form.get('username')
     password = request.form.get('password')
-    return f"mssql+pymssql://{username}:{password}@{server}/{database}"
+    return engine_registry.get_engine(server, database, username, password)
+
+def analizar_relaciones(engine, modo, incremental=False):
+    if incremental:
+        resultado, cambios, run_id, logs = analizar_incremental(engine, 'integridad_relacional')
+        return {"run_id": run_id, "resultado": resultado, "logs": logs, "cambios": cambios}
+    from services.IntegridadReferencialRelacionalService import check_relations
+    resultado, logs, run_id = check_relations(engine, modo_descubrimiento=modo)
+    return {"run_id": run_id, "resultado": resultado, "logs": logs}
 
 @auditoria.route('/check', methods=['POST'])
 def check_relaciones_referenciales():
     try:
-        connection_string = get_connection_string(request)
-        engine = create_engine(connection_string)
-
-        from services.IntegridadReferencialRelacionalService import check_relations
-        resultado, logs = check_relations(engine)
-
-        return jsonify({"resultado": resultado, "logs": logs}), 200
+        engine = get_engine(request)
+
+        modo = request.form.get('modo', 'nombres')
+        if modo not in ('nombres', 'datos'):
+            return jsonify({"error": "Modo no válido, use 'nombres' o 'datos'"}), 400
+        incremental = es_incremental(request)
+        if incremental and modo != 'nombres':
+            return jsonify({"error": "El análisis incremental solo admite el modo 'nombres'"}), 400
+        if incremental and es_streaming(request):
+            return jsonify({"error": "El análisis incremental no admite la respuesta en streaming"}), 400
+        if es_asincrono(request):
+            return encolar_trabajo('integridad_relacional', analizar_relaciones, engine, modo, incremental)
+        if es_streaming(request):
+            from services.IntegridadReferencialRelacionalService import iter_relations
+            return Response(a_ndjson(iter_relations(engine, modo_descubrimiento=modo)),
+                            mimetype='application/x-ndjson')
+        return jsonify(analizar_relaciones(engine, modo, incremental)), 200
 
     except SQLAlchemyError as e:
         return jsonify({"error": str(e)}), 500
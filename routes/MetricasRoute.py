@@ -0,0 +1,86 @@
+# routes/MetricasRoute.py
+
+import time
+
+from flask import Blueprint, Response, current_app, g, request
+from flask.json.provider import DefaultJSONProvider
+
+from services.ColumnProfileService import profile_cache
+from services.EngineRegistry import engine_registry
+from services.JobManager import job_manager
+from services.Metrics import PETICIONES, medir, medir_fase, registro_metricas
+from services.SchemaCache import schema_cache
+
+metricas = Blueprint('metricas', __name__)
+
+
+class JSONMedido(DefaultJSONProvider):
+    def dumps(self, obj, **kwargs):
+        with medir_fase('http.serializacion'):
+            return super().dumps(obj, **kwargs)
+
+
+@metricas.record_once
+def configurar(state):
+    # Las respuestas jsonify pasan por el proveedor JSON de la app: así se mide la serialización
+    state.app.json = JSONMedido(state.app)
+
+
+@registro_metricas.recolector
+def recolectar_estado():
+    cache = schema_cache.stats()
+    yield ('auditoria_cache_esquema_total', 'counter', "Lecturas de la caché de snapshots de esquema",
+           {"resultado": "acierto"}, cache["hits"])
+    yield ('auditoria_cache_esquema_total', 'counter', "Lecturas de la caché de snapshots de esquema",
+           {"resultado": "fallo"}, cache["misses"])
+    perfiles = profile_cache.stats()
+    yield ('auditoria_cache_perfiles_total', 'counter', "Lecturas de la caché de perfiles de columnas",
+           {"resultado": "acierto"}, perfiles["hits"])
+    yield ('auditoria_cache_perfiles_total', 'counter', "Lecturas de la caché de perfiles de columnas",
+           {"resultado": "fallo"}, perfiles["misses"])
+    yield ('auditoria_engines_activos', 'gauge', "Engines abiertos en el registro de conexiones",
+           {}, engine_registry.stats()["engines"])
+    for estado, cantidad in job_manager.stats()["estados"].items():
+        yield ('auditoria_trabajos', 'gauge', "Trabajos en memoria por estado", {"estado": estado}, cantidad)
+
+
+def pide_desglose():
+    valor = request.args.get('metricas') or request.form.get('metricas') or request.headers.get('X-Metricas', '')
+    return str(valor).lower() in ('1', 'true', 'si')
+
+
+@metricas.before_app_request
+def iniciar_medicion():
+    g.metricas_contexto = medir()
+    g.metricas_medicion = g.metricas_contexto.__enter__()
+
+
+@metricas.after_app_request
+def registrar_peticion(response):
+    medicion = g.get('metricas_medicion')
+    if medicion is None:
+        return response
+    # La regla de la ruta y no la URL: los ids no deben crear series nuevas
+    endpoint = request.url_rule.rule if request.url_rule is not None else 'desconocido'
+    PETICIONES.observar(time.perf_counter() - medicion.inicio, endpoint=endpoint, metodo=request.method,
+                        estado=response.status_code)
+    if pide_desglose() and request.endpoint != 'metricas.exponer_metricas':
+        response.headers['Server-Timing'] = medicion.server_timing()
+        if response.is_json and not response.is_streamed:
+            datos = response.get_json(silent=True)
+            if isinstance(datos, dict):
+                datos["metricas"] = medicion.to_dict()
+                response.set_data(current_app.json.dumps(datos))
+    return response
+
+
+@metricas.teardown_app_request
+def cerrar_medicion(error):
+    contexto = g.pop('metricas_contexto', None)
+    if contexto is not None:
+        contexto.__exit__(None, None, None)
+
+
+@metricas.route('/metrics', methods=['GET'])
+def exponer_metricas():
+    return Response(registro_metricas.exponer(), mimetype='text/plain; version=0.0.4; charset=utf-8')
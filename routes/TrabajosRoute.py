@@ -0,0 +1,54 @@
+# routes/TrabajosRoute.py
+
+from flask import Blueprint, jsonify, url_for
+
+from services.JobManager import job_manager, ColaLlena, COMPLETADO, TERMINADOS
+
+trabajos = Blueprint('trabajos', __name__, url_prefix='/trabajos')
+
+def es_asincrono(request):
+    return str(request.form.get('async', '')).lower() in ('1', 'true', 'si')
+
+def encolar_trabajo(tipo, funcion, *args, **kwargs):
+    try:
+        trabajo = job_manager.enviar(tipo, funcion, *args, **kwargs)
+    except ColaLlena as e:
+        return jsonify({"status": "error", "message": str(e)}), 503
+    return jsonify({
+        "status": "accepted",
+        "trabajo_id": trabajo.id,
+        "estado_url": url_for('trabajos.estado_trabajo', trabajo_id=trabajo.id),
+        "resultado_url": url_for('trabajos.resultado_trabajo', trabajo_id=trabajo.id),
+    }), 202
+
+def trabajo_no_encontrado(trabajo_id):
+    return jsonify({"status": "error", "message": f"Trabajo {trabajo_id} no encontrado o expirado"}), 404
+
+@trabajos.route('', methods=['GET'])
+def listar_trabajos():
+    return jsonify({"status": "success", "trabajos": job_manager.listar(), "resumen": job_manager.stats()}), 200
+
+@trabajos.route('/<trabajo_id>', methods=['GET'])
+def estado_trabajo(trabajo_id):
+    trabajo = job_manager.obtener(trabajo_id)
+    if trabajo is None:
+        return trabajo_no_encontrado(trabajo_id)
+    return jsonify({"status": "success", "trabajo": trabajo.estado_dict()}), 200
+
+@trabajos.route('/<trabajo_id>/resultado', methods=['GET'])
+def resultado_trabajo(trabajo_id):
+    trabajo = job_manager.obtener(trabajo_id)
+    if trabajo is None:
+        return trabajo_no_encontrado(trabajo_id)
+    if trabajo.estado not in TERMINADOS:
+        return jsonify({"status": "pending", "trabajo": trabajo.estado_dict()}), 202
+    if trabajo.estado != COMPLETADO:
+        return jsonify({"status": "error", "trabajo": trabajo.estado_dict()}), 409
+    return jsonify(trabajo.resultado), 200
+
+@trabajos.route('/<trabajo_id>/cancelar', methods=['POST'])
+def cancelar_trabajo(trabajo_id):
+    trabajo = job_manager.cancelar(trabajo_id)
+    if trabajo is None:
+        return trabajo_no_encontrado(trabajo_id)
+    return jsonify({"status": "success", "trabajo": trabajo.estado_dict()}), 200
@@ -0,0 +1,284 @@
+# services/ColumnProfileService.py
+
+import contextvars
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from sqlalchemy import column, func, literal_column, select, table, text
+from sqlalchemy.exc import SQLAlchemyError
+
+from services.EngineRegistry import EngineRegistry, statement_timeout
+from services.JobManager import reportar_fase
+from services.Metrics import medir_fase
+from services.SchemaCache import get_schema_snapshot
+from services.SchemaSnapshot import type_family
+
+# Familias con orden total: admiten MIN, MAX y conteo de distintos
+ORDENABLES = ('entero', 'decimal', 'texto', 'fecha', 'uuid')
+# Tipos heredados sobre los que SQL Server no permite MIN, MAX ni DISTINCT
+NO_COMPARABLES = ('text', 'ntext', 'image', 'xml', 'sql_variant', 'geography', 'geometry', 'hierarchyid')
+
+MSSQL_ROW_COUNTS_QUERY = text("""
+SELECT t.name, SUM(p.rows)
+FROM sys.tables t
+JOIN sys.partitions p ON p.object_id = t.object_id AND p.index_id IN (0, 1)
+WHERE t.schema_id = SCHEMA_ID() AND t.is_ms_shipped = 0
+GROUP BY t.name
+""")
+
+
+def estimate_row_counts(engine):
+    # Conteos de filas del catálogo, sin recorrer las tablas; solo SQL Server los ofrece baratos
+    if engine.dialect.name != 'mssql':
+        return {}
+    with engine.connect() as conn:
+        return {name: int(rows or 0) for name, rows in conn.execute(MSSQL_ROW_COUNTS_QUERY)}
+
+
+def _json_value(value):
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+
+class ColumnProfile:
+    __slots__ = ('table', 'column', 'family', 'nullable', 'rows', 'nulls', 'distinct', 'approximate', 'min', 'max')
+
+    def __init__(self, table_name, column_name, family, nullable):
+        self.table = table_name
+        self.column = column_name
+        self.family = family
+        self.nullable = nullable
+        self.rows = 0
+        self.nulls = 0
+        self.distinct = None
+        self.approximate = False
+        self.min = None
+        self.max = None
+
+    def null_ratio(self):
+        return self.nulls / self.rows if self.rows else None
+
+    def to_dict(self):
+        ratio = self.null_ratio()
+        return {
+            "columna": self.column,
+            "familia": self.family,
+            "nullable": self.nullable,
+            "nulos": self.nulls,
+            "proporcion_nulos": round(ratio, 4) if ratio is not None else None,
+            "distintos": self.distinct,
+            "distintos_aproximado": self.approximate,
+            "min": _json_value(self.min),
+            "max": _json_value(self.max),
+        }
+
+
+class TableProfile:
+    __slots__ = ('table', 'columns', 'rows', 'estimated_rows', 'sample', 'error', 'time')
+
+    def __init__(self, table_name, estimated_rows=None):
+        self.table = table_name
+        self.columns = []
+        self.rows = 0
+        self.estimated_rows = estimated_rows
+        # None: lectura completa; 'tablesample' o 'limite' cuando solo se leyó una parte
+        self.sample = None
+        self.error = None
+        self.time = 0.0
+
+    def to_dict(self):
+        return {
+            "tabla": self.table,
+            "filas": self.rows,
+            "filas_estimadas": self.estimated_rows,
+            "muestra": self.sample,
+            "error": self.error,
+            "tiempo": round(self.time, 4),
+            "columnas": [profile.to_dict() for profile in self.columns],
+        }
+
+
+class ColumnProfileCache:
+    # Perfiles por (base, huella del esquema, opciones); el TTL acota lo desactualizados que pueden estar los datos
+    def __init__(self, max_entries=16, ttl=900):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[1] <= self.ttl:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return entry[0]
+            self._entries.pop(key, None)
+            self.misses += 1
+            return None
+
+    def put(self, key, profiles):
+        with self._lock:
+            self._entries[key] = (profiles, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, engine=None):
+        with self._lock:
+            if engine is None:
+                self._entries.clear()
+                return
+            url_key = EngineRegistry.make_key(engine.url)
+            for key in [key for key in self._entries if key[0] == url_key]:
+                del self._entries[key]
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "max_entries": self.max_entries, "ttl": self.ttl,
+                    "hits": self.hits, "misses": self.misses}
+
+
+profile_cache = ColumnProfileCache(
+    max_entries=int(os.environ.get('PERFIL_CACHE_MAX_ENTRIES', 16)),
+    ttl=int(os.environ.get('PERFIL_CACHE_TTL', 900)),
+)
+
+
+class ColumnProfileService:
+    def __init__(self, engine, snapshot=None, max_workers=4, sample_rows=1000000, sample_fraction=None,
+                 query_timeout=30, max_columns_per_query=250, use_cache=True):
+        self.engine = engine
+        self.snapshot = snapshot if snapshot is not None else get_schema_snapshot(engine)
+        self.max_workers = max_workers
+        self.sample_rows = sample_rows
+        self.sample_fraction = sample_fraction
+        self.query_timeout = query_timeout
+        self.max_columns_per_query = max_columns_per_query
+        self.use_cache = use_cache
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.INFO)
+
+    def _approximate_distinct(self):
+        # APPROX_COUNT_DISTINCT existe desde SQL Server 2019 (versión 15)
+        version = getattr(self.engine.dialect, 'server_version_info', None) or (0,)
+        return self.engine.dialect.name == 'mssql' and version[0] >= 15
+
+    def row_estimates(self):
+        return estimate_row_counts(self.engine)
+
+    def _source(self, table_name, column_names, estimated_rows):
+        source = table(table_name, *[column(name) for name in column_names])
+        if self.engine.dialect.name == 'mssql':
+            if estimated_rows is None or estimated_rows <= self.sample_rows:
+                return source, None
+            fraction = self.sample_fraction or self.sample_rows / estimated_rows
+            # TABLESAMPLE lee páginas completas al azar: no recorre la tabla entera como TOP + ORDER BY
+            return source.tablesample(func.system(literal_column(f"{fraction * 100:.6f} PERCENT"))), 'tablesample'
+        # Sin TABLESAMPLE portable: se agregan como mucho sample_rows filas
+        return select(*source.c).limit(self.sample_rows).subquery(), 'limite'
+
+    def _aggregates(self, source, profiles, approximate):
+        aggregates = [func.count().label('filas')]
+        for index, profile in enumerate(profiles):
+            value = source.c[profile.column]
+            aggregates.append(func.count(value).label(f"n{index}"))
+            if profile.family in ORDENABLES:
+                distinct = func.approx_count_distinct(value) if approximate else func.count(value.distinct())
+                aggregates.extend([distinct.label(f"d{index}"), func.min(value).label(f"mn{index}"),
+                                   func.max(value).label(f"mx{index}")])
+        return select(*aggregates).select_from(source)
+
+    @medir_fase('perfilado.tabla')
+    def profile_table(self, table_name, estimated_rows=None):
+        start = time.perf_counter()
+        table_profile = TableProfile(table_name, estimated_rows)
+        table_info = self.snapshot.tables[table_name]
+        profiles = []
+        for column_info in table_info.columns:
+            family = type_family(column_info.type)
+            if column_info.type in NO_COMPARABLES:
+                family = 'otro'
+            profiles.append(ColumnProfile(table_name, column_info.name, family, column_info.nullable))
+        table_profile.columns = profiles
+
+        approximate = self._approximate_distinct()
+        try:
+            with self.engine.connect() as conn, statement_timeout(conn, self.query_timeout):
+                # Una consulta agregada por tabla; las tablas muy anchas se parten en grupos de columnas
+                for offset in range(0, len(profiles), self.max_columns_per_query):
+                    group = profiles[offset:offset + self.max_columns_per_query]
+                    source, sample = self._source(table_name, [p.column for p in group], estimated_rows)
+                    row = conn.execute(self._aggregates(source, group, approximate)).mappings().one()
+                    table_profile.rows = row['filas']
+                    table_profile.sample = sample
+                    for index, profile in enumerate(group):
+                        profile.rows = row['filas']
+                        profile.nulls = row['filas'] - row[f"n{index}"]
+                        if profile.family in ORDENABLES:
+                            profile.distinct = row[f"d{index}"]
+                            profile.approximate = approximate
+                            profile.min = row[f"mn{index}"]
+                            profile.max = row[f"mx{index}"]
+            if table_profile.sample == 'limite' and table_profile.rows < self.sample_rows:
+                # La tabla entera cupo en el límite: el perfil es exacto
+                table_profile.sample = None
+        except SQLAlchemyError as e:
+            self.logger.error(f"No se pudo perfilar la tabla {table_name}: {str(e)}")
+            table_profile.error = str(e)
+        table_profile.time = time.perf_counter() - start
+        return table_profile
+
+    def _cache_key(self):
+        if not self.use_cache or self.snapshot.fingerprint is None:
+            return None
+        return (EngineRegistry.make_key(self.engine.url), self.snapshot.fingerprint, self.sample_rows,
+                self.sample_fraction)
+
+    @medir_fase('perfilado')
+    def profile(self):
+        key = self._cache_key()
+        if key is not None:
+            cached = profile_cache.get(key)
+            if cached is not None:
+                self.logger.info(f"Perfiles de columnas tomados de la caché ({len(cached)} tablas)")
+                return cached
+
+        start = time.perf_counter()
+        estimates = self.row_estimates()
+        table_names = [name for name, table_info in self.snapshot.tables.items() if table_info.columns]
+        pool_size = self.engine.pool.size() if hasattr(self.engine.pool, 'overflow') else self.max_workers
+        workers = max(1, min(self.max_workers, pool_size, len(table_names) or 1))
+        profiles = {}
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='perfilado') as executor:
+            futures = [executor.submit(contextvars.copy_context().run, self.profile_table, name, estimates.get(name))
+                       for name in table_names]
+            for index, future in enumerate(as_completed(futures)):
+                reportar_fase('perfilado', index + 1, len(futures))
+                table_profile = future.result()
+                profiles[table_profile.table] = table_profile
+        # Mismo orden que el snapshot, no el de llegada
+        profiles = {name: profiles[name] for name in table_names}
+
+        errors = sum(1 for table_profile in profiles.values() if table_profile.error)
+        self.logger.info(f"Perfiladas {len(profiles)} tablas con {workers} hilos en "
+                         f"{time.perf_counter() - start:.3f}s ({errors} con error)")
+        if key is not None and not errors:
+            profile_cache.put(key, profiles)
+        return profiles
+
+
+def profile_columns(engine, snapshot=None, **options):
+    profiles = ColumnProfileService(engine, snapshot, **options).profile()
+    return {
+        "tablas": [table_profile.to_dict() for table_profile in profiles.values()],
+        "tablas_muestreadas": sum(1 for table_profile in profiles.values() if table_profile.sample),
+        "errores": sum(1 for table_profile in profiles.values() if table_profile.error),
+    }
@@ -1,20 +1,29 @@
-import io
 import logging
-from sqlalchemy import inspect, MetaData
+import os
+
 from sqlalchemy.exc import SQLAlchemyError
 
+from services.ColumnProfileService import ColumnProfileService
+from services.JobManager import reportar_fase
+from services.LogCapture import capturar_logs, logs_actuales
+from services.Metrics import medir_fase
+from services.RunStore import run_store
+from services.SchemaCache import get_schema_snapshot
+from services.SchemaSnapshot import type_family
+from services.Streaming import generador_aislado
 
-class MemoryHandler(logging.Handler):
-    def __init__(self):
-        super().__init__()
-        self.log_stream = io.StringIO()
+MAX_CASCADA = int(os.environ.get('ANOMALIAS_MAX_CASCADA', 3))
 
-    def emit(self, record):
-        msg = self.format(record)
-        self.log_stream.write(msg + '\n')
+MIN_FILAS_PERFIL = int(os.environ.get('ANOMALIAS_MIN_FILAS_PERFIL', 100))
 
-    def get_logs(self):
-        return self.log_stream.getvalue()
+SECCIONES = ("tablas_aisladas", "claves_foraneas_falsas", "ciclos_claves_foraneas", "cascadas_profundas")
+# Solo con perfilado: requiere leer datos y no solo el catálogo
+SECCION_PERFIL = "calidad_datos"
+
+# Familias de tipo que suelen usarse como clave; decimales y fechas únicos son casualidad más que clave
+FAMILIAS_CLAVE = ('entero', 'texto', 'uuid')
+# APPROX_COUNT_DISTINCT tiene un error típico de hasta el 2 %
+UMBRAL_DISTINTOS_APROXIMADO = 0.98
 
 
 class DataAnomaly:
@@ -34,112 +43,267 @@ class DataAnomaly:
 
 
 class DataAnomalyService:
-    def __init__(self, engine):
+    def __init__(self, engine, snapshot=None, max_cascade_depth=MAX_CASCADA, min_profile_rows=MIN_FILAS_PERFIL):
         self.engine = engine
-        self.inspector = inspect(engine)
-        self.metadata = MetaData()
-        self.metadata.reflect(bind=engine)
+        self.max_cascade_depth = max_cascade_depth
+        self.min_profile_rows = min_profile_rows
 
         self.logger = logging.getLogger(__name__)
         self.logger.setLevel(logging.INFO)
-        self.memory_handler = MemoryHandler()
-        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-        self.memory_handler.setFormatter(formatter)
-        self.logger.addHandler(self.memory_handler)
 
+        self.snapshot = snapshot if snapshot is not None else get_schema_snapshot(engine)
         self.logger.info("DataAnomalyService inicializado")
 
     def get_logs(self):
-        return self.memory_handler.get_logs()
+        return logs_actuales()
 
     def get_all_columns(self):
         self.logger.info("Obteniendo todas las columnas")
-        columns = []
-        for table_name in self.inspector.get_table_names():
-            for column in self.inspector.get_columns(table_name):
-                columns.append((table_name, column['name']))
+        columns = [(table_name, column.name) for table_name, column in self.snapshot.iter_columns()]
         self.logger.info(f"Se obtuvieron {len(columns)} columnas")
         return columns
 
     def get_all_pk_columns(self):
         self.logger.info("Obteniendo todas las columnas de clave primaria")
-        pk_columns = []
-        for table_name in self.inspector.get_table_names():
-            pks = self.inspector.get_pk_constraint(table_name)
-            if pks['constrained_columns']:
-                for pk in pks['constrained_columns']:
-                    pk_columns.append((table_name, pk))
+        pk_columns = list(self.snapshot.iter_primary_keys())
         self.logger.info(f"Se obtuvieron {len(pk_columns)} columnas de clave primaria")
         return pk_columns
 
     def get_all_fk_columns(self):
         self.logger.info("Obteniendo todas las columnas de clave foránea")
-        fk_columns = []
-        for table_name in self.inspector.get_table_names():
-            for fk in self.inspector.get_foreign_keys(table_name):
-                for fk_col in fk['constrained_columns']:
-                    fk_columns.append((table_name, fk_col))
+        fk_columns = [(fk.table, fk_col)
+                      for fk in self.snapshot.iter_foreign_keys()
+                      for fk_col in fk.constrained_columns]
         self.logger.info(f"Se obtuvieron {len(fk_columns)} columnas de clave foránea")
         return fk_columns
 
+    def isolated_table(self, table_name):
+        # Aislada: no referencia a ninguna tabla ni es referenciada por ninguna (entrada y salida en cero)
+        graph = self.snapshot.fk_graph()
+        if self.snapshot.tables[table_name].columns and graph.es_desconectada(graph.indice[table_name]):
+            return DataAnomaly("Tabla Aislada", table_name,
+                               details="Esta tabla no referencia ni es referenciada por ninguna clave foránea")
+        return None
+
+    def iter_isolated_tables(self):
+        for table in self.snapshot.fk_graph().iter_desconectadas():
+            anomaly = self.isolated_table(table)
+            if anomaly is not None:
+                yield anomaly
+
+    @medir_fase('anomalias.tablas_aisladas')
     def get_isolated_tables(self):
         self.logger.info("Buscando tablas aisladas")
-        all_columns = set(self.get_all_columns())
-        fk_columns = set(self.get_all_fk_columns())
+        isolated_tables = list(self.iter_isolated_tables())
+        self.logger.info(f"Se encontraron {len(isolated_tables)} tablas aisladas")
+        return isolated_tables
 
-        referenced_tables = set()
-        for table, _ in fk_columns:
-            referenced_tables.add(table)
+    def iter_fk_cycles(self):
+        # Las autorreferencias (p. ej. empleado.jefe_id) son habituales y no impiden un orden de carga
+        for cycle in self.snapshot.fk_graph().iter_ciclos():
+            if len(cycle) > 1:
+                yield DataAnomaly("Ciclo de Claves Foráneas", cycle[0],
+                                  details=f"Las tablas {', '.join(cycle)} se referencian en ciclo: "
+                                          f"no existe un orden de carga sin desactivar restricciones")
 
-        isolated_tables = []
-        for table, _ in all_columns:
-            if table not in referenced_tables and table not in isolated_tables:
-                isolated_tables.append(table)
+    @medir_fase('anomalias.ciclos_claves_foraneas')
+    def get_fk_cycles(self):
+        self.logger.info("Buscando ciclos de claves foráneas")
+        cycles = list(self.iter_fk_cycles())
+        self.logger.info(f"Se encontraron {len(cycles)} ciclos de claves foráneas")
+        return cycles
 
-        self.logger.info(f"Se encontraron {len(isolated_tables)} tablas aisladas")
-        return [DataAnomaly("Tabla Aislada", table, details="Esta tabla no está referenciada por ninguna clave foránea")
-                for table in isolated_tables]
+    def iter_deep_cascades(self):
+        graph = self.snapshot.fk_graph()
+        depths, _, cyclic = graph.cascadas()
+        for i, table in enumerate(graph.nombres):
+            if cyclic[i]:
+                yield DataAnomaly("Cascada Cíclica", table,
+                                  details="Borrar una fila de esta tabla dispara un ciclo de ON DELETE CASCADE")
+            elif depths[i] > self.max_cascade_depth:
+                yield DataAnomaly("Cascada Profunda", table,
+                                  details=f"Borrar una fila de esta tabla propaga ON DELETE CASCADE {depths[i]} "
+                                          f"niveles: {' -> '.join(graph.cadena_cascada(i))}")
 
-    def get_false_fks(self):
-        self.logger.info("Buscando claves foráneas falsas")
-        all_columns = set(self.get_all_columns())
-        pk_columns = set(self.get_all_pk_columns())
+    @medir_fase('anomalias.cascadas_profundas')
+    def get_deep_cascades(self):
+        self.logger.info("Buscando cascadas de borrado profundas")
+        cascades = list(self.iter_deep_cascades())
+        self.logger.info(f"Se encontraron {len(cascades)} cascadas profundas o cíclicas")
+        return cascades
+
+    def graph_findings(self):
+        # Ciclos y cascadas dependen de todo el grafo: no se pueden calcular tabla por tabla
+        return {
+            "ciclos_claves_foraneas": [anomaly.to_dict() for anomaly in self.iter_fk_cycles()],
+            "cascadas_profundas": [anomaly.to_dict() for anomaly in self.iter_deep_cascades()],
+        }
+
+    def profile_columns(self, **profile_options):
+        return ColumnProfileService(self.engine, self.snapshot, **profile_options).profile()
+
+    def iter_profile_anomalies(self, profiles):
+        for table_profile in profiles.values():
+            if table_profile.error or table_profile.rows < self.min_profile_rows:
+                continue
+            table_info = self.snapshot.tables[table_profile.table]
+            sample = " de la muestra" if table_profile.sample else ""
+            for profile in table_profile.columns:
+                if profile.nulls == profile.rows:
+                    yield DataAnomaly("Columna Sin Datos", profile.table, profile.column,
+                                      f"Las {profile.rows} filas{sample} tienen NULL en esta columna")
+                    continue
+                # Las columnas de la PK son NOT NULL aunque algunos motores las reflejen como nullable
+                if profile.nullable and profile.nulls == 0 and profile.column not in table_info.primary_key:
+                    yield DataAnomaly("Nullable Sin Nulos", profile.table, profile.column,
+                                      f"La columna admite NULL pero ninguna de las {profile.rows} filas{sample} "
+                                      f"lo contiene: podría declararse NOT NULL")
+                threshold = profile.rows * (UMBRAL_DISTINTOS_APROXIMADO if profile.approximate else 1)
+                if (profile.family in FAMILIAS_CLAVE and profile.nulls == 0 and profile.distinct is not None
+                        and profile.distinct >= threshold and not table_info.is_unique([profile.column])):
+                    yield DataAnomaly("Clave Candidata Sin Restricción", profile.table, profile.column,
+                                      f"Los {profile.rows} valores{sample} son distintos y no nulos, pero la columna "
+                                      f"no es clave primaria ni tiene una restricción UNIQUE")
+
+    @medir_fase('anomalias.calidad_datos')
+    def get_profile_anomalies(self, **profile_options):
+        self.logger.info("Perfilando columnas para buscar anomalías de calidad de datos")
+        profiles = self.profile_columns(**profile_options)
+        anomalies = list(self.iter_profile_anomalies(profiles))
+        self.logger.info(f"Se encontraron {len(anomalies)} anomalías de calidad de datos")
+        return anomalies
+
+    def build_column_index(self, exclude=()):
+        # nombre de columna -> [(tabla, columna)], una sola pasada sobre el snapshot
+        index = {}
+        for table_name, column in self.snapshot.iter_columns():
+            if (table_name, column.name) not in exclude:
+                index.setdefault(column.name, []).append((table_name, column))
+        return index
+
+    def is_false_fk_candidate(self, table_name, column_name, skip_primary_keys=False):
+        # Criterio común del análisis completo y del incremental: mismos hallazgos por ambos caminos
+        return not (skip_primary_keys and self.snapshot.tables[table_name].primary_key == (column_name,))
+
+    def iter_false_fks(self, check_types=False, skip_primary_keys=False):
         fk_columns = set(self.get_all_fk_columns())
+        column_index = self.build_column_index(exclude=fk_columns)
 
-        non_fk_columns = all_columns - fk_columns
-        false_fks = []
+        for pk_table_name, pk_col in self.get_all_pk_columns():
+            candidates = column_index.get(pk_col)
+            if not candidates:
+                continue
+            pk_table = self.snapshot.tables[pk_table_name]
+            pk_family = None
+            if check_types:
+                pk_column = next(column for column in pk_table.columns if column.name == pk_col)
+                pk_family = type_family(pk_column.type)
 
-        for pk_table, pk_col in pk_columns:
-            for table, col in non_fk_columns:
-                if col == pk_col and table != pk_table:
-                    false_fks.append(DataAnomaly("Clave Foránea Falsa", table, col,
-                                                 f"Esta columna podría hacer referencia a {pk_table}.{pk_col} pero no es una clave foránea"))
+            for table_name, column in candidates:
+                if table_name == pk_table_name:
+                    continue
+                if not self.is_false_fk_candidate(table_name, column.name, skip_primary_keys):
+                    continue
+                if check_types and type_family(column.type) != pk_family:
+                    continue
+                yield DataAnomaly("Clave Foránea Falsa", table_name, column.name,
+                                  f"Esta columna podría hacer referencia a {pk_table_name}.{pk_col} pero no es una clave foránea")
 
+    @medir_fase('anomalias.claves_foraneas_falsas')
+    def get_false_fks(self, check_types=False, skip_primary_keys=False):
+        self.logger.info("Buscando claves foráneas falsas")
+        false_fks = list(self.iter_false_fks(check_types, skip_primary_keys))
         self.logger.info(f"Se encontraron {len(false_fks)} claves foráneas falsas")
         return false_fks
 
-    def analyze_data_anomalies(self):
+    def build_pk_index(self):
+        # nombre de columna de PK -> tablas en las que forma parte de la PK
+        index = {}
+        for table_name, column_name in self.snapshot.iter_primary_keys():
+            index.setdefault(column_name, []).append(table_name)
+        return index
+
+    def table_findings(self, table_name, pk_index, skip_primary_keys=False):
+        # Hallazgos de una sola tabla, para recalcular solo lo que cambió en el esquema
+        table = self.snapshot.tables[table_name]
+        findings = {"tablas_aisladas": [], "claves_foraneas_falsas": []}
+        isolated = self.isolated_table(table_name)
+        if isolated is not None:
+            findings["tablas_aisladas"].append(isolated.to_dict())
+        fk_columns = {fk_col for fk in table.foreign_keys for fk_col in fk.constrained_columns}
+        for column in table.columns:
+            if column.name in fk_columns or not self.is_false_fk_candidate(table_name, column.name,
+                                                                            skip_primary_keys):
+                continue
+            for pk_table_name in pk_index.get(column.name, ()):
+                if pk_table_name != table_name:
+                    findings["claves_foraneas_falsas"].append(DataAnomaly(
+                        "Clave Foránea Falsa", table_name, column.name,
+                        f"Esta columna podría hacer referencia a {pk_table_name}.{column.name} "
+                        f"pero no es una clave foránea").to_dict())
+        return findings
+
+    def analyze_data_anomalies(self, perfilar=False):
         self.logger.info("Iniciando análisis de anomalías de datos")
         try:
+            reportar_fase('tablas_aisladas')
             isolated_tables = self.get_isolated_tables()
+            reportar_fase('claves_foraneas_falsas')
             false_fks = self.get_false_fks()
-
-            self.logger.info("Análisis de anomalías completado")
-            return {
+            reportar_fase('ciclos_claves_foraneas')
+            fk_cycles = self.get_fk_cycles()
+            reportar_fase('cascadas_profundas')
+            deep_cascades = self.get_deep_cascades()
+            anomalies = {
                 "tablas_aisladas": isolated_tables,
-                "claves_foraneas_falsas": false_fks
+                "claves_foraneas_falsas": false_fks,
+                "ciclos_claves_foraneas": fk_cycles,
+                "cascadas_profundas": deep_cascades
             }
+            if perfilar:
+                reportar_fase(SECCION_PERFIL)
+                anomalies[SECCION_PERFIL] = self.get_profile_anomalies()
+
+            self.logger.info("Análisis de anomalías completado")
+            return anomalies
         except SQLAlchemyError as e:
             self.logger.error(f"Error durante el análisis de anomalías: {str(e)}")
             return {"error": f"Ocurrió un error al analizar las anomalías de datos: {str(e)}"}
 
 
-def check_data_anomalies(engine):
-    service = DataAnomalyService(engine)
-    anomalies = service.analyze_data_anomalies()
-    logs = service.get_logs()
-    result = {
-        "tablas_aisladas": [anomaly.to_dict() for anomaly in anomalies.get("tablas_aisladas", [])],
-        "claves_foraneas_falsas": [anomaly.to_dict() for anomaly in anomalies.get("claves_foraneas_falsas", [])]
-    }
-    return result, logs
\ No newline at end of file
+def check_data_anomalies(engine, snapshot=None, perfilar=False):
+    secciones = SECCIONES + (SECCION_PERFIL,) if perfilar else SECCIONES
+    with capturar_logs() as captura:
+        reportar_fase('esquema')
+        service = DataAnomalyService(engine, snapshot)
+        anomalies = service.analyze_data_anomalies(perfilar)
+    logs = captura.get_logs()
+    with medir_fase('anomalias.serializacion'):
+        result = {seccion: [anomaly.to_dict() for anomaly in anomalies.get(seccion, [])] for seccion in secciones}
+    run_id = run_store.guardar('anomalias', result, logs, anomalies.get("error"))
+    return result, logs, run_id
+
+
+@generador_aislado
+def iter_data_anomalies(engine, snapshot=None, perfilar=False):
+    # Versión en streaming: produce (sección, hallazgo) y al final ('resumen', {...}) sin acumular resultados
+    secciones = SECCIONES + (SECCION_PERFIL,) if perfilar else SECCIONES
+    conteos = dict.fromkeys(secciones, 0)
+    with capturar_logs() as captura:
+        reportar_fase('esquema')
+        service = DataAnomalyService(engine, snapshot)
+        iteradores = {
+            "tablas_aisladas": service.iter_isolated_tables,
+            "claves_foraneas_falsas": service.iter_false_fks,
+            "ciclos_claves_foraneas": service.iter_fk_cycles,
+            "cascadas_profundas": service.iter_deep_cascades,
+            SECCION_PERFIL: lambda: service.iter_profile_anomalies(service.profile_columns()),
+        }
+        for seccion in secciones:
+            reportar_fase(seccion)
+            for anomaly in iteradores[seccion]():
+                conteos[seccion] += 1
+                yield seccion, anomaly.to_dict()
+        service.logger.info(f"Análisis de anomalías completado: {conteos}")
+    run_id = run_store.guardar('anomalias', {"conteos": conteos}, captura.get_logs())
+    yield "resumen", {"run_id": run_id, "conteos": conteos}
\ No newline at end of file
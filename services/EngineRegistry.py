@@ -0,0 +1,150 @@
+# services/EngineRegistry.py
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import SQLAlchemyError
+
+from services.Metrics import instrumentar_engine
+
+
+@contextmanager
+def statement_timeout(conn, seconds):
+    # Límites de SQL Server acotados al bloque: la conexión vuelve al pool y la siguiente petición no los hereda
+    if conn.dialect.name != 'mssql':
+        yield conn
+        return
+    raw = conn.connection.driver_connection
+    # LOCK_TIMEOUT solo acota las esperas por bloqueos; pyodbc además cancela la sentencia que excede el tiempo
+    previous = raw.timeout if conn.dialect.driver == 'pyodbc' else None
+    conn.execute(text(f"SET LOCK_TIMEOUT {int(seconds * 1000)}"))
+    if previous is not None:
+        raw.timeout = max(1, int(seconds))
+    try:
+        yield conn
+    finally:
+        try:
+            if previous is not None:
+                raw.timeout = previous
+            conn.execute(text("SET LOCK_TIMEOUT -1"))
+        except SQLAlchemyError:
+            # Sin poder restablecerla, la conexión se descarta en lugar de devolverla al pool
+            conn.invalidate()
+
+
+class EngineRegistry:
+    def __init__(self, max_engines=16, pool_size=5, max_overflow=5, pool_timeout=30,
+                 pool_recycle=1800, idle_timeout=600):
+        self.max_engines = max_engines
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.pool_timeout = pool_timeout
+        self.pool_recycle = pool_recycle
+        self.idle_timeout = idle_timeout
+        self.logger = logging.getLogger(__name__)
+        self._engines = OrderedDict()
+        self._lock = threading.Lock()
+        self._dispose_listeners = []
+
+    @staticmethod
+    def connection_string(server, database, username, password):
+        return f"mssql+pymssql://{username}:{password}@{server}/{database}"
+
+    @staticmethod
+    def make_key(url):
+        url = make_url(url)
+        credential_hash = hashlib.sha256((url.password or '').encode('utf-8')).hexdigest()
+        return (url.drivername, url.host, url.port, url.database, url.username, credential_hash)
+
+    def get_engine(self, server, database, username, password):
+        return self.get_engine_for_url(self.connection_string(server, database, username, password))
+
+    def get_engine_for_url(self, url):
+        key = self.make_key(url)
+        now = time.monotonic()
+        expired = []
+        with self._lock:
+            expired.extend(self._pop_idle(now))
+            entry = self._engines.get(key)
+            if entry is not None:
+                entry[1] = now
+                self._engines.move_to_end(key)
+                engine = entry[0]
+            else:
+                engine = self._create_engine(url)
+                self._engines[key] = [engine, now]
+                while len(self._engines) > self.max_engines:
+                    _, (old_engine, _) = self._engines.popitem(last=False)
+                    expired.append(old_engine)
+        # dispose() fuera del lock: cerrar conexiones puede bloquear
+        for old_engine in expired:
+            self._dispose(old_engine)
+        return engine
+
+    def _create_engine(self, url):
+        url = make_url(url)
+        options = {"pool_pre_ping": True}
+        if url.get_backend_name() != 'sqlite':
+            options.update(
+                pool_size=self.pool_size,
+                max_overflow=self.max_overflow,
+                pool_timeout=self.pool_timeout,
+                pool_recycle=self.pool_recycle,
+            )
+        self.logger.info(f"Creando engine para {url.host}/{url.database}")
+        return instrumentar_engine(create_engine(url, **options))
+
+    def _pop_idle(self, now):
+        idle_keys = [key for key, (_, last_used) in self._engines.items()
+                     if now - last_used > self.idle_timeout]
+        return [self._engines.pop(key)[0] for key in idle_keys]
+
+    def add_dispose_listener(self, listener):
+        # Cachés por engine que deben soltarlo cuando el registro lo libera
+        self._dispose_listeners.append(listener)
+
+    def _dispose(self, engine):
+        self.logger.info(f"Liberando engine de {engine.url.host}/{engine.url.database}")
+        for listener in self._dispose_listeners:
+            listener(engine)
+        engine.dispose()
+
+    def evict_idle(self):
+        with self._lock:
+            expired = self._pop_idle(time.monotonic())
+        for engine in expired:
+            self._dispose(engine)
+        return len(expired)
+
+    def dispose_all(self):
+        with self._lock:
+            engines = [engine for engine, _ in self._engines.values()]
+            self._engines.clear()
+        for engine in engines:
+            self._dispose(engine)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "engines": len(self._engines),
+                "max_engines": self.max_engines,
+                "pools": [
+                    {"server": engine.url.host, "database": engine.url.database, "pool": engine.pool.status()}
+                    for engine, _ in self._engines.values()
+                ],
+            }
+
+
+engine_registry = EngineRegistry(
+    max_engines=int(os.environ.get('ENGINE_REGISTRY_MAX_ENGINES', 16)),
+    pool_size=int(os.environ.get('ENGINE_REGISTRY_POOL_SIZE', 5)),
+    max_overflow=int(os.environ.get('ENGINE_REGISTRY_MAX_OVERFLOW', 5)),
+    idle_timeout=int(os.environ.get('ENGINE_REGISTRY_IDLE_TIMEOUT', 600)),
+)
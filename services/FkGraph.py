@@ -0,0 +1,198 @@
+# services/FkGraph.py
+
+from array import array
+
+from services.Metrics import medir_fase
+
+
+def _csr(n, origenes, destinos, marcas):
+    # Ordenamiento por conteo: las aristas de i quedan en vecinos[inicio[i]:inicio[i + 1]]
+    inicio = array('i', [0]) * (n + 1)
+    for origen in origenes:
+        inicio[origen + 1] += 1
+    for i in range(n):
+        inicio[i + 1] += inicio[i]
+    posicion = array('i', inicio)
+    vecinos = array('i', [0]) * len(destinos)
+    banderas = array('b', [0]) * len(destinos)
+    for origen, destino, marca in zip(origenes, destinos, marcas):
+        p = posicion[origen]
+        vecinos[p] = destino
+        banderas[p] = marca
+        posicion[origen] = p + 1
+    return inicio, vecinos, banderas
+
+
+def _tarjan(n, inicio, vecinos, banderas=None):
+    # Tarjan iterativo (sin recursión, para esquemas de miles de tablas). Un componente solo se
+    # emite cuando ya se emitieron todos los alcanzables desde él: con aristas hijo -> padre, los
+    # padres salen primero. Con `banderas` solo se recorren las aristas marcadas.
+    indices = array('i', [-1]) * n
+    bajo = array('i', [0]) * n
+    en_pila = bytearray(n)
+    pila, componentes = [], []
+    contador = 0
+    for raiz in range(n):
+        if indices[raiz] != -1:
+            continue
+        indices[raiz] = bajo[raiz] = contador
+        contador += 1
+        pila.append(raiz)
+        en_pila[raiz] = 1
+        llamadas = [[raiz, inicio[raiz]]]
+        while llamadas:
+            marco = llamadas[-1]
+            v, p = marco
+            if p < inicio[v + 1]:
+                marco[1] = p + 1
+                if banderas is not None and not banderas[p]:
+                    continue
+                w = vecinos[p]
+                if indices[w] == -1:
+                    indices[w] = bajo[w] = contador
+                    contador += 1
+                    pila.append(w)
+                    en_pila[w] = 1
+                    llamadas.append([w, inicio[w]])
+                elif en_pila[w] and indices[w] < bajo[v]:
+                    bajo[v] = indices[w]
+                continue
+            llamadas.pop()
+            if llamadas and bajo[v] < bajo[llamadas[-1][0]]:
+                bajo[llamadas[-1][0]] = bajo[v]
+            if bajo[v] == indices[v]:
+                componente = []
+                while True:
+                    w = pila.pop()
+                    en_pila[w] = 0
+                    componente.append(w)
+                    if w == v:
+                        break
+                componentes.append(componente)
+    return componentes
+
+
+class FkGraph:
+    # Grafo de dependencias hijo -> padre construido una vez por snapshot, en arreglos compactos
+    def __init__(self, snapshot):
+        self.nombres = list(snapshot.tables)
+        self.indice = {nombre: i for i, nombre in enumerate(self.nombres)}
+        n = len(self.nombres)
+        origenes, destinos, cascada = array('i'), array('i'), array('b')
+        # Referencias a tablas de otros esquemas: la tabla no está desconectada aunque el padre no esté aquí
+        self.externas = array('i', [0]) * n
+        for fk in snapshot.iter_foreign_keys():
+            hijo = self.indice[fk.table]
+            padre = self.indice.get(fk.referred_table) if fk.referred_schema is None else None
+            if padre is None:
+                self.externas[hijo] += 1
+                continue
+            origenes.append(hijo)
+            destinos.append(padre)
+            cascada.append(str(fk.options.get('ondelete', '')).upper() == 'CASCADE')
+        self.salida_inicio, self.salida, self.salida_cascada = _csr(n, origenes, destinos, cascada)
+        self.entrada_inicio, self.entrada, self.entrada_cascada = _csr(n, destinos, origenes, cascada)
+        self._componentes = None
+        self._cascadas = None
+
+    def __len__(self):
+        return len(self.nombres)
+
+    def num_relaciones(self):
+        return len(self.salida)
+
+    def grado_salida(self, i):
+        return self.salida_inicio[i + 1] - self.salida_inicio[i]
+
+    def grado_entrada(self, i):
+        return self.entrada_inicio[i + 1] - self.entrada_inicio[i]
+
+    def padres(self, i):
+        return self.salida[self.salida_inicio[i]:self.salida_inicio[i + 1]]
+
+    def hijos(self, i):
+        return self.entrada[self.entrada_inicio[i]:self.entrada_inicio[i + 1]]
+
+    def es_desconectada(self, i):
+        # Una FK a sí misma no relaciona la tabla con ninguna otra
+        if self.externas[i]:
+            return False
+        return all(j == i for j in self.padres(i)) and all(j == i for j in self.hijos(i))
+
+    def iter_desconectadas(self):
+        for i, nombre in enumerate(self.nombres):
+            if self.es_desconectada(i):
+                yield nombre
+
+    def grados(self):
+        return {nombre: {"entrada": self.grado_entrada(i), "salida": self.grado_salida(i)}
+                for i, nombre in enumerate(self.nombres)}
+
+    def componentes(self):
+        if self._componentes is None:
+            with medir_fase('grafo_fk.componentes'):
+                self._componentes = _tarjan(len(self.nombres), self.salida_inicio, self.salida)
+        return self._componentes
+
+    def iter_ciclos(self):
+        for componente in self.componentes():
+            if len(componente) > 1 or componente[0] in self.padres(componente[0]):
+                yield [self.nombres[i] for i in reversed(componente)]
+
+    def orden_carga(self):
+        # Padres antes que hijos; las tablas de un mismo ciclo quedan juntas
+        return [self.nombres[i] for componente in self.componentes() for i in reversed(componente)]
+
+    def cascadas(self):
+        # (profundidad, siguiente, ciclica): niveles de ON DELETE CASCADE que dispara borrar cada tabla
+        if self._cascadas is None:
+            with medir_fase('grafo_fk.cascadas'):
+                self._cascadas = self._calcular_cascadas()
+        return self._cascadas
+
+    def _calcular_cascadas(self):
+        n = len(self.nombres)
+        componentes = _tarjan(n, self.salida_inicio, self.salida, self.salida_cascada)
+        componente_de = array('i', [0]) * n
+        for k, componente in enumerate(componentes):
+            for i in componente:
+                componente_de[i] = k
+        profundidad = array('i', [0]) * n
+        siguiente = array('i', [-1]) * n
+        ciclica = bytearray(n)
+        inicio, hijos, cascada = self.entrada_inicio, self.entrada, self.entrada_cascada
+        # Los hijos se emiten después que sus padres: en orden inverso ya están calculados
+        for componente in reversed(componentes):
+            for v in componente:
+                for p in range(inicio[v], inicio[v + 1]):
+                    if not cascada[p]:
+                        continue
+                    hijo = hijos[p]
+                    if componente_de[hijo] == componente_de[v] or ciclica[hijo]:
+                        ciclica[v] = 1
+                        continue
+                    if profundidad[hijo] + 1 > profundidad[v]:
+                        profundidad[v] = profundidad[hijo] + 1
+                        siguiente[v] = hijo
+        return profundidad, siguiente, ciclica
+
+    def cadena_cascada(self, i):
+        _, siguiente, _ = self.cascadas()
+        cadena = [self.nombres[i]]
+        while siguiente[i] != -1:
+            i = siguiente[i]
+            cadena.append(self.nombres[i])
+        return cadena
+
+    def resumen(self):
+        profundidad, _, ciclica = self.cascadas()
+        return {
+            "tablas": len(self.nombres),
+            "relaciones": self.num_relaciones(),
+            "desconectadas": list(self.iter_desconectadas()),
+            "ciclos": list(self.iter_ciclos()),
+            "orden_carga": self.orden_carga(),
+            "profundidad_cascada_maxima": max(profundidad, default=0),
+            "cascadas_ciclicas": [nombre for i, nombre in enumerate(self.nombres) if ciclica[i]],
+            "grados": self.grados(),
+        }
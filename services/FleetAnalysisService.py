@@ -0,0 +1,153 @@
+# services/FleetAnalysisService.py
+
+import contextvars
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from sqlalchemy import text
+
+from services.EngineRegistry import engine_registry
+from services.SchemaCache import get_schema_snapshot
+from services.UnifiedAuditService import ANALISIS
+
+DATABASES_QUERY = text("""
+SELECT name
+FROM sys.databases
+WHERE database_id > 4
+  AND state_desc = 'ONLINE'
+  AND HAS_DBACCESS(name) = 1
+ORDER BY name
+""")
+
+# Tope de hilos de una corrida de flota, sea cual sea el valor pedido
+MAX_WORKERS_FLOTA = int(os.environ.get('FLOTA_MAX_WORKERS', 32))
+
+
+def discover_databases(server, username, password):
+    engine = engine_registry.get_engine(server, 'master', username, password)
+    with engine.connect() as conn:
+        return [row[0] for row in conn.execute(DATABASES_QUERY)]
+
+
+class FleetAnalysisService:
+    def __init__(self, objetivos, analisis=tuple(ANALISIS), max_workers=8, max_por_servidor=2, detalle=False):
+        invalidos = [nombre for nombre in analisis if nombre not in ANALISIS]
+        if invalidos:
+            raise ValueError(f"Análisis no válidos: {', '.join(invalidos)}. Use: {', '.join(ANALISIS)}")
+        # Con 0 el semáforo por servidor no deja pasar a nadie y la corrida queda bloqueada
+        if max_workers < 1 or max_por_servidor < 1:
+            raise ValueError("max_workers y max_por_servidor deben ser al menos 1")
+        self.objetivos = objetivos
+        self.analisis = list(analisis)
+        self.max_workers = min(max_workers, MAX_WORKERS_FLOTA)
+        self.max_por_servidor = max_por_servidor
+        self.detalle = detalle
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.INFO)
+        self._semaforos = {}
+        self._lock = threading.Lock()
+
+    def expandir_objetivos(self):
+        # Un objetivo sin 'database' (o con '*') se expande a todas las bases accesibles del servidor
+        expandidos, errores = [], []
+        for objetivo in self.objetivos:
+            if objetivo.get('url') or objetivo.get('database') not in (None, '', '*'):
+                expandidos.append(objetivo)
+                continue
+            try:
+                bases = discover_databases(objetivo['server'], objetivo.get('username'), objetivo.get('password'))
+                self.logger.info(f"Se descubrieron {len(bases)} bases de datos en {objetivo['server']}")
+                expandidos.extend({**objetivo, 'database': base} for base in bases)
+            except Exception as e:
+                errores.append(self._error(objetivo, e, 0.0))
+        return expandidos, errores
+
+    def _semaforo(self, servidor):
+        with self._lock:
+            return self._semaforos.setdefault(servidor.lower(), threading.BoundedSemaphore(self.max_por_servidor))
+
+    @staticmethod
+    def _descripcion(objetivo):
+        return {"server": objetivo.get('server'), "database": objetivo.get('database')}
+
+    def _error(self, objetivo, error, tiempo):
+        self.logger.error(f"Falló el análisis de {objetivo.get('server')}/{objetivo.get('database')}: {str(error)}")
+        return {**self._descripcion(objetivo), "estado": "error", "error": str(error), "analisis": {},
+                "tiempo": round(tiempo, 3)}
+
+    def analizar_objetivo(self, objetivo):
+        start = time.perf_counter()
+        servidor = objetivo.get('server') or objetivo.get('url', '')
+        with self._semaforo(servidor):
+            try:
+                if objetivo.get('url'):
+                    engine = engine_registry.get_engine_for_url(objetivo['url'])
+                else:
+                    engine = engine_registry.get_engine(objetivo['server'], objetivo['database'],
+                                                        objetivo.get('username'), objetivo.get('password'))
+                # Un solo snapshot por base: los tres análisis comparten la misma lectura del catálogo
+                snapshot = get_schema_snapshot(engine)
+            except Exception as e:
+                return self._error(objetivo, e, time.perf_counter() - start)
+
+            resultados = {}
+            for nombre in self.analisis:
+                try:
+                    run_id, resumen, detalle = ANALISIS[nombre](engine, snapshot)
+                    resultados[nombre] = {"run_id": run_id, "resumen": resumen}
+                    if self.detalle:
+                        resultados[nombre]["resultado"] = detalle
+                except Exception as e:
+                    self.logger.error(f"Falló {nombre} en {servidor}/{objetivo.get('database')}: {str(e)}")
+                    resultados[nombre] = {"error": str(e)}
+
+        errores = sum(1 for resultado in resultados.values() if "error" in resultado)
+        return {
+            **self._descripcion(objetivo),
+            "estado": "ok" if not errores else ("error" if errores == len(resultados) else "parcial"),
+            "error": None,
+            "analisis": resultados,
+            "tiempo": round(time.perf_counter() - start, 3),
+        }
+
+    def iter_resultados(self):
+        start = time.perf_counter()
+        objetivos, errores = self.expandir_objetivos()
+        estados = {"ok": 0, "parcial": 0, "error": 0}
+        totales = {}
+
+        def registrar(reporte):
+            estados[reporte["estado"]] += 1
+            for nombre, resultado in reporte["analisis"].items():
+                for clave, valor in resultado.get("resumen", {}).items():
+                    totales.setdefault(nombre, {})
+                    totales[nombre][clave] = totales[nombre].get(clave, 0) + valor
+
+        for reporte in errores:
+            registrar(reporte)
+            yield "objetivo", reporte
+
+        workers = max(1, min(self.max_workers, len(objetivos)))
+        self.logger.info(f"Analizando {len(objetivos)} bases de datos con {workers} hilos")
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='flota') as executor:
+            futures = [executor.submit(contextvars.copy_context().run, self.analizar_objetivo, objetivo)
+                       for objetivo in objetivos]
+            # Los reportes salen en orden de llegada, no de envío
+            for future in as_completed(futures):
+                reporte = future.result()
+                registrar(reporte)
+                yield "objetivo", reporte
+
+        yield "resumen", {
+            "objetivos": len(objetivos) + len(errores),
+            "estados": estados,
+            "totales": totales,
+            "tiempo": round(time.perf_counter() - start, 3),
+        }
+
+
+def analyze_fleet(objetivos, **options):
+    return FleetAnalysisService(objetivos, **options).iter_resultados()
@@ -0,0 +1,260 @@
+# services/InclusionDependencyService.py
+
+import logging
+import time
+
+from sqlalchemy import column, func, select, table
+from sqlalchemy.exc import SQLAlchemyError
+
+from services.ColumnProfileService import estimate_row_counts
+from services.JobManager import reportar_fase
+from services.Metrics import medir_fase
+from services.OrphanScanService import OrphanScanService
+from services.SchemaCache import get_schema_snapshot
+from services.SchemaSnapshot import type_family
+from services.Sketches import BloomFilter, DistinctCounter, hash64
+
+COMPARABLE_FAMILIES = ('entero', 'texto', 'uuid', 'decimal')
+
+
+def normalize_value(value, family):
+    # Misma semántica que la comparación de SQL Server: sin mayúsculas ni espacios finales
+    if family == 'texto':
+        # El driver puede devolver bytes u otros tipos en columnas de texto
+        return str(value).rstrip().casefold()
+    if family == 'uuid':
+        return str(value).lower()
+    return value
+
+
+class ColumnSketch:
+    __slots__ = ('table', 'column', 'family', 'rows', 'nulls', 'min', 'max', 'distinct', 'bloom', 'probes',
+                 'complete')
+
+    def __init__(self, table_name, column_name, family, bloom_capacity=None, false_positive_rate=0.01, max_probes=64):
+        self.table = table_name
+        self.column = column_name
+        self.family = family
+        self.rows = 0
+        self.nulls = 0
+        self.min = None
+        self.max = None
+        self.distinct = DistinctCounter()
+        self.bloom = None
+        if bloom_capacity is not None:
+            self.bloom = BloomFilter.for_capacity(bloom_capacity, false_positive_rate)
+        self.probes = {} if max_probes else None
+        self.complete = True
+
+    def add(self, value, max_probes):
+        self.rows += 1
+        if value is None:
+            self.nulls += 1
+            return
+        value = normalize_value(value, self.family)
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        hashed = hash64(value)
+        self.distinct.add_hash(hashed)
+        if self.bloom is not None:
+            self.bloom.add_hash(hashed)
+        if self.probes is not None and len(self.probes) < max_probes:
+            self.probes.setdefault(value, hashed)
+
+
+class InclusionDependencyService:
+    def __init__(self, engine, snapshot=None, sample_rows=10000, max_parent_rows=5000000,
+                 bloom_false_positive_rate=0.01, max_probes=64, min_distinct=2, min_coverage=0.05,
+                 max_candidates_per_column=1, max_verifications_per_column=3):
+        self.engine = engine
+        self.snapshot = snapshot if snapshot is not None else get_schema_snapshot(engine)
+        self.sample_rows = sample_rows
+        self.max_parent_rows = max_parent_rows
+        self.bloom_false_positive_rate = bloom_false_positive_rate
+        self.max_probes = max_probes
+        self.min_distinct = min_distinct
+        self.min_coverage = min_coverage
+        self.max_candidates_per_column = max_candidates_per_column
+        # Si el mejor candidato falla la verificación exacta se prueban los siguientes, hasta este límite
+        self.max_verifications_per_column = max_verifications_per_column
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.INFO)
+
+    def _column_roles(self):
+        # Padres: PKs de una sola columna. Hijas: columnas comparables que no son la PK de su tabla
+        roles = {}
+        for table_info in self.snapshot.tables.values():
+            parent_key = table_info.primary_key[0] if len(table_info.primary_key) == 1 else None
+            table_roles = {}
+            for column_info in table_info.columns:
+                family = type_family(column_info.type)
+                if family not in COMPARABLE_FAMILIES:
+                    continue
+                table_roles[column_info.name] = ('padre' if column_info.name == parent_key else 'hija', family)
+            if table_roles:
+                roles[table_info.name] = table_roles
+        return roles
+
+    def profile_table(self, conn, table_name, table_roles, estimated_rows=None):
+        has_parent = any(role == 'padre' for role, _ in table_roles.values())
+        capacity = None
+        if has_parent:
+            # El filtro de Bloom se dimensiona con las filas de la tabla padre: uno fijo se satura en tablas grandes
+            if estimated_rows is None:
+                estimated_rows = conn.execute(select(func.count()).select_from(table(table_name))).scalar()
+            capacity = min(estimated_rows, self.max_parent_rows)
+        sketches = {}
+        for column_name, (role, family) in table_roles.items():
+            is_parent = role == 'padre'
+            sketches[column_name] = ColumnSketch(
+                table_name, column_name, family,
+                bloom_capacity=capacity if is_parent else None,
+                false_positive_rate=self.bloom_false_positive_rate,
+                max_probes=0 if is_parent else self.max_probes)
+
+        child_names = [name for name, sketch in sketches.items() if sketch.bloom is None]
+        parent_names = [name for name, sketch in sketches.items() if sketch.bloom is not None]
+        # Las hijas solo necesitan la muestra; la pasada completa de la tabla padre lee únicamente su clave
+        if child_names:
+            self._stream(conn, table_name, [sketches[name] for name in child_names], self.sample_rows)
+        if parent_names:
+            parent_sketches = [sketches[name] for name in parent_names]
+            rows_read = self._stream(conn, table_name, parent_sketches, self.max_parent_rows)
+            if rows_read >= self.max_parent_rows:
+                for sketch in parent_sketches:
+                    sketch.complete = False
+        return sketches
+
+    def _stream(self, conn, table_name, column_sketches, row_limit):
+        query = (select(*[column(sketch.column) for sketch in column_sketches])
+                 .select_from(table(table_name)).limit(row_limit))
+        result = conn.execution_options(stream_results=True, yield_per=5000).execute(query)
+        rows_read = 0
+        for row in result:
+            for value, sketch in zip(row, column_sketches):
+                sketch.add(value, self.max_probes)
+            rows_read += 1
+        result.close()
+        return rows_read
+
+    @medir_fase('inclusion.perfilado')
+    def profile(self):
+        roles = self._column_roles()
+        parents, children = [], []
+        estimates = estimate_row_counts(self.engine)
+        with self.engine.connect() as conn:
+            for index, (table_name, table_roles) in enumerate(roles.items()):
+                reportar_fase('perfilado', index, len(roles))
+                try:
+                    sketches = self.profile_table(conn, table_name, table_roles, estimates.get(table_name))
+                except (SQLAlchemyError, TypeError) as e:
+                    self.logger.error(f"No se pudo perfilar la tabla {table_name}: {str(e)}")
+                    conn.rollback()
+                    continue
+                for sketch in sketches.values():
+                    (parents if sketch.bloom is not None else children).append(sketch)
+        return parents, children
+
+    def _survives(self, child, parent, positions_by_shape):
+        # Una columna de la propia tabla contenida en su PK suele ser casualidad (pedido.producto_id ⊆ pedido.id)
+        if child.table == parent.table:
+            return False
+        if not parent.complete:
+            # Con la tabla padre truncada solo el tipo es una poda segura
+            return True
+        if child.min < parent.min or child.max > parent.max:
+            return False
+        if child.distinct.estimate() > parent.distinct.estimate() * 1.2 + 1:
+            return False
+        # Cada filtro tiene su propio tamaño: las posiciones se calculan una vez por (bits, funciones hash)
+        shape = (parent.bloom.num_bits, parent.bloom.num_hashes)
+        if shape not in positions_by_shape:
+            positions_by_shape[shape] = [parent.bloom.positions(hashed) for hashed in child.probes.values()]
+        for positions in positions_by_shape[shape]:
+            if not parent.bloom.contains_positions(positions):
+                return False
+        return True
+
+    @staticmethod
+    def coverage(child, parent):
+        return min(1.0, child.distinct.estimate() / max(parent.distinct.estimate(), 1))
+
+    @staticmethod
+    def name_matches(child, parent):
+        name = child.column.lower()
+        parent_table, parent_column = parent.table.lower(), parent.column.lower()
+        return parent_table in name.split('_') or name in (
+            parent_column, f"{parent_table}_{parent_column}", f"{parent_column}_{parent_table}")
+
+    def _score(self, child, parent):
+        return (not self.name_matches(child, parent), -self.coverage(child, parent))
+
+    @medir_fase('inclusion.candidatos')
+    def find_candidates(self, parents, children):
+        parents_by_family = {}
+        for parent in parents:
+            if parent.min is not None:
+                parents_by_family.setdefault(parent.family, []).append(parent)
+
+        candidates = []
+        pairs_checked = 0
+        for child in children:
+            if child.min is None or child.distinct.estimate() < self.min_distinct:
+                continue
+            family_parents = parents_by_family.get(child.family)
+            if not family_parents:
+                continue
+            positions_by_shape = {}
+            survivors = []
+            for parent in family_parents:
+                pairs_checked += 1
+                if self._survives(child, parent, positions_by_shape) and (
+                        self.name_matches(child, parent) or self.coverage(child, parent) >= self.min_coverage):
+                    survivors.append(parent)
+            if survivors:
+                survivors.sort(key=lambda parent: self._score(child, parent))
+                candidates.append((child, survivors[:self.max_verifications_per_column]))
+
+        self.logger.info(f"Se evaluaron {pairs_checked} pares de columnas en memoria, "
+                         f"{sum(len(ranked) for _, ranked in candidates)} candidatos pasan a verificación exacta")
+        return candidates
+
+    @medir_fase('inclusion.verificacion')
+    def verify(self, candidates):
+        scanner = OrphanScanService(self.engine, self.snapshot)
+        verified = []
+        for index, (child, ranked) in enumerate(candidates):
+            reportar_fase('verificacion', index, len(candidates))
+            found = 0
+            # Candidatos en orden de puntuación: se sigue con el siguiente cuando uno tiene huérfanos
+            for parent in ranked:
+                result = scanner.scan_relation({
+                    'tabla_hija': child.table,
+                    'columna_hija': child.column,
+                    'tabla_padre': parent.table,
+                    'columna_padre': parent.column,
+                })
+                if result['error'] is None and not result['truncado'] and result['huerfanos'] == 0:
+                    verified.append((child, parent))
+                    found += 1
+                    if found >= self.max_candidates_per_column:
+                        break
+        return verified
+
+    def discover(self):
+        start = time.perf_counter()
+        parents, children = self.profile()
+        self.logger.info(f"Perfiladas {len(parents)} columnas clave y {len(children)} columnas candidatas")
+        candidates = self.find_candidates(parents, children)
+        verified = self.verify(candidates)
+        self.logger.info(f"Se verificaron {len(verified)} dependencias de inclusión en "
+                         f"{time.perf_counter() - start:.3f}s")
+        return [{
+            'tabla_hija': child.table,
+            'columna_hija': child.column,
+            'tabla_padre_potencial': parent.table,
+            'columna_padre_potencial': parent.column,
+            'cobertura': round(self.coverage(child, parent), 4),
+        } for child, parent in verified]
@@ -0,0 +1,218 @@
+# services/IncrementalAnalysis.py
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from services.DataAnomaly import DataAnomalyService
+from services.EngineRegistry import EngineRegistry
+from services.IntegridadReferencialService import IntegridadReferencialService
+from services.LogCapture import capturar_logs
+from services.RunStore import run_store
+from services.SchemaCache import get_schema_snapshot
+from services.SchemaDiff import diff_snapshots
+
+
+def tables_with_columns(snapshot, column_names):
+    if not column_names:
+        return set()
+    return {table_name for table_name, column in snapshot.iter_columns() if column.name in column_names}
+
+
+class AnalizadorAnomalias:
+    tipo = 'anomalias'
+
+    def servicio(self, engine, snapshot):
+        return DataAnomalyService(engine, snapshot)
+
+    def contexto(self, servicio):
+        return servicio.build_pk_index()
+
+    def hallazgos(self, servicio, contexto, tabla):
+        return servicio.table_findings(tabla, contexto)
+
+    def dependientes(self, diff, anterior, actual):
+        # Si cambia una PK, las columnas homónimas de otras tablas pueden ganar o perder hallazgos
+        nombres = set()
+        for tabla in diff.added_tables:
+            nombres.update(actual.tables[tabla].primary_key)
+        for tabla in diff.removed_tables:
+            nombres.update(anterior.tables[tabla].primary_key)
+        for table_diff in diff.altered_tables.values():
+            if table_diff.primary_key_changed():
+                nombres.update(table_diff.old_primary_key)
+                nombres.update(table_diff.new_primary_key)
+        dependientes = tables_with_columns(actual, nombres)
+        # Una tabla deja de estar aislada (o vuelve a estarlo) cuando cambian las FKs que la referencian
+        for tabla in diff.added_tables | diff.removed_tables | set(diff.altered_tables):
+            for snapshot in (anterior, actual):
+                if tabla in snapshot.tables:
+                    dependientes.update(fk.referred_table for fk in snapshot.tables[tabla].foreign_keys
+                                        if fk.referred_table in actual.tables)
+        return dependientes
+
+    def ensamblar(self, servicio, hallazgos):
+        resultado = {"tablas_aisladas": [], "claves_foraneas_falsas": []}
+        for tabla in servicio.snapshot.tables:
+            for seccion, lista in hallazgos[tabla].items():
+                resultado[seccion].extend(lista)
+        resultado.update(servicio.graph_findings())
+        return resultado
+
+
+class AnalizadorIntegridad:
+    tipo = 'integridad_referencial'
+
+    def servicio(self, engine, snapshot):
+        return IntegridadReferencialService(engine, snapshot)
+
+    def contexto(self, servicio):
+        return None
+
+    def hallazgos(self, servicio, contexto, tabla):
+        return servicio.hallazgos_tabla(tabla)
+
+    def dependientes(self, diff, anterior, actual):
+        # Las acciones de una FK solo dependen de su propia tabla
+        return set()
+
+    def ensamblar(self, servicio, hallazgos):
+        snapshot = servicio.snapshot
+        anomalias = {"insercion": [], "eliminacion": [], "actualizacion": []}
+        acciones_definidas = {}
+        for tabla in snapshot.tables:
+            for seccion in anomalias:
+                anomalias[seccion].extend(hallazgos[tabla][seccion])
+            acciones_definidas.update(hallazgos[tabla]["acciones_definidas"])
+        return {"anomalias": anomalias, "acciones_definidas": acciones_definidas}
+
+
+class AnalizadorRelaciones:
+    tipo = 'integridad_relacional'
+
+    def servicio(self, engine, snapshot):
+        from services.IntegridadReferencialRelacionalService import IntegridadReferencialRelacionalService
+        return IntegridadReferencialRelacionalService(engine, snapshot, 'nombres')
+
+    def contexto(self, servicio):
+        return None
+
+    def hallazgos(self, servicio, contexto, tabla):
+        return servicio.table_findings(tabla)
+
+    def dependientes(self, diff, anterior, actual):
+        # Crear o borrar una tabla cambia qué columnas '<tabla>_id' apuntan a un padre existente
+        from services.IntegridadReferencialRelacionalService import potential_parent
+        nombres = diff.added_tables | diff.removed_tables
+        if not nombres:
+            return set()
+        return {table_name for table_name, column in actual.iter_columns()
+                if potential_parent(column.name) in nombres}
+
+    def ensamblar(self, servicio, hallazgos):
+        resultado = {"existing_foreign_keys": [], "potential_foreign_keys": [], "missing_foreign_keys": []}
+        for tabla in servicio.snapshot.tables:
+            for seccion, lista in hallazgos[tabla].items():
+                resultado[seccion].extend(lista)
+        resultado.update({
+            "num_existing_fks": len(resultado["existing_foreign_keys"]),
+            "num_potential_fks": len(resultado["potential_foreign_keys"]),
+            "num_missing_fks": len(resultado["missing_foreign_keys"]),
+            "num_anomalies": len(resultado["potential_foreign_keys"]) - len(resultado["existing_foreign_keys"]),
+        })
+        return resultado
+
+
+ANALIZADORES = {
+    'anomalias': AnalizadorAnomalias(),
+    'integridad_referencial': AnalizadorIntegridad(),
+    'integridad_relacional': AnalizadorRelaciones(),
+}
+
+
+class EstadoAnalisis:
+    __slots__ = ('snapshot', 'hallazgos')
+
+    def __init__(self, snapshot, hallazgos):
+        self.snapshot = snapshot
+        self.hallazgos = hallazgos
+
+
+class IncrementalAnalysis:
+    def __init__(self, max_targets=64):
+        self.max_targets = max_targets
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.INFO)
+        self._estados = OrderedDict()
+        self._lock = threading.Lock()
+
+    def analizar(self, engine, tipo, snapshot=None):
+        analizador = ANALIZADORES[tipo]
+        start = time.perf_counter()
+        snapshot = snapshot if snapshot is not None else get_schema_snapshot(engine)
+        clave = (EngineRegistry.make_key(engine.url), tipo)
+        with self._lock:
+            estado = self._estados.get(clave)
+
+        diff = None
+        if estado is None:
+            hallazgos = {}
+            recalcular = set(snapshot.tables)
+        else:
+            diff = diff_snapshots(estado.snapshot, snapshot)
+            hallazgos = dict(estado.hallazgos)
+            for tabla in diff.removed_tables:
+                hallazgos.pop(tabla, None)
+            recalcular = diff.added_tables | set(diff.altered_tables)
+            recalcular |= analizador.dependientes(diff, estado.snapshot, snapshot)
+
+        servicio = analizador.servicio(engine, snapshot)
+        if recalcular:
+            contexto = analizador.contexto(servicio)
+            for tabla in recalcular:
+                hallazgos[tabla] = analizador.hallazgos(servicio, contexto, tabla)
+
+        with self._lock:
+            self._estados[clave] = EstadoAnalisis(snapshot, hallazgos)
+            self._estados.move_to_end(clave)
+            while len(self._estados) > self.max_targets:
+                self._estados.popitem(last=False)
+
+        cambios = {
+            "incremental": estado is not None,
+            "tablas_recalculadas": len(recalcular),
+            **(diff.to_dict() if diff is not None else {}),
+        }
+        self.logger.info(f"Análisis incremental de {tipo}: {len(recalcular)} de {len(snapshot.tables)} "
+                         f"tablas recalculadas en {time.perf_counter() - start:.3f}s")
+        return analizador.ensamblar(servicio, hallazgos), cambios
+
+    def invalidate(self, engine=None):
+        with self._lock:
+            if engine is None:
+                self._estados.clear()
+                return
+            url_key = EngineRegistry.make_key(engine.url)
+            for clave in [clave for clave in self._estados if clave[0] == url_key]:
+                del self._estados[clave]
+
+
+incremental_analysis = IncrementalAnalysis(
+    max_targets=int(os.environ.get('ANALISIS_INCREMENTAL_MAX', 64)),
+)
+
+
+def analizar_incremental(engine, tipo, snapshot=None):
+    with capturar_logs() as captura:
+        resultado, cambios = incremental_analysis.analizar(engine, tipo, snapshot)
+    logs = captura.get_logs()
+    if tipo == 'integridad_referencial':
+        resultado["logs"] = logs
+    run_id = run_store.guardar(tipo, {**resultado, "cambios": cambios}, logs)
+    return resultado, cambios, run_id, logs
+
+
+def es_incremental(request):
+    return str(request.form.get('incremental', '')).lower() in ('1', 'true', 'si')
@@ -1,114 +1,195 @@
-import pandas as pd
-from sqlalchemy import inspect, text
 import logging
-import io
 
+from services.InclusionDependencyService import InclusionDependencyService
+from services.JobManager import reportar_fase
+from services.LogCapture import capturar_logs, logs_actuales
+from services.Metrics import medir_fase
+from services.RunStore import run_store
+from services.SchemaCache import get_schema_snapshot
+from services.Streaming import generador_aislado
+
+
+class ExistingForeignKey:
+    __slots__ = ('tabla_hija', 'columna_hija', 'tabla_padre', 'columna_padre', 'nombre_fk')
+
+    def __init__(self, tabla_hija, columna_hija, tabla_padre, columna_padre, nombre_fk=None):
+        self.tabla_hija = tabla_hija
+        self.columna_hija = columna_hija
+        self.tabla_padre = tabla_padre
+        self.columna_padre = columna_padre
+        self.nombre_fk = nombre_fk
+
+    def key(self):
+        return self.tabla_hija, self.columna_hija, self.tabla_padre, self.columna_padre
+
+    def to_dict(self):
+        return {
+            'tabla_hija': self.tabla_hija,
+            'columna_hija': self.columna_hija,
+            'tabla_padre': self.tabla_padre,
+            'columna_padre': self.columna_padre,
+            'nombre_fk': self.nombre_fk
+        }
 
-class MemoryHandler(logging.Handler):
-    def __init__(self):
-        super().__init__()
-        self.log_stream = io.StringIO()
 
-    def emit(self, record):
-        msg = self.format(record)
-        self.log_stream.write(msg + '\n')
+class PotentialForeignKey:
+    __slots__ = ('tabla_hija', 'columna_hija', 'tabla_padre_potencial', 'columna_padre_potencial', 'cobertura')
+
+    def __init__(self, tabla_hija, columna_hija, tabla_padre_potencial, columna_padre_potencial, cobertura=None):
+        self.tabla_hija = tabla_hija
+        self.columna_hija = columna_hija
+        self.tabla_padre_potencial = tabla_padre_potencial
+        self.columna_padre_potencial = columna_padre_potencial
+        self.cobertura = cobertura
+
+    def key(self):
+        return self.tabla_hija, self.columna_hija, self.tabla_padre_potencial, self.columna_padre_potencial
+
+    def to_dict(self, include_coverage=True):
+        record = {
+            'tabla_hija': self.tabla_hija,
+            'columna_hija': self.columna_hija,
+            'tabla_padre_potencial': self.tabla_padre_potencial,
+            'columna_padre_potencial': self.columna_padre_potencial
+        }
+        if include_coverage and self.cobertura is not None:
+            record['cobertura'] = self.cobertura
+        return record
+
+
+def potential_parent(column_name):
+    if column_name.endswith('_id') or column_name.startswith('id_'):
+        return column_name.replace('_id', '').replace('id_', '')
+    return None
 
-    def get_logs(self):
-        return self.log_stream.getvalue()
+
+def to_records(items, as_dataframe=False, **options):
+    records = [item.to_dict(**options) for item in items]
+    if as_dataframe:
+        # pandas solo se carga si alguien pide un DataFrame
+        import pandas as pd
+        return pd.DataFrame(records)
+    return records
 
 
 class IntegridadReferencialRelacionalService:
-    def __init__(self, engine):
+    def __init__(self, engine, snapshot=None, modo_descubrimiento='nombres'):
         self.engine = engine
-        self.inspector = inspect(engine)
+        self.modo_descubrimiento = modo_descubrimiento
+        self._inclusion_dependencies = None
         self.logger = logging.getLogger(__name__)
         self.logger.setLevel(logging.INFO)
-        self.memory_handler = MemoryHandler()
-        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-        self.memory_handler.setFormatter(formatter)
-        self.logger.addHandler(self.memory_handler)
+        self.snapshot = snapshot if snapshot is not None else get_schema_snapshot(engine)
 
     def get_logs(self):
-        return self.memory_handler.get_logs()
+        return logs_actuales()
+
+    def iter_existing_foreign_keys(self):
+        for fk in self.snapshot.iter_foreign_keys():
+            yield ExistingForeignKey(fk.table, fk.constrained_columns[0], fk.referred_table,
+                                     fk.referred_columns[0], fk.name)
 
-    def get_existing_foreign_keys(self):
+    @medir_fase('relacional.claves_existentes')
+    def get_existing_foreign_keys(self, as_dataframe=False):
+        reportar_fase('claves_existentes')
         self.logger.info("Obteniendo claves foráneas existentes")
-        existing_fks = []
-        for table_name in self.inspector.get_table_names():
-            fks = self.inspector.get_foreign_keys(table_name)
-            for fk in fks:
-                existing_fks.append({
-                    'tabla_hija': table_name,
-                    'columna_hija': fk['constrained_columns'][0],
-                    'tabla_padre': fk['referred_table'],
-                    'columna_padre': fk['referred_columns'][0],
-                    'nombre_fk': fk['name']
-                })
-        return pd.DataFrame(existing_fks)
-
-    def get_potential_foreign_keys(self):
+        return to_records(self.iter_existing_foreign_keys(), as_dataframe)
+
+    def iter_potential_foreign_keys(self):
+        if self.modo_descubrimiento == 'datos':
+            yield from self.discover_inclusion_dependencies()
+            return
+        for table_name in self.snapshot.tables:
+            yield from self.iter_table_potential_foreign_keys(table_name)
+
+    def iter_table_potential_foreign_keys(self, table_name):
+        tables = self.snapshot.tables
+        for column in tables[table_name].columns:
+            parent = potential_parent(column.name)
+            if parent in tables:
+                # Asumimos que la columna padre es 'id'
+                yield PotentialForeignKey(table_name, column.name, parent, 'id')
+
+    def table_findings(self, table_name):
+        # Relaciones de una sola tabla hija (modo por nombres), para el análisis incremental
+        existing = [ExistingForeignKey(fk.table, fk.constrained_columns[0], fk.referred_table,
+                                       fk.referred_columns[0], fk.name)
+                    for fk in self.snapshot.tables[table_name].foreign_keys]
+        existing_keys = {fk.key() for fk in existing}
+        potential = list(self.iter_table_potential_foreign_keys(table_name))
+        return {
+            "existing_foreign_keys": to_records(existing),
+            "potential_foreign_keys": to_records(potential),
+            "missing_foreign_keys": to_records([fk for fk in potential if fk.key() not in existing_keys],
+                                               include_coverage=False),
+        }
+
+    @medir_fase('relacional.claves_potenciales')
+    def get_potential_foreign_keys(self, as_dataframe=False):
+        reportar_fase('claves_potenciales')
         self.logger.info("Identificando potenciales claves foráneas")
-        potential_fks = []
-        tables = self.inspector.get_table_names()
-        for table in tables:
-            columns = self.inspector.get_columns(table)
-            for column in columns:
-                if column['name'].endswith('_id') or column['name'].startswith('id_'):
-                    potential_parent = column['name'].replace('_id', '').replace('id_', '')
-                    if potential_parent in tables:
-                        potential_fks.append({
-                            'tabla_hija': table,
-                            'columna_hija': column['name'],
-                            'tabla_padre_potencial': potential_parent,
-                            'columna_padre_potencial': 'id'  # Asumimos que la columna padre es 'id'
-                        })
-        return pd.DataFrame(potential_fks)
-
-    def get_missing_foreign_keys(self):
+        return to_records(self.iter_potential_foreign_keys(), as_dataframe)
+
+    @medir_fase('relacional.dependencias_inclusion')
+    def discover_inclusion_dependencies(self):
+        # El descubrimiento lee datos, así que se calcula una sola vez por análisis
+        if self._inclusion_dependencies is None:
+            self.logger.info("Descubriendo dependencias de inclusión a partir de los datos")
+            service = InclusionDependencyService(self.engine, self.snapshot)
+            self._inclusion_dependencies = [
+                PotentialForeignKey(d['tabla_hija'], d['columna_hija'], d['tabla_padre_potencial'],
+                                    d['columna_padre_potencial'], d['cobertura'])
+                for d in service.discover()]
+        return self._inclusion_dependencies
+
+    def get_inclusion_dependencies(self, as_dataframe=False):
+        return to_records(self.discover_inclusion_dependencies(), as_dataframe)
+
+    def iter_relationships(self):
+        # Pasada única: las existentes alimentan el conjunto y cada potencial se clasifica al generarse
+        existing_keys = set()
+        for fk in self.iter_existing_foreign_keys():
+            existing_keys.add(fk.key())
+            yield 'existing_foreign_keys', fk
+        for fk in self.iter_potential_foreign_keys():
+            yield 'potential_foreign_keys', fk
+            if fk.key() not in existing_keys:
+                yield 'missing_foreign_keys', fk
+
+    def iter_missing_foreign_keys(self):
+        for section, fk in self.iter_relationships():
+            if section == 'missing_foreign_keys':
+                yield fk
+
+    @medir_fase('relacional.claves_faltantes')
+    def get_missing_foreign_keys(self, as_dataframe=False):
+        reportar_fase('claves_faltantes')
         self.logger.info("Identificando claves foráneas faltantes")
-        existing_fks = self.get_existing_foreign_keys()
-        potential_fks = self.get_potential_foreign_keys()
-
-        # Convertimos existing_fks a un conjunto de tuplas para facilitar la comparación
-        existing_fk_set = set(
-            (row['tabla_hija'], row['columna_hija'], row['tabla_padre'], row['columna_padre'])
-            for _, row in existing_fks.iterrows()
-        )
-
-        missing_fks = []
-        for _, row in potential_fks.iterrows():
-            potential_fk = (
-            row['tabla_hija'], row['columna_hija'], row['tabla_padre_potencial'], row['columna_padre_potencial'])
-            if potential_fk not in existing_fk_set:
-                missing_fks.append({
-                    'tabla_hija': row['tabla_hija'],
-                    'columna_hija': row['columna_hija'],
-                    'tabla_padre_potencial': row['tabla_padre_potencial'],
-                    'columna_padre_potencial': row['columna_padre_potencial']
-                })
-
-        return pd.DataFrame(missing_fks)
+        return to_records(self.iter_missing_foreign_keys(), as_dataframe, include_coverage=False)
 
     def analyze_referential_relationships(self):
         self.logger.info("Iniciando análisis de relaciones referenciales")
-        existing_fks = self.get_existing_foreign_keys()
-        potential_fks = self.get_potential_foreign_keys()
-        missing_fks = self.get_missing_foreign_keys()
-
-        num_existing_fks = len(existing_fks)
-        num_potential_fks = len(potential_fks)
-        num_missing_fks = len(missing_fks)
+        reportar_fase('relaciones')
+        sections = {'existing_foreign_keys': [], 'potential_foreign_keys': [], 'missing_foreign_keys': []}
+        with medir_fase('relacional.relaciones'):
+            for section, fk in self.iter_relationships():
+                sections[section].append(fk)
+
+        num_existing_fks = len(sections['existing_foreign_keys'])
+        num_potential_fks = len(sections['potential_foreign_keys'])
+        num_missing_fks = len(sections['missing_foreign_keys'])
         num_anomalies = num_potential_fks - num_existing_fks
 
-        results = {
-            "existing_foreign_keys": existing_fks.to_dict(orient='records'),
-            "potential_foreign_keys": potential_fks.to_dict(orient='records'),
-            "missing_foreign_keys": missing_fks.to_dict(orient='records'),
-            "num_existing_fks": num_existing_fks,
-            "num_potential_fks": num_potential_fks,
-            "num_missing_fks": num_missing_fks,
-            "num_anomalies": num_anomalies
-        }
+        with medir_fase('relacional.serializacion'):
+            results = {
+                "existing_foreign_keys": to_records(sections['existing_foreign_keys']),
+                "potential_foreign_keys": to_records(sections['potential_foreign_keys']),
+                "missing_foreign_keys": to_records(sections['missing_foreign_keys'], include_coverage=False),
+                "num_existing_fks": num_existing_fks,
+                "num_potential_fks": num_potential_fks,
+                "num_missing_fks": num_missing_fks,
+                "num_anomalies": num_anomalies
+            }
 
         self.logger.info(f"Se encontraron {num_existing_fks} claves foráneas existentes")
         self.logger.info(f"Se identificaron {num_potential_fks} potenciales claves foráneas")
@@ -119,9 +200,32 @@ class IntegridadReferencialRelacionalService:
         return results
 
 
-def check_relations(engine):
-    service = IntegridadReferencialRelacionalService(engine)
-    results = service.analyze_referential_relationships()
-    logs = service.get_logs()
-    return results, logs
-
+def check_relations(engine, snapshot=None, modo_descubrimiento='nombres'):
+    with capturar_logs() as captura:
+        reportar_fase('esquema')
+        service = IntegridadReferencialRelacionalService(engine, snapshot, modo_descubrimiento)
+        results = service.analyze_referential_relationships()
+    logs = captura.get_logs()
+    run_id = run_store.guardar('integridad_relacional', results, logs)
+    return results, logs, run_id
+
+
+@generador_aislado
+def iter_relations(engine, snapshot=None, modo_descubrimiento='nombres'):
+    conteos = {"existing_foreign_keys": 0, "potential_foreign_keys": 0, "missing_foreign_keys": 0}
+    with capturar_logs() as captura:
+        reportar_fase('esquema')
+        service = IntegridadReferencialRelacionalService(engine, snapshot, modo_descubrimiento)
+        reportar_fase('relaciones')
+        for seccion, fk in service.iter_relationships():
+            conteos[seccion] += 1
+            yield seccion, fk.to_dict(include_coverage=False) if seccion == 'missing_foreign_keys' else fk.to_dict()
+        resumen = {
+            "num_existing_fks": conteos["existing_foreign_keys"],
+            "num_potential_fks": conteos["potential_foreign_keys"],
+            "num_missing_fks": conteos["missing_foreign_keys"],
+            "num_anomalies": conteos["potential_foreign_keys"] - conteos["existing_foreign_keys"]
+        }
+        service.logger.info(f"Análisis de relaciones referenciales completado: {resumen}")
+    resumen["run_id"] = run_store.guardar('integridad_relacional', resumen, captura.get_logs())
+    yield "resumen", resumen
@@ -1,35 +1,30 @@
 # services/IntegridadReferencialService.py
 
-from sqlalchemy import inspect, text
 from sqlalchemy.exc import SQLAlchemyError
 import logging
-import io
 
-class MemoryHandler(logging.Handler):
-    def __init__(self):
-        super().__init__()
-        self.log_stream = io.StringIO()
+from services.JobManager import reportar_fase
+from services.LogCapture import capturar_logs, logs_actuales
+from services.Metrics import medir_fase
+from services.RunStore import run_store
+from services.SchemaCache import get_schema_snapshot
+from services.Streaming import generador_aislado
 
-    def emit(self, record):
-        msg = self.format(record)
-        self.log_stream.write(msg + '\n')
-
-    def get_logs(self):
-        return self.log_stream.getvalue()
+ACCIONES = (
+    ("insercion", 'oninsert', "Inserción", "No se ha definido acción para inserción en la clave foránea"),
+    ("eliminacion", 'ondelete', "Eliminación", "No se ha definido acción para eliminación en la clave foránea"),
+    ("actualizacion", 'onupdate', "Actualización", "No se ha definido acción para actualización en la clave foránea"),
+)
 
 class IntegridadReferencialService:
-    def __init__(self, engine):
+    def __init__(self, engine, snapshot=None):
         self.engine = engine
-        self.inspector = inspect(engine)
         self.logger = logging.getLogger(__name__)
         self.logger.setLevel(logging.INFO)
-        self.memory_handler = MemoryHandler()
-        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-        self.memory_handler.setFormatter(formatter)
-        self.logger.addHandler(self.memory_handler)
+        self.snapshot = snapshot if snapshot is not None else get_schema_snapshot(engine)
 
     def get_logs(self):
-        return self.memory_handler.get_logs()
+        return logs_actuales()
 
     def verificar_integridad_referencial(self):
         self.logger.info("Iniciando verificación de integridad referencial")
@@ -45,79 +40,110 @@ class IntegridadReferencialService:
             self.logger.error(f"Error al verificar la integridad referencial: {str(e)}")
             return None, str(e)
 
+    def _iter_accion_no_definida(self, accion, tipo, detalle):
+        for fk in self.snapshot.iter_foreign_keys():
+            if accion not in fk.options:
+                anomalia = {
+                    "tabla": fk.table,
+                    "columna": fk.constrained_columns[0],
+                    "tipo": tipo,
+                    "detalle": detalle
+                }
+                self.logger.info(f"Anomalía de {tipo.lower()} detectada: {anomalia}")
+                yield anomalia
+
+    def _verificar_accion_no_definida(self, accion, tipo, detalle):
+        return list(self._iter_accion_no_definida(accion, tipo, detalle))
+
+    def iter_anomalias(self):
+        for seccion, accion, tipo, detalle in ACCIONES:
+            reportar_fase(seccion)
+            for anomalia in self._iter_accion_no_definida(accion, tipo, detalle):
+                yield seccion, anomalia
+
+    @medir_fase('integridad.anomalias_insercion')
     def verificar_anomalias_insercion(self):
+        reportar_fase('insercion')
         self.logger.info("Verificando anomalías de inserción")
-        anomalias = []
-        for table_name in self.inspector.get_table_names():
-            fks = self.inspector.get_foreign_keys(table_name)
-            for fk in fks:
-                if 'options' not in fk or 'oninsert' not in fk['options']:
-                    anomalia = {
-                        "tabla": table_name,
-                        "columna": fk['constrained_columns'][0],
-                        "tipo": "Inserción",
-                        "detalle": "No se ha definido acción para inserción en la clave foránea"
-                    }
-                    anomalias.append(anomalia)
-                    self.logger.info(f"Anomalía de inserción detectada: {anomalia}")
-        return anomalias
+        return self._verificar_accion_no_definida(
+            'oninsert', "Inserción", "No se ha definido acción para inserción en la clave foránea")
 
+    @medir_fase('integridad.anomalias_eliminacion')
     def verificar_anomalias_eliminacion(self):
+        reportar_fase('eliminacion')
         self.logger.info("Verificando anomalías de eliminación")
-        anomalias = []
-        for table_name in self.inspector.get_table_names():
-            fks = self.inspector.get_foreign_keys(table_name)
-            for fk in fks:
-                if 'options' not in fk or 'ondelete' not in fk['options']:
-                    anomalia = {
-                        "tabla": table_name,
-                        "columna": fk['constrained_columns'][0],
-                        "tipo": "Eliminación",
-                        "detalle": "No se ha definido acción para eliminación en la clave foránea"
-                    }
-                    anomalias.append(anomalia)
-                    self.logger.info(f"Anomalía de eliminación detectada: {anomalia}")
-        return anomalias
+        return self._verificar_accion_no_definida(
+            'ondelete', "Eliminación", "No se ha definido acción para eliminación en la clave foránea")
 
+    @medir_fase('integridad.anomalias_actualizacion')
     def verificar_anomalias_actualizacion(self):
+        reportar_fase('actualizacion')
         self.logger.info("Verificando anomalías de actualización")
-        anomalias = []
-        for table_name in self.inspector.get_table_names():
-            fks = self.inspector.get_foreign_keys(table_name)
-            for fk in fks:
-                if 'options' not in fk or 'onupdate' not in fk['options']:
-                    anomalia = {
-                        "tabla": table_name,
-                        "columna": fk['constrained_columns'][0],
-                        "tipo": "Actualización",
-                        "detalle": "No se ha definido acción para actualización en la clave foránea"
-                    }
-                    anomalias.append(anomalia)
-                    self.logger.info(f"Anomalía de actualización detectada: {anomalia}")
-        return anomalias
+        return self._verificar_accion_no_definida(
+            'onupdate', "Actualización", "No se ha definido acción para actualización en la clave foránea")
 
+    def iter_acciones_definidas(self):
+        for fk in self.snapshot.iter_foreign_keys():
+            acciones = {
+                "oninsert": fk.options.get('oninsert', 'No definida'),
+                "ondelete": fk.options.get('ondelete', 'No definida'),
+                "onupdate": fk.options.get('onupdate', 'No definida')
+            }
+            self.logger.info(f"Acciones definidas para {fk.table}.{fk.constrained_columns[0]}: {acciones}")
+            yield f"{fk.table}.{fk.constrained_columns[0]}", acciones
+
+    def hallazgos_tabla(self, tabla):
+        # Hallazgos de las claves foráneas de una sola tabla, para el análisis incremental
+        hallazgos = {"insercion": [], "eliminacion": [], "actualizacion": [], "acciones_definidas": {}}
+        for fk in self.snapshot.tables[tabla].foreign_keys:
+            for seccion, accion, tipo, detalle in ACCIONES:
+                if accion not in fk.options:
+                    hallazgos[seccion].append({
+                        "tabla": fk.table,
+                        "columna": fk.constrained_columns[0],
+                        "tipo": tipo,
+                        "detalle": detalle
+                    })
+            hallazgos["acciones_definidas"][f"{fk.table}.{fk.constrained_columns[0]}"] = {
+                "oninsert": fk.options.get('oninsert', 'No definida'),
+                "ondelete": fk.options.get('ondelete', 'No definida'),
+                "onupdate": fk.options.get('onupdate', 'No definida')
+            }
+        return hallazgos
+
+    @medir_fase('integridad.acciones_definidas')
     def verificar_acciones_definidas(self):
+        reportar_fase('acciones_definidas')
         self.logger.info("Verificando acciones definidas en claves foráneas")
-        acciones_definidas = {}
-        for table_name in self.inspector.get_table_names():
-            fks = self.inspector.get_foreign_keys(table_name)
-            for fk in fks:
-                acciones = {
-                    "oninsert": fk.get('options', {}).get('oninsert', 'No definida'),
-                    "ondelete": fk.get('options', {}).get('ondelete', 'No definida'),
-                    "onupdate": fk.get('options', {}).get('onupdate', 'No definida')
-                }
-                acciones_definidas[f"{table_name}.{fk['constrained_columns'][0]}"] = acciones
-                self.logger.info(f"Acciones definidas para {table_name}.{fk['constrained_columns'][0]}: {acciones}")
-        return acciones_definidas
-
-def check_integridad_referencial(engine):
-    service = IntegridadReferencialService(engine)
-    anomalias, error = service.verificar_integridad_referencial()
-    acciones_definidas = service.verificar_acciones_definidas()
-    logs = service.get_logs()
-    return {
+        return dict(self.iter_acciones_definidas())
+
+def check_integridad_referencial(engine, snapshot=None):
+    with capturar_logs() as captura:
+        reportar_fase('esquema')
+        service = IntegridadReferencialService(engine, snapshot)
+        anomalias, error = service.verificar_integridad_referencial()
+        acciones_definidas = service.verificar_acciones_definidas()
+    logs = captura.get_logs()
+    result = {
         "anomalias": anomalias,
         "acciones_definidas": acciones_definidas,
         "logs": logs
-    }, error
\ No newline at end of file
+    }
+    run_id = run_store.guardar('integridad_referencial', result, logs, error)
+    return result, error, run_id
+
+@generador_aislado
+def iter_integridad_referencial(engine, snapshot=None):
+    conteos = {"insercion": 0, "eliminacion": 0, "actualizacion": 0, "acciones_definidas": 0}
+    with capturar_logs() as captura:
+        reportar_fase('esquema')
+        service = IntegridadReferencialService(engine, snapshot)
+        for seccion, anomalia in service.iter_anomalias():
+            conteos[seccion] += 1
+            yield seccion, anomalia
+        reportar_fase('acciones_definidas')
+        for clave, acciones in service.iter_acciones_definidas():
+            conteos["acciones_definidas"] += 1
+            yield "acciones_definidas", {"clave_foranea": clave, **acciones}
+    run_id = run_store.guardar('integridad_referencial', {"conteos": conteos}, captura.get_logs())
+    yield "resumen", {"run_id": run_id, "conteos": conteos}
\ No newline at end of file
@@ -0,0 +1,196 @@
+# services/JobManager.py
+
+import contextvars
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from services.Metrics import medir
+
+EN_COLA = 'en_cola'
+EJECUTANDO = 'ejecutando'
+COMPLETADO = 'completado'
+ERROR = 'error'
+CANCELADO = 'cancelado'
+
+TERMINADOS = (COMPLETADO, ERROR, CANCELADO)
+
+# Trabajo en ejecución en el hilo actual; fuera de un trabajo reportar_fase no hace nada
+_trabajo_actual = contextvars.ContextVar('trabajo_actual', default=None)
+
+
+class TrabajoCancelado(Exception):
+    pass
+
+
+class ColaLlena(Exception):
+    pass
+
+
+class Trabajo:
+    def __init__(self, tipo, funcion, args, kwargs):
+        self.id = uuid.uuid4().hex
+        self.tipo = tipo
+        self.funcion = funcion
+        self.args = args
+        self.kwargs = kwargs
+        self.estado = EN_COLA
+        self.creado = datetime.now()
+        self.iniciado = None
+        self.terminado = None
+        self.fases = []
+        self.avance = None
+        self.medicion = None
+        self.resultado = None
+        self.error = None
+        self.futuro = None
+        self.cancelacion = threading.Event()
+        self._lock = threading.Lock()
+
+    def iniciar_fase(self, fase, completado=None, total=None):
+        if self.cancelacion.is_set():
+            raise TrabajoCancelado(f"Trabajo {self.id} cancelado")
+        ahora = time.perf_counter()
+        with self._lock:
+            if not self.fases or self.fases[-1]["fase"] != fase:
+                if self.fases:
+                    self.fases[-1]["duracion"] = round(ahora - self.fases[-1]["_inicio"], 3)
+                self.fases.append({"fase": fase, "_inicio": ahora, "duracion": None})
+            self.avance = {"completado": completado, "total": total} if total is not None else None
+
+    def cerrar_fase(self):
+        with self._lock:
+            if self.fases and self.fases[-1]["duracion"] is None:
+                self.fases[-1]["duracion"] = round(time.perf_counter() - self.fases[-1]["_inicio"], 3)
+
+    def estado_dict(self):
+        with self._lock:
+            fases = [{"fase": f["fase"], "duracion": f["duracion"]} for f in self.fases]
+            return {
+                "id": self.id,
+                "tipo": self.tipo,
+                "estado": self.estado,
+                "fase": fases[-1]["fase"] if fases and self.estado == EJECUTANDO else None,
+                "avance": self.avance,
+                "fases": fases,
+                "creado": self.creado.isoformat(),
+                "iniciado": self.iniciado.isoformat() if self.iniciado else None,
+                "terminado": self.terminado.isoformat() if self.terminado else None,
+                "error": self.error,
+                "metricas": self.medicion.to_dict() if self.medicion is not None else None,
+            }
+
+
+class JobManager:
+    def __init__(self, max_workers=2, max_queue=20, result_ttl=900, max_jobs=200):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.result_ttl = result_ttl
+        self.max_jobs = max_jobs
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='trabajo')
+        self._trabajos = {}
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+
+    def _purgar(self):
+        # Llamado con el lock tomado: caducan los resultados viejos y, si sobra, los terminados más antiguos
+        limite = time.time() - self.result_ttl
+        terminados = sorted((t for t in self._trabajos.values() if t.estado in TERMINADOS),
+                            key=lambda t: t.terminado)
+        for trabajo in terminados:
+            if trabajo.terminado.timestamp() < limite or len(self._trabajos) > self.max_jobs:
+                del self._trabajos[trabajo.id]
+
+    def enviar(self, tipo, funcion, *args, **kwargs):
+        with self._lock:
+            self._purgar()
+            pendientes = sum(1 for t in self._trabajos.values() if t.estado not in TERMINADOS)
+            if pendientes >= self.max_workers + self.max_queue:
+                raise ColaLlena("La cola de trabajos está llena, intente más tarde")
+            trabajo = Trabajo(tipo, funcion, args, kwargs)
+            self._trabajos[trabajo.id] = trabajo
+            trabajo.futuro = self._executor.submit(self._ejecutar, trabajo)
+        self.logger.info(f"Trabajo {trabajo.id} ({tipo}) encolado")
+        return trabajo
+
+    def _ejecutar(self, trabajo):
+        with trabajo._lock:
+            if trabajo.cancelacion.is_set():
+                # Cancelado cuando el executor ya lo había tomado: futuro.cancel() falló y nadie más lo cierra
+                trabajo.estado = CANCELADO
+                trabajo.terminado = datetime.now()
+                trabajo.args = trabajo.kwargs = None
+                return
+            trabajo.estado = EJECUTANDO
+            trabajo.iniciado = datetime.now()
+        token = _trabajo_actual.set(trabajo)
+        try:
+            with medir() as trabajo.medicion:
+                resultado = trabajo.funcion(*trabajo.args, **trabajo.kwargs)
+            estado, error = COMPLETADO, None
+        except TrabajoCancelado:
+            resultado, estado, error = None, CANCELADO, None
+        except Exception as e:
+            self.logger.error(f"Trabajo {trabajo.id} ({trabajo.tipo}) falló: {str(e)}")
+            resultado, estado, error = None, ERROR, str(e)
+        finally:
+            _trabajo_actual.reset(token)
+        trabajo.cerrar_fase()
+        with trabajo._lock:
+            trabajo.resultado = resultado
+            trabajo.error = error
+            trabajo.estado = estado
+            trabajo.terminado = datetime.now()
+            # Los argumentos pueden retener engines o credenciales: no se guardan más de lo necesario
+            trabajo.args = trabajo.kwargs = None
+
+    def obtener(self, trabajo_id):
+        with self._lock:
+            self._purgar()
+            return self._trabajos.get(trabajo_id)
+
+    def cancelar(self, trabajo_id):
+        trabajo = self.obtener(trabajo_id)
+        if trabajo is None:
+            return None
+        with trabajo._lock:
+            if trabajo.estado in TERMINADOS:
+                return trabajo
+            trabajo.cancelacion.set()
+            if trabajo.estado == EN_COLA and trabajo.futuro.cancel():
+                trabajo.estado = CANCELADO
+                trabajo.terminado = datetime.now()
+                trabajo.args = trabajo.kwargs = None
+        return trabajo
+
+    def listar(self):
+        with self._lock:
+            self._purgar()
+            trabajos = list(self._trabajos.values())
+        return [t.estado_dict() for t in sorted(trabajos, key=lambda t: t.creado, reverse=True)]
+
+    def stats(self):
+        with self._lock:
+            estados = {}
+            for trabajo in self._trabajos.values():
+                estados[trabajo.estado] = estados.get(trabajo.estado, 0) + 1
+        return {"max_workers": self.max_workers, "max_queue": self.max_queue, "estados": estados}
+
+
+def reportar_fase(fase, completado=None, total=None):
+    # Punto de progreso y de cancelación cooperativa para los servicios de análisis
+    trabajo = _trabajo_actual.get()
+    if trabajo is not None:
+        trabajo.iniciar_fase(fase, completado, total)
+
+
+job_manager = JobManager(
+    max_workers=int(os.environ.get('TRABAJOS_MAX_WORKERS', 2)),
+    max_queue=int(os.environ.get('TRABAJOS_MAX_COLA', 20)),
+    result_ttl=int(os.environ.get('TRABAJOS_TTL_RESULTADO', 900)),
+    max_jobs=int(os.environ.get('TRABAJOS_MAX_GUARDADOS', 200)),
+)
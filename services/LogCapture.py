@@ -0,0 +1,71 @@
+# services/LogCapture.py
+
+import contextvars
+import logging
+import os
+from collections import deque
+from contextlib import contextmanager
+
+MAX_REGISTROS = int(os.environ.get('LOG_CAPTURA_MAX', 5000))
+
+FORMATO = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+
+# Captura activa de la corrida actual; cada petición, trabajo o hilo copiado ve solo la suya
+_captura_actual = contextvars.ContextVar('captura_log', default=None)
+
+
+class LogCapture:
+    def __init__(self, max_registros=MAX_REGISTROS, padre=None):
+        self.registros = deque(maxlen=max_registros)
+        self.descartados = 0
+        self.padre = padre
+
+    def agregar(self, record):
+        if len(self.registros) == self.registros.maxlen:
+            self.descartados += 1
+        self.registros.append(record)
+        if self.padre is not None:
+            self.padre.agregar(record)
+
+    def get_logs(self):
+        # El formateo se hace solo cuando alguien pide el texto
+        lineas = [FORMATO.format(record) for record in list(self.registros)]
+        if self.descartados:
+            lineas.insert(0, f"... {self.descartados} registros anteriores descartados")
+        return '\n'.join(lineas) + '\n' if lineas else ''
+
+    def to_list(self):
+        return [{
+            "fecha_hora": FORMATO.formatTime(record),
+            "nivel": record.levelname,
+            "origen": record.name,
+            "mensaje": record.getMessage(),
+        } for record in list(self.registros)]
+
+
+class ContextLogHandler(logging.Handler):
+    def emit(self, record):
+        captura = _captura_actual.get()
+        if captura is not None:
+            captura.agregar(record)
+
+
+@contextmanager
+def capturar_logs(max_registros=MAX_REGISTROS):
+    captura = LogCapture(max_registros, padre=_captura_actual.get())
+    token = _captura_actual.set(captura)
+    try:
+        yield captura
+    finally:
+        _captura_actual.reset(token)
+
+
+def logs_actuales():
+    captura = _captura_actual.get()
+    return captura.get_logs() if captura is not None else ''
+
+
+# Un único handler para todos los servicios, instalado una sola vez al importar el módulo
+_logger_servicios = logging.getLogger('services')
+if not any(isinstance(handler, ContextLogHandler) for handler in _logger_servicios.handlers):
+    _logger_servicios.addHandler(ContextLogHandler())
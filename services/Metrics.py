@@ -0,0 +1,281 @@
+# services/Metrics.py
+
+import bisect
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+BUCKETS = tuple(float(b) for b in os.environ.get(
+    'METRICAS_BUCKETS', '0.001,0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,30,60').split(','))
+
+CATALOGO = ('sys.', 'information_schema', 'sqlite_master', 'sqlite_schema', 'pragma')
+
+# Medición de la petición o trabajo actual y fase abierta; los hilos copiados con copy_context las heredan
+_medicion_actual = contextvars.ContextVar('medicion_actual', default=None)
+_fase_actual = contextvars.ContextVar('fase_actual', default=None)
+
+
+def es_consulta_catalogo(sentencia):
+    sentencia = sentencia.lower()
+    return any(marca in sentencia for marca in CATALOGO)
+
+
+def _etiquetas(nombres, valores):
+    if not nombres:
+        return ''
+    pares = []
+    for nombre, valor in zip(nombres, valores):
+        valor = str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pares.append(f'{nombre}="{valor}"')
+    return '{' + ','.join(pares) + '}'
+
+
+def _numero(valor):
+    if valor == float('inf'):
+        return '+Inf'
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class Contador:
+    tipo = 'counter'
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def inc(self, valor=1, **etiquetas):
+        clave = tuple(str(etiquetas[e]) for e in self.etiquetas)
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0) + valor
+
+    def muestras(self):
+        with self._lock:
+            valores = sorted(self._valores.items())
+        for clave, valor in valores:
+            yield f"{self.nombre}{_etiquetas(self.etiquetas, clave)} {_numero(valor)}"
+
+
+class Histograma:
+    tipo = 'histogram'
+
+    def __init__(self, nombre, ayuda, etiquetas=(), buckets=BUCKETS):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observar(self, valor, **etiquetas):
+        clave = tuple(str(etiquetas[e]) for e in self.etiquetas)
+        # Se guarda el conteo de cada bucket por separado; se acumula solo al exponer
+        posicion = bisect.bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self._series.get(clave)
+            if serie is None:
+                serie = self._series[clave] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            serie[0][posicion] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def muestras(self):
+        with self._lock:
+            series = sorted((clave, (list(conteos), suma, total))
+                            for clave, (conteos, suma, total) in self._series.items())
+        nombres_bucket = self.etiquetas + ('le',)
+        for clave, (conteos, suma, total) in series:
+            acumulado = 0
+            for limite, conteo in zip(self.buckets + (float('inf'),), conteos):
+                acumulado += conteo
+                yield f"{self.nombre}_bucket{_etiquetas(nombres_bucket, clave + (_numero(limite),))} {acumulado}"
+            yield f"{self.nombre}_sum{_etiquetas(self.etiquetas, clave)} {_numero(suma)}"
+            yield f"{self.nombre}_count{_etiquetas(self.etiquetas, clave)} {total}"
+
+
+class RegistroMetricas:
+    def __init__(self):
+        self._metricas = {}
+        self._recolectores = []
+        self._lock = threading.Lock()
+
+    def _registrar(self, clase, nombre, ayuda, etiquetas, **opciones):
+        with self._lock:
+            metrica = self._metricas.get(nombre)
+            if metrica is None:
+                metrica = self._metricas[nombre] = clase(nombre, ayuda, etiquetas, **opciones)
+            return metrica
+
+    def contador(self, nombre, ayuda, etiquetas=()):
+        return self._registrar(Contador, nombre, ayuda, etiquetas)
+
+    def histograma(self, nombre, ayuda, etiquetas=(), buckets=BUCKETS):
+        return self._registrar(Histograma, nombre, ayuda, etiquetas, buckets=buckets)
+
+    def recolector(self, funcion):
+        # funcion() -> [(nombre, tipo, ayuda, {etiqueta: valor}, valor)], evaluada en cada lectura
+        with self._lock:
+            self._recolectores.append(funcion)
+        return funcion
+
+    def exponer(self):
+        with self._lock:
+            metricas = list(self._metricas.values())
+            recolectores = list(self._recolectores)
+        lineas = []
+        for metrica in metricas:
+            lineas.append(f"# HELP {metrica.nombre} {metrica.ayuda}")
+            lineas.append(f"# TYPE {metrica.nombre} {metrica.tipo}")
+            lineas.extend(metrica.muestras())
+
+        agrupadas = {}
+        for recolector in recolectores:
+            for nombre, tipo, ayuda, etiquetas, valor in recolector():
+                agrupadas.setdefault((nombre, tipo, ayuda), []).append((etiquetas, valor))
+        for (nombre, tipo, ayuda), muestras in agrupadas.items():
+            lineas.append(f"# HELP {nombre} {ayuda}")
+            lineas.append(f"# TYPE {nombre} {tipo}")
+            for etiquetas, valor in muestras:
+                lineas.append(f"{nombre}{_etiquetas(tuple(etiquetas), tuple(etiquetas.values()))} {_numero(valor)}")
+        return '\n'.join(lineas) + '\n'
+
+
+registro_metricas = RegistroMetricas()
+
+CONSULTAS_SQL = registro_metricas.histograma(
+    'auditoria_sql_consulta_segundos', "Duración de las consultas SQL ejecutadas por los servicios", ('tipo',))
+ERRORES_SQL = registro_metricas.contador(
+    'auditoria_sql_errores_total', "Consultas SQL que terminaron con error", ('tipo',))
+FASES = registro_metricas.histograma(
+    'auditoria_fase_segundos', "Duración de cada fase de los servicios de análisis", ('fase',))
+ERRORES_FASE = registro_metricas.contador(
+    'auditoria_fase_errores_total', "Fases de análisis que terminaron con una excepción", ('fase',))
+PETICIONES = registro_metricas.histograma(
+    'auditoria_http_peticion_segundos', "Duración de las peticiones HTTP", ('endpoint', 'metodo', 'estado'))
+
+
+class Medicion:
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.fin = None
+        self.consultas = 0
+        self.consultas_catalogo = 0
+        self.tiempo_sql = 0.0
+        self.fases = {}
+        self._lock = threading.Lock()
+
+    def registrar_consulta(self, duracion, catalogo, fase):
+        with self._lock:
+            self.consultas += 1
+            self.consultas_catalogo += catalogo
+            self.tiempo_sql += duracion
+            if fase is not None:
+                datos = self._fase(fase)
+                datos["consultas"] += 1
+                datos["tiempo_sql"] += duracion
+
+    def registrar_fase(self, fase, duracion):
+        with self._lock:
+            datos = self._fase(fase)
+            datos["llamadas"] += 1
+            datos["tiempo"] += duracion
+
+    def _fase(self, fase):
+        datos = self.fases.get(fase)
+        if datos is None:
+            datos = self.fases[fase] = {"tiempo": 0.0, "llamadas": 0, "consultas": 0, "tiempo_sql": 0.0}
+        return datos
+
+    def tiempo_total(self):
+        return (self.fin or time.perf_counter()) - self.inicio
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "tiempo_total": round(self.tiempo_total(), 4),
+                "consultas": self.consultas,
+                "consultas_catalogo": self.consultas_catalogo,
+                "tiempo_sql": round(self.tiempo_sql, 4),
+                "fases": {fase: {**datos, "tiempo": round(datos["tiempo"], 4),
+                                 "tiempo_sql": round(datos["tiempo_sql"], 4)}
+                          for fase, datos in self.fases.items()},
+            }
+
+    def server_timing(self):
+        # Cabecera Server-Timing: las herramientas de desarrollo del navegador la muestran por petición
+        with self._lock:
+            partes = [f'sql;dur={self.tiempo_sql * 1000:.1f};desc="{self.consultas} consultas"']
+            partes.extend(f"{fase.replace(' ', '_')};dur={datos['tiempo'] * 1000:.1f}"
+                          for fase, datos in self.fases.items())
+        partes.append(f"total;dur={self.tiempo_total() * 1000:.1f}")
+        return ', '.join(partes)
+
+
+@contextmanager
+def medir():
+    medicion = Medicion()
+    token = _medicion_actual.set(medicion)
+    try:
+        yield medicion
+    finally:
+        medicion.fin = time.perf_counter()
+        _medicion_actual.reset(token)
+
+
+def medicion_actual():
+    return _medicion_actual.get()
+
+
+@contextmanager
+def medir_fase(fase):
+    # Sirve como bloque `with` y como decorador de los métodos de los servicios
+    token = _fase_actual.set(fase)
+    inicio = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        ERRORES_FASE.inc(fase=fase)
+        raise
+    finally:
+        duracion = time.perf_counter() - inicio
+        _fase_actual.reset(token)
+        FASES.observar(duracion, fase=fase)
+        medicion = _medicion_actual.get()
+        if medicion is not None:
+            medicion.registrar_fase(fase, duracion)
+
+
+def _antes_de_consulta(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metricas_inicio = time.perf_counter()
+
+
+def _despues_de_consulta(conn, cursor, statement, parameters, context, executemany):
+    inicio = getattr(context, '_metricas_inicio', None)
+    if inicio is None:
+        return
+    duracion = time.perf_counter() - inicio
+    catalogo = es_consulta_catalogo(statement)
+    CONSULTAS_SQL.observar(duracion, tipo='catalogo' if catalogo else 'datos')
+    medicion = _medicion_actual.get()
+    if medicion is not None:
+        medicion.registrar_consulta(duracion, catalogo, _fase_actual.get())
+
+
+def _error_de_consulta(contexto_error):
+    if contexto_error.statement is not None:
+        ERRORES_SQL.inc(tipo='catalogo' if es_consulta_catalogo(contexto_error.statement) else 'datos')
+
+
+def instrumentar_engine(engine):
+    if not event.contains(engine, 'before_cursor_execute', _antes_de_consulta):
+        event.listen(engine, 'before_cursor_execute', _antes_de_consulta)
+        event.listen(engine, 'after_cursor_execute', _despues_de_consulta)
+        event.listen(engine, 'handle_error', _error_de_consulta)
+    return engine
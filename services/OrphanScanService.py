@@ -0,0 +1,214 @@
+# services/OrphanScanService.py
+
+import contextvars
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from sqlalchemy import and_, case, column, exists, func, select, table
+from sqlalchemy.exc import SQLAlchemyError
+
+from services.EngineRegistry import statement_timeout
+from services.Metrics import medir_fase
+from services.SchemaCache import get_schema_snapshot
+from services.SchemaSnapshot import type_family
+
+
+class OrphanScanService:
+    def __init__(self, engine, snapshot=None, max_workers=4, chunk_size=50000, sample_size=10,
+                 query_timeout=30, row_budget=5000000):
+        self.engine = engine
+        self.snapshot = snapshot if snapshot is not None else get_schema_snapshot(engine)
+        self.max_workers = max_workers
+        self.chunk_size = chunk_size
+        self.sample_size = sample_size
+        self.query_timeout = query_timeout
+        self.row_budget = row_budget
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.INFO)
+
+    def get_relations(self, origen='declaradas'):
+        relations = []
+        if origen in ('declaradas', 'ambas'):
+            for fk in self.snapshot.iter_foreign_keys():
+                relations.append({
+                    'tabla_hija': fk.table,
+                    'columna_hija': ', '.join(fk.constrained_columns),
+                    'tabla_padre': fk.referred_table,
+                    'columna_padre': ', '.join(fk.referred_columns),
+                    # Las FKs compuestas se comparan columna a columna en el anti-join
+                    'columnas_hija': list(fk.constrained_columns),
+                    'columnas_padre': list(fk.referred_columns),
+                    'nombre_fk': fk.name,
+                    'origen': 'declarada',
+                })
+        if origen in ('potenciales', 'ambas'):
+            from services.IntegridadReferencialRelacionalService import IntegridadReferencialRelacionalService
+            relacional = IntegridadReferencialRelacionalService(self.engine, self.snapshot)
+            for fk in relacional.iter_potential_foreign_keys():
+                relations.append({
+                    'tabla_hija': fk.tabla_hija,
+                    'columna_hija': fk.columna_hija,
+                    'tabla_padre': fk.tabla_padre_potencial,
+                    'columna_padre': fk.columna_padre_potencial,
+                    'nombre_fk': None,
+                    'origen': 'potencial',
+                })
+        return relations
+
+    def _chunk_key(self, table_name):
+        # Solo se trocea por rangos si la tabla hija tiene una PK entera de una sola columna
+        table_info = self.snapshot.tables[table_name]
+        if len(table_info.primary_key) != 1:
+            return None
+        pk_name = table_info.primary_key[0]
+        pk_column = next(c for c in table_info.columns if c.name == pk_name)
+        return pk_name if type_family(pk_column.type) == 'entero' else None
+
+    @contextmanager
+    def _timed_connection(self):
+        with self.engine.connect() as conn:
+            dialect = self.engine.dialect.name
+            if dialect == 'mssql':
+                with statement_timeout(conn, self.query_timeout):
+                    yield conn, lambda: None
+            elif dialect == 'sqlite':
+                raw = conn.connection.driver_connection
+                deadline = [None]
+
+                def start_query():
+                    deadline[0] = time.monotonic() + self.query_timeout
+
+                # Interrumpe la consulta de SQLite si supera el tiempo máximo
+                raw.set_progress_handler(
+                    lambda: 1 if deadline[0] and time.monotonic() > deadline[0] else 0, 10000)
+                try:
+                    yield conn, start_query
+                finally:
+                    raw.set_progress_handler(None, 0)
+            else:
+                yield conn, lambda: None
+
+    def _sample(self, conn, start_query, result, query, value_names, with_key):
+        missing = self.sample_size - len(result['muestra'])
+        if missing <= 0:
+            return
+        start_query()
+        for row in conn.execute(query.limit(missing)):
+            values = row[1:] if with_key else row
+            entry = {'valor': values[0] if len(value_names) == 1 else dict(zip(value_names, values))}
+            result['muestra'].append({'clave': row[0], **entry} if with_key else entry)
+
+    def _scan_keyset(self, conn, start_query, result, child, key, child_values, orphan_filter):
+        # Paginación por clave: cada trozo son las siguientes chunk_size filas tras la última clave leída,
+        # así los huecos de una PK dispersa no generan consultas sobre rangos vacíos
+        last_key = None
+        while True:
+            if result['filas_revisadas'] >= self.row_budget:
+                result['truncado'] = True
+                return
+            page = select(key.label('clave'), case((orphan_filter, 1), else_=0).label('huerfana'))
+            if last_key is not None:
+                page = page.where(key > last_key)
+            page = page.order_by(key).limit(self.chunk_size).subquery()
+            start_query()
+            # SQL Server no admite subconsultas dentro de un agregado: la marca se calcula por fila en la página
+            rows_read, first_key, chunk_last, orphans = conn.execute(select(
+                func.count(), func.min(page.c.clave), func.max(page.c.clave), func.sum(page.c.huerfana))).one()
+            if not rows_read:
+                return
+            result['filas_revisadas'] += rows_read
+            result['huerfanos'] += orphans or 0
+            if orphans:
+                self._sample(conn, start_query, result, select(key, *child_values).where(
+                    and_(orphan_filter, key.between(first_key, chunk_last))).order_by(key),
+                    [value.name for value in child_values], with_key=True)
+            if rows_read < self.chunk_size:
+                return
+            last_key = chunk_last
+
+    @medir_fase('huerfanos.relacion')
+    def scan_relation(self, relation):
+        result = {
+            **relation,
+            'huerfanos': 0,
+            'muestra': [],
+            'filas_revisadas': 0,
+            'truncado': False,
+            'error': None,
+        }
+        start = time.perf_counter()
+        child_name, parent_name = relation['tabla_hija'], relation['tabla_padre']
+        try:
+            if child_name not in self.snapshot.tables or parent_name not in self.snapshot.tables:
+                raise ValueError(f"La tabla {child_name} o {parent_name} no existe")
+            child_names = relation.get('columnas_hija') or [relation['columna_hija']]
+            parent_names = relation.get('columnas_padre') or [relation['columna_padre']]
+            if len(child_names) != len(parent_names):
+                raise ValueError(f"La relación {child_name} -> {parent_name} no empareja sus columnas")
+            for name in parent_names:
+                if name not in self.snapshot.tables[parent_name].column_names():
+                    raise ValueError(f"La columna {parent_name}.{name} no existe")
+
+            key_name = self._chunk_key(child_name)
+            child_columns = dict.fromkeys(child_names + ([key_name] if key_name else []))
+            child = table(child_name, *[column(name) for name in child_columns]).alias('h')
+            parent = table(parent_name, *[column(name) for name in dict.fromkeys(parent_names)]).alias('p')
+            child_values = [child.c[name] for name in child_names]
+            # Como en SQL Server, una fila con alguna columna de la FK en NULL no se comprueba
+            orphan_filter = and_(
+                *[value.isnot(None) for value in child_values],
+                ~exists().where(and_(*[parent.c[p] == value for p, value in zip(parent_names, child_values)])),
+            )
+
+            with self._timed_connection() as (conn, start_query):
+                if key_name is None:
+                    start_query()
+                    total = conn.execute(select(func.count()).select_from(child)).scalar()
+                    # Sin clave por la que trocear, una tabla que excede el presupuesto no se revisa
+                    if total > self.row_budget:
+                        result['truncado'] = True
+                    else:
+                        result['filas_revisadas'] = total
+                        start_query()
+                        result['huerfanos'] = conn.execute(
+                            select(func.count()).select_from(child).where(orphan_filter)).scalar()
+                        if result['huerfanos']:
+                            self._sample(conn, start_query, result, select(*child_values).where(orphan_filter),
+                                         child_names, with_key=False)
+                else:
+                    self._scan_keyset(conn, start_query, result, child, child.c[key_name], child_values,
+                                      orphan_filter)
+        except (SQLAlchemyError, ValueError) as e:
+            result['error'] = str(e)
+            self.logger.error(f"Error al buscar huérfanos en {child_name}.{relation['columna_hija']}: {str(e)}")
+        finally:
+            result['tiempo'] = round(time.perf_counter() - start, 4)
+
+        self.logger.info(f"{child_name}.{relation['columna_hija']} -> {parent_name}.{relation['columna_padre']}: "
+                         f"{result['huerfanos']} filas huérfanas en {result['filas_revisadas']} filas revisadas"
+                         f"{' (truncado)' if result['truncado'] else ''}")
+        return result
+
+    def scan(self, origen='declaradas'):
+        relations = self.get_relations(origen)
+        self.logger.info(f"Buscando filas huérfanas en {len(relations)} relaciones")
+        pool_size = self.engine.pool.size() if hasattr(self.engine.pool, 'overflow') else self.max_workers
+        workers = max(1, min(self.max_workers, pool_size, len(relations) or 1))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # Cada hilo recibe una copia del contexto para que sus logs lleguen a la captura de la corrida
+            futures = [executor.submit(contextvars.copy_context().run, self.scan_relation, relation)
+                       for relation in relations]
+            return [future.result() for future in futures]
+
+
+def check_orphans(engine, origen='declaradas', **options):
+    service = OrphanScanService(engine, **options)
+    resultados = service.scan(origen)
+    return {
+        "relaciones": resultados,
+        "total_huerfanos": sum(r['huerfanos'] for r in resultados),
+        "relaciones_con_huerfanos": sum(1 for r in resultados if r['huerfanos']),
+        "errores": sum(1 for r in resultados if r['error']),
+    }
@@ -0,0 +1,101 @@
+# services/RunStore.py
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS corridas (
+    run_id TEXT PRIMARY KEY,
+    tipo TEXT NOT NULL,
+    creado REAL NOT NULL,
+    accedido REAL NOT NULL,
+    resultado TEXT,
+    logs TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_corridas_accedido ON corridas (accedido);
+"""
+
+
+class RunStore:
+    def __init__(self, path=':memory:', max_runs=500, ttl=86400):
+        self.path = path
+        self.max_runs = max_runs
+        self.ttl = ttl
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _conexion(self):
+        # Llamado con el lock tomado: el archivo se abre o se crea en el primer uso, no al importar el módulo
+        if self._conn is None:
+            directorio = os.path.dirname(self.path)
+            if directorio:
+                os.makedirs(directorio, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def guardar(self, tipo, resultado, logs=None, error=None):
+        run_id = uuid.uuid4().hex
+        ahora = time.time()
+        with self._lock:
+            self._conexion().execute(
+                "INSERT INTO corridas (run_id, tipo, creado, accedido, resultado, logs, error) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (run_id, tipo, ahora, ahora, json.dumps(resultado, ensure_ascii=False, default=str), logs, error))
+            self._evictar(ahora)
+        return run_id
+
+    def _evictar(self, ahora):
+        # Llamado con el lock tomado: primero caducan por TTL, luego los menos usados si se excede el máximo
+        self._conn.execute("DELETE FROM corridas WHERE creado < ?", (ahora - self.ttl,))
+        sobrantes = self._conn.execute("SELECT COUNT(*) FROM corridas").fetchone()[0] - self.max_runs
+        if sobrantes > 0:
+            self._conn.execute(
+                "DELETE FROM corridas WHERE run_id IN "
+                "(SELECT run_id FROM corridas ORDER BY accedido LIMIT ?)", (sobrantes,))
+
+    def _leer(self, run_id, columnas):
+        ahora = time.time()
+        with self._lock:
+            fila = self._conexion().execute(
+                f"SELECT tipo, creado, {columnas} FROM corridas WHERE run_id = ? AND creado >= ?",
+                (run_id, ahora - self.ttl)).fetchone()
+            if fila is not None:
+                self._conn.execute("UPDATE corridas SET accedido = ? WHERE run_id = ?", (ahora, run_id))
+        return fila
+
+    def obtener(self, run_id):
+        fila = self._leer(run_id, 'resultado, error')
+        if fila is None:
+            return None
+        tipo, creado, resultado, error = fila
+        return {"run_id": run_id, "tipo": tipo, "creado": creado,
+                "resultado": json.loads(resultado) if resultado else None, "error": error}
+
+    def obtener_logs(self, run_id):
+        fila = self._leer(run_id, 'logs')
+        if fila is None:
+            return None
+        tipo, creado, logs = fila
+        return {"run_id": run_id, "tipo": tipo, "creado": creado, "logs": logs or ''}
+
+    def stats(self):
+        with self._lock:
+            total = self._conexion().execute("SELECT COUNT(*) FROM corridas").fetchone()[0]
+        return {"corridas": total, "max_runs": self.max_runs, "ttl": self.ttl, "path": self.path}
+
+
+run_store = RunStore(
+    path=os.environ.get('ANALISIS_CORRIDAS_DB', 'corridas_analisis.sqlite3'),
+    max_runs=int(os.environ.get('ANALISIS_CORRIDAS_MAX', 500)),
+    ttl=int(os.environ.get('ANALISIS_CORRIDAS_TTL', 86400)),
+)
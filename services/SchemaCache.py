@@ -0,0 +1,106 @@
+# services/SchemaCache.py
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import inspect, text
+
+from services.EngineRegistry import EngineRegistry
+from services.Metrics import medir_fase
+from services.SchemaSnapshot import load_schema_snapshot
+
+MSSQL_FINGERPRINT_QUERY = text("""
+SELECT COUNT(*), MAX(modify_date)
+FROM sys.objects
+WHERE is_ms_shipped = 0
+""")
+
+
+def schema_fingerprint(engine):
+    dialect = engine.dialect.name
+    with engine.connect() as conn:
+        if dialect == 'mssql':
+            count, last_modified = conn.execute(MSSQL_FINGERPRINT_QUERY).one()
+            return f"{count}:{last_modified}"
+        if dialect == 'sqlite':
+            return str(conn.execute(text("PRAGMA schema_version")).scalar())
+        # Sin consulta barata para el dialecto: nos basta con la lista de tablas
+        table_names = sorted(inspect(conn).get_table_names())
+    return hashlib.sha256('\n'.join(table_names).encode('utf-8')).hexdigest()
+
+
+class SchemaSnapshotCache:
+    def __init__(self, max_entries=32, ttl=3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+        self.logger = logging.getLogger(__name__)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_snapshot(self, engine):
+        key = EngineRegistry.make_key(engine.url)
+        with medir_fase('esquema.huella'):
+            fingerprint = schema_fingerprint(engine)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                snapshot, cached_fingerprint, loaded_at = entry
+                if cached_fingerprint == fingerprint and now - loaded_at <= self.ttl:
+                    self.hits += 1
+                    self._entries.move_to_end(key)
+                    return snapshot
+                self.invalidations += 1
+                del self._entries[key]
+            self.misses += 1
+
+        self.logger.info(f"Snapshot de esquema no válido en caché para {engine.url.database}, recargando")
+        with medir_fase('esquema.carga'):
+            snapshot = load_schema_snapshot(engine)
+        snapshot.fingerprint = fingerprint
+
+        with self._lock:
+            self._entries[key] = (snapshot, fingerprint, now)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return snapshot
+
+    def invalidate(self, engine=None):
+        with self._lock:
+            if engine is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(EngineRegistry.make_key(engine.url), None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "evictions": self.evictions,
+            }
+
+
+schema_cache = SchemaSnapshotCache(
+    max_entries=int(os.environ.get('SCHEMA_CACHE_MAX_ENTRIES', 32)),
+    ttl=int(os.environ.get('SCHEMA_CACHE_TTL', 3600)),
+)
+
+
+def get_schema_snapshot(engine):
+    return schema_cache.get_snapshot(engine)
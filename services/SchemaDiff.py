@@ -0,0 +1,78 @@
+# services/SchemaDiff.py
+
+
+class TableDiff:
+    __slots__ = ('name', 'added_columns', 'removed_columns', 'altered_columns', 'old_primary_key',
+                 'new_primary_key', 'added_foreign_keys', 'removed_foreign_keys', 'added_unique_constraints',
+                 'removed_unique_constraints')
+
+    def __init__(self, old_table, new_table):
+        self.name = new_table.name
+        old_columns = {column.name: column.signature() for column in old_table.columns}
+        new_columns = {column.name: column.signature() for column in new_table.columns}
+        self.added_columns = [name for name in new_columns if name not in old_columns]
+        self.removed_columns = [name for name in old_columns if name not in new_columns]
+        self.altered_columns = [name for name, signature in new_columns.items()
+                                if name in old_columns and old_columns[name] != signature]
+        self.old_primary_key = old_table.primary_key
+        self.new_primary_key = new_table.primary_key
+        old_fks = {fk.signature(): fk for fk in old_table.foreign_keys}
+        new_fks = {fk.signature(): fk for fk in new_table.foreign_keys}
+        self.added_foreign_keys = [fk for signature, fk in new_fks.items() if signature not in old_fks]
+        self.removed_foreign_keys = [fk for signature, fk in old_fks.items() if signature not in new_fks]
+        self.added_unique_constraints = [u for u in new_table.unique_constraints
+                                         if u not in old_table.unique_constraints]
+        self.removed_unique_constraints = [u for u in old_table.unique_constraints
+                                           if u not in new_table.unique_constraints]
+
+    def primary_key_changed(self):
+        return self.old_primary_key != self.new_primary_key
+
+    def to_dict(self):
+        result = {
+            "columnas_agregadas": self.added_columns,
+            "columnas_eliminadas": self.removed_columns,
+            "columnas_modificadas": self.altered_columns,
+            "fks_agregadas": [fk.name for fk in self.added_foreign_keys],
+            "fks_eliminadas": [fk.name for fk in self.removed_foreign_keys],
+        }
+        if self.added_unique_constraints or self.removed_unique_constraints:
+            result["restricciones_unicas"] = {"agregadas": [list(u) for u in self.added_unique_constraints],
+                                              "eliminadas": [list(u) for u in self.removed_unique_constraints]}
+        if self.primary_key_changed():
+            result["clave_primaria"] = {"antes": list(self.old_primary_key), "despues": list(self.new_primary_key)}
+        return result
+
+
+class SchemaDiff:
+    def __init__(self, added_tables=(), removed_tables=(), altered_tables=None):
+        self.added_tables = set(added_tables)
+        self.removed_tables = set(removed_tables)
+        self.altered_tables = altered_tables or {}
+
+    def is_empty(self):
+        return not (self.added_tables or self.removed_tables or self.altered_tables)
+
+    def changed_tables(self):
+        return self.added_tables | self.removed_tables | set(self.altered_tables)
+
+    def to_dict(self):
+        return {
+            "tablas_agregadas": sorted(self.added_tables),
+            "tablas_eliminadas": sorted(self.removed_tables),
+            "tablas_alteradas": {name: diff.to_dict() for name, diff in sorted(self.altered_tables.items())},
+        }
+
+
+def diff_snapshots(old, new):
+    if old is new:
+        return SchemaDiff()
+    added = [name for name in new.tables if name not in old.tables]
+    removed = [name for name in old.tables if name not in new.tables]
+    altered = {}
+    for name, table in new.tables.items():
+        old_table = old.tables.get(name)
+        # Las tablas sin cambios se descartan comparando firmas, sin construir el detalle
+        if old_table is not None and old_table is not table and old_table.signature() != table.signature():
+            altered[name] = TableDiff(old_table, table)
+    return SchemaDiff(added, removed, altered)
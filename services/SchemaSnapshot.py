@@ -0,0 +1,277 @@
+# services/SchemaSnapshot.py
+
+import logging
+import time
+from types import MappingProxyType
+
+from sqlalchemy import inspect, text
+
+from services.FkGraph import FkGraph
+from services.Metrics import medir_fase
+
+
+TYPE_FAMILIES = {
+    'entero': ('int', 'integer', 'bigint', 'smallint', 'tinyint', 'mediumint', 'serial', 'bigserial'),
+    'decimal': ('decimal', 'numeric', 'money', 'smallmoney', 'float', 'real', 'double', 'double precision'),
+    'texto': ('char', 'varchar', 'nchar', 'nvarchar', 'text', 'ntext', 'string', 'clob', 'character varying'),
+    'uuid': ('uniqueidentifier', 'uuid'),
+    'fecha': ('date', 'datetime', 'datetime2', 'smalldatetime', 'datetimeoffset', 'timestamp', 'time'),
+    'binario': ('binary', 'varbinary', 'image', 'blob', 'bytea'),
+    'booleano': ('bit', 'boolean', 'bool'),
+}
+
+_TYPE_FAMILY_BY_NAME = {name: family for family, names in TYPE_FAMILIES.items() for name in names}
+
+
+def type_family(type_name):
+    return _TYPE_FAMILY_BY_NAME.get(type_name, type_name)
+
+
+class ColumnInfo:
+    __slots__ = ('name', 'type', 'nullable')
+
+    def __init__(self, name, type, nullable=True):
+        self.name = name
+        self.type = type
+        self.nullable = nullable
+
+    def signature(self):
+        return self.name, self.type, self.nullable
+
+
+class ForeignKeyInfo:
+    __slots__ = ('name', 'table', 'constrained_columns', 'referred_schema', 'referred_table',
+                 'referred_columns', 'options')
+
+    def __init__(self, name, table, constrained_columns, referred_table, referred_columns,
+                 referred_schema=None, options=None):
+        self.name = name
+        self.table = table
+        self.constrained_columns = tuple(constrained_columns)
+        self.referred_schema = referred_schema
+        self.referred_table = referred_table
+        self.referred_columns = tuple(referred_columns)
+        self.options = MappingProxyType(dict(options or {}))
+
+    def signature(self):
+        return (self.name, self.constrained_columns, self.referred_schema, self.referred_table,
+                self.referred_columns, tuple(sorted(self.options.items())))
+
+
+class TableInfo:
+    __slots__ = ('name', 'columns', 'primary_key', 'foreign_keys', 'unique_constraints')
+
+    def __init__(self, name, columns, primary_key=(), foreign_keys=(), unique_constraints=()):
+        self.name = name
+        self.columns = tuple(columns)
+        self.primary_key = tuple(primary_key)
+        self.foreign_keys = tuple(foreign_keys)
+        # Restricciones UNIQUE e índices únicos, como tuplas de columnas ordenadas
+        self.unique_constraints = tuple(sorted(set(tuple(columns) for columns in unique_constraints)))
+
+    def column_names(self):
+        return [column.name for column in self.columns]
+
+    def is_unique(self, column_names):
+        # Una combinación es única si contiene la PK o alguna restricción única completa
+        column_names = set(column_names)
+        keys = ((self.primary_key,) if self.primary_key else ()) + self.unique_constraints
+        return any(column_names.issuperset(key) for key in keys)
+
+    def signature(self):
+        return (tuple(column.signature() for column in self.columns), self.primary_key,
+                tuple(fk.signature() for fk in self.foreign_keys), self.unique_constraints)
+
+
+class SchemaSnapshot:
+    def __init__(self, dialect, tables):
+        self.dialect = dialect
+        self.tables = MappingProxyType({table.name: table for table in tables})
+        self.loaded_at = time.time()
+        self.fingerprint = None
+        self._fk_graph = None
+
+    def table_names(self):
+        return list(self.tables)
+
+    def iter_columns(self):
+        for table in self.tables.values():
+            for column in table.columns:
+                yield table.name, column
+
+    def iter_primary_keys(self):
+        for table in self.tables.values():
+            for column_name in table.primary_key:
+                yield table.name, column_name
+
+    def iter_foreign_keys(self):
+        for table in self.tables.values():
+            yield from table.foreign_keys
+
+    def count_columns(self):
+        return sum(len(table.columns) for table in self.tables.values())
+
+    def count_foreign_keys(self):
+        return sum(len(table.foreign_keys) for table in self.tables.values())
+
+    def fk_graph(self):
+        # El snapshot no cambia después de cargarse: el grafo se construye una sola vez y se comparte
+        if self._fk_graph is None:
+            with medir_fase('grafo_fk.construccion'):
+                self._fk_graph = FkGraph(self)
+        return self._fk_graph
+
+
+MSSQL_TABLES_QUERY = text("""
+SELECT t.name
+FROM sys.tables t
+WHERE t.schema_id = SCHEMA_ID() AND t.is_ms_shipped = 0
+ORDER BY t.name
+""")
+
+MSSQL_COLUMNS_QUERY = text("""
+SELECT t.name, c.name, ty.name, c.is_nullable
+FROM sys.columns c
+JOIN sys.tables t ON t.object_id = c.object_id
+JOIN sys.types ty ON ty.user_type_id = c.user_type_id
+WHERE t.schema_id = SCHEMA_ID() AND t.is_ms_shipped = 0
+ORDER BY t.name, c.column_id
+""")
+
+MSSQL_PRIMARY_KEYS_QUERY = text("""
+SELECT t.name, c.name
+FROM sys.key_constraints kc
+JOIN sys.tables t ON t.object_id = kc.parent_object_id
+JOIN sys.index_columns ic ON ic.object_id = kc.parent_object_id AND ic.index_id = kc.unique_index_id
+JOIN sys.columns c ON c.object_id = ic.object_id AND c.column_id = ic.column_id
+WHERE kc.type = 'PK' AND t.schema_id = SCHEMA_ID() AND t.is_ms_shipped = 0
+ORDER BY t.name, ic.key_ordinal
+""")
+
+MSSQL_UNIQUE_QUERY = text("""
+SELECT t.name, i.name, c.name
+FROM sys.indexes i
+JOIN sys.tables t ON t.object_id = i.object_id
+JOIN sys.index_columns ic ON ic.object_id = i.object_id AND ic.index_id = i.index_id
+JOIN sys.columns c ON c.object_id = ic.object_id AND c.column_id = ic.column_id
+WHERE i.is_unique = 1 AND i.is_primary_key = 0 AND ic.is_included_column = 0
+  AND t.schema_id = SCHEMA_ID() AND t.is_ms_shipped = 0
+ORDER BY t.name, i.name, ic.key_ordinal
+""")
+
+MSSQL_FOREIGN_KEYS_QUERY = text("""
+SELECT fk.name, pt.name, pc.name, SCHEMA_NAME(rt.schema_id), rt.name, rc.name,
+       fk.delete_referential_action_desc, fk.update_referential_action_desc
+FROM sys.foreign_keys fk
+JOIN sys.foreign_key_columns fkc ON fkc.constraint_object_id = fk.object_id
+JOIN sys.tables pt ON pt.object_id = fk.parent_object_id
+JOIN sys.columns pc ON pc.object_id = fkc.parent_object_id AND pc.column_id = fkc.parent_column_id
+JOIN sys.tables rt ON rt.object_id = fk.referenced_object_id
+JOIN sys.columns rc ON rc.object_id = fkc.referenced_object_id AND rc.column_id = fkc.referenced_column_id
+WHERE pt.schema_id = SCHEMA_ID() AND pt.is_ms_shipped = 0
+ORDER BY pt.name, fk.name, fkc.constraint_column_id
+""")
+
+
+def _fk_options(delete_action, update_action):
+    # Mismo formato que el Inspector: solo se incluyen las acciones distintas de NO ACTION
+    options = {}
+    if delete_action and delete_action != 'NO_ACTION':
+        options['ondelete'] = delete_action.replace('_', ' ')
+    if update_action and update_action != 'NO_ACTION':
+        options['onupdate'] = update_action.replace('_', ' ')
+    return options
+
+
+def _load_mssql(engine):
+    with engine.connect() as conn:
+        table_names = [row[0] for row in conn.execute(MSSQL_TABLES_QUERY)]
+        default_schema = conn.execute(text("SELECT SCHEMA_NAME()")).scalar()
+
+        columns = {name: [] for name in table_names}
+        for table_name, column_name, type_name, is_nullable in conn.execute(MSSQL_COLUMNS_QUERY):
+            columns[table_name].append(ColumnInfo(column_name, type_name.lower(), bool(is_nullable)))
+
+        primary_keys = {name: [] for name in table_names}
+        for table_name, column_name in conn.execute(MSSQL_PRIMARY_KEYS_QUERY):
+            primary_keys[table_name].append(column_name)
+
+        # Incluye las restricciones UNIQUE: SQL Server las implementa como índices únicos
+        unique_rows = {}
+        for table_name, index_name, column_name in conn.execute(MSSQL_UNIQUE_QUERY):
+            unique_rows.setdefault((table_name, index_name), []).append(column_name)
+
+        fk_rows = {}
+        for (fk_name, table_name, column_name, referred_schema, referred_table, referred_column,
+             delete_action, update_action) in conn.execute(MSSQL_FOREIGN_KEYS_QUERY):
+            fk = fk_rows.setdefault((table_name, fk_name), {
+                "referred_schema": referred_schema if referred_schema != default_schema else None,
+                "referred_table": referred_table,
+                "constrained_columns": [],
+                "referred_columns": [],
+                "options": _fk_options(delete_action, update_action),
+            })
+            fk["constrained_columns"].append(column_name)
+            fk["referred_columns"].append(referred_column)
+
+    foreign_keys = {name: [] for name in table_names}
+    for (table_name, fk_name), fk in fk_rows.items():
+        foreign_keys[table_name].append(ForeignKeyInfo(fk_name, table_name, **fk))
+
+    unique_constraints = {name: [] for name in table_names}
+    for (table_name, _), unique_columns in unique_rows.items():
+        unique_constraints[table_name].append(unique_columns)
+
+    return SchemaSnapshot('mssql', [
+        TableInfo(name, columns[name], primary_keys[name], foreign_keys[name], unique_constraints[name])
+        for name in table_names
+    ])
+
+
+def _type_name(column_type):
+    try:
+        name = str(column_type)
+    except Exception:
+        name = type(column_type).__name__
+    return name.split('(')[0].strip().lower()
+
+
+def _load_generic(engine):
+    inspector = inspect(engine)
+    table_names = inspector.get_table_names()
+    multi_columns = inspector.get_multi_columns()
+    multi_pks = inspector.get_multi_pk_constraint()
+    multi_fks = inspector.get_multi_foreign_keys()
+    multi_uniques = inspector.get_multi_unique_constraints()
+    multi_indexes = inspector.get_multi_indexes()
+
+    tables = []
+    for table_name in table_names:
+        key = (None, table_name)
+        columns = [ColumnInfo(column['name'], _type_name(column['type']), column.get('nullable', True))
+                   for column in multi_columns.get(key, [])]
+        primary_key = (multi_pks.get(key) or {}).get('constrained_columns') or []
+        foreign_keys = [
+            ForeignKeyInfo(fk['name'], table_name, fk['constrained_columns'], fk['referred_table'],
+                           fk['referred_columns'], fk.get('referred_schema'), fk.get('options'))
+            for fk in multi_fks.get(key, [])
+        ]
+        unique_constraints = [unique['column_names'] for unique in multi_uniques.get(key, [])]
+        # Los índices sobre expresiones traen None en column_names: no cubren columnas concretas
+        unique_constraints.extend(index['column_names'] for index in multi_indexes.get(key, [])
+                                  if index.get('unique') and None not in index['column_names'])
+        tables.append(TableInfo(table_name, columns, primary_key, foreign_keys, unique_constraints))
+
+    return SchemaSnapshot(engine.dialect.name, tables)
+
+
+def load_schema_snapshot(engine):
+    logger = logging.getLogger(__name__)
+    start = time.perf_counter()
+    if engine.dialect.name == 'mssql':
+        snapshot = _load_mssql(engine)
+    else:
+        snapshot = _load_generic(engine)
+    logger.info(f"Catálogo cargado: {len(snapshot.tables)} tablas, {snapshot.count_columns()} columnas, "
+                f"{snapshot.count_foreign_keys()} claves foráneas en {time.perf_counter() - start:.3f}s")
+    return snapshot
@@ -0,0 +1,82 @@
+# services/Sketches.py
+
+import heapq
+import math
+
+_MASK64 = 0xFFFFFFFFFFFFFFFF
+
+
+def hash64(value):
+    # splitmix64 sobre hash(): hash() de enteros pequeños no está distribuido uniformemente
+    x = (hash(value) + 0x9E3779B97F4A7C15) & _MASK64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return x ^ (x >> 31)
+
+
+class BloomFilter:
+    __slots__ = ('num_bits', 'num_hashes', 'bits', 'count')
+
+    def __init__(self, num_bits=1 << 16, num_hashes=3):
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.bits = bytearray(num_bits // 8 + 1)
+        self.count = 0
+
+    @classmethod
+    def for_capacity(cls, capacity, false_positive_rate=0.01):
+        # Tamaño óptimo para `capacity` elementos: m = -n ln p / (ln 2)^2 bits y k = (m / n) ln 2 funciones
+        capacity = max(int(capacity), 1)
+        num_bits = max(64, math.ceil(-capacity * math.log(false_positive_rate) / math.log(2) ** 2))
+        num_hashes = max(1, round(num_bits / capacity * math.log(2)))
+        return cls(num_bits, num_hashes)
+
+    def positions(self, hashed):
+        h1 = hashed & 0xFFFFFFFF
+        h2 = (hashed >> 32) | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add_hash(self, hashed):
+        bits = self.bits
+        for position in self.positions(hashed):
+            bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def contains_positions(self, positions):
+        bits = self.bits
+        for position in positions:
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def contains_hash(self, hashed):
+        return self.contains_positions(self.positions(hashed))
+
+    def fill_ratio(self):
+        return sum(bin(byte).count('1') for byte in self.bits) / self.num_bits
+
+
+# Estimador KMV (k valores mínimos) del número de valores distintos
+class DistinctCounter:
+    __slots__ = ('k', '_heap', '_members')
+
+    def __init__(self, k=256):
+        self.k = k
+        self._heap = []
+        self._members = set()
+
+    def add_hash(self, hashed):
+        if hashed in self._members:
+            return
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, -hashed)
+            self._members.add(hashed)
+        elif hashed < -self._heap[0]:
+            removed = -heapq.heappushpop(self._heap, -hashed)
+            self._members.discard(removed)
+            self._members.add(hashed)
+
+    def estimate(self):
+        if len(self._heap) < self.k:
+            return len(self._heap)
+        return int((self.k - 1) * (_MASK64 + 1) / -self._heap[0])
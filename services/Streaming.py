@@ -0,0 +1,38 @@
+# services/Streaming.py
+
+import contextvars
+import functools
+import json
+
+
+def generador_aislado(funcion):
+    # Cada paso del generador corre en su propio contexto: la captura de logs y el progreso
+    # que abre no se filtran a quien lo consume entre un yield y el siguiente
+    @functools.wraps(funcion)
+    def envoltura(*args, **kwargs):
+        contexto = contextvars.copy_context()
+        generador = contexto.run(funcion, *args, **kwargs)
+        try:
+            while True:
+                try:
+                    yield contexto.run(next, generador)
+                except StopIteration:
+                    return
+        finally:
+            contexto.run(generador.close)
+    return envoltura
+
+
+def a_ndjson(registros):
+    # registros: pares (seccion, dato); el último par es ('resumen', {...})
+    try:
+        for seccion, dato in registros:
+            tipo = 'resumen' if seccion == 'resumen' else 'hallazgo'
+            yield json.dumps({"tipo": tipo, "seccion": seccion, "dato": dato}, ensure_ascii=False, default=str) + '\n'
+    except Exception as e:
+        yield json.dumps({"tipo": "error", "mensaje": str(e)}, ensure_ascii=False) + '\n'
+
+
+def es_streaming(request):
+    return (str(request.form.get('stream', '')).lower() in ('1', 'true', 'si')
+            or request.accept_mimetypes.best == 'application/x-ndjson')
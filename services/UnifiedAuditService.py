@@ -0,0 +1,95 @@
+# services/UnifiedAuditService.py
+
+import contextvars
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from services.DataAnomaly import check_data_anomalies
+from services.IntegridadReferencialService import check_integridad_referencial
+from services.JobManager import TrabajoCancelado
+from services.Metrics import medir_fase
+from services.SchemaCache import get_schema_snapshot
+
+
+def resumir_anomalias(engine, snapshot, perfilar=False):
+    result, _, run_id = check_data_anomalies(engine, snapshot, perfilar)
+    return run_id, {seccion: len(hallazgos) for seccion, hallazgos in result.items()}, result
+
+
+def resumir_integridad(engine, snapshot):
+    result, error, run_id = check_integridad_referencial(engine, snapshot)
+    if error:
+        raise RuntimeError(error)
+    return run_id, {seccion: len(hallazgos) for seccion, hallazgos in result["anomalias"].items()}, result
+
+
+def resumir_relaciones(engine, snapshot, modo_descubrimiento='nombres'):
+    from services.IntegridadReferencialRelacionalService import check_relations
+    result, _, run_id = check_relations(engine, snapshot, modo_descubrimiento)
+    return run_id, {clave: valor for clave, valor in result.items() if clave.startswith('num_')}, result
+
+
+ANALISIS = {
+    'anomalias': resumir_anomalias,
+    'integridad': resumir_integridad,
+    'relaciones': resumir_relaciones,
+}
+
+
+class UnifiedAuditService:
+    def __init__(self, engine, secciones=tuple(ANALISIS), opciones=None, max_workers=None, detalle=True):
+        secciones = list(dict.fromkeys(secciones))
+        invalidas = [nombre for nombre in secciones if nombre not in ANALISIS]
+        if invalidas or not secciones:
+            raise ValueError(f"Secciones no válidas: {', '.join(invalidas) or '(ninguna)'}. Use: {', '.join(ANALISIS)}")
+        self.engine = engine
+        self.secciones = secciones
+        # Opciones propias de cada sección, p. ej. {'relaciones': {'modo_descubrimiento': 'datos'}}
+        self.opciones = opciones or {}
+        self.max_workers = max_workers or len(secciones)
+        self.detalle = detalle
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.INFO)
+
+    def ejecutar_seccion(self, nombre, snapshot):
+        start = time.perf_counter()
+        try:
+            with medir_fase(f'auditoria.{nombre}'):
+                run_id, resumen, detalle = ANALISIS[nombre](self.engine, snapshot, **self.opciones.get(nombre, {}))
+        except TrabajoCancelado:
+            raise
+        except Exception as e:
+            self.logger.error(f"Falló la sección {nombre}: {str(e)}")
+            return {"estado": "error", "error": str(e), "tiempo": round(time.perf_counter() - start, 3)}
+        reporte = {"estado": "ok", "run_id": run_id, "resumen": resumen,
+                   "tiempo": round(time.perf_counter() - start, 3)}
+        if self.detalle:
+            reporte["resultado"] = detalle
+        return reporte
+
+    def ejecutar(self, snapshot=None):
+        start = time.perf_counter()
+        if snapshot is None:
+            snapshot = get_schema_snapshot(self.engine)
+        tiempo_esquema = time.perf_counter() - start
+
+        # El snapshot no se modifica durante el análisis: todas las secciones leen la misma instancia
+        workers = max(1, min(self.max_workers, len(self.secciones)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='auditoria') as executor:
+            futures = {nombre: executor.submit(contextvars.copy_context().run, self.ejecutar_seccion, nombre, snapshot)
+                       for nombre in self.secciones}
+            secciones = {nombre: future.result() for nombre, future in futures.items()}
+
+        errores = sum(1 for seccion in secciones.values() if seccion["estado"] == "error")
+        return {
+            "estado": "ok" if not errores else ("error" if errores == len(secciones) else "parcial"),
+            "esquema": {"tablas": len(snapshot.tables), "huella": snapshot.fingerprint,
+                        "tiempo": round(tiempo_esquema, 3)},
+            "secciones": secciones,
+            "tiempo": round(time.perf_counter() - start, 3),
+        }
+
+
+def audit_database(engine, secciones=tuple(ANALISIS), snapshot=None, **options):
+    return UnifiedAuditService(engine, secciones, **options).ejecutar(snapshot)
@@ -0,0 +1,27 @@
+# tests/conftest.py
+
+import os
+import sys
+
+import pytest
+from sqlalchemy import create_engine
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def crear_engine(tmp_path):
+    # Una base SQLite por nombre dentro del directorio temporal del test
+    engines = []
+
+    def crear(nombre='base', *sentencias):
+        engine = create_engine(f"sqlite:///{tmp_path / (nombre + '.sqlite3')}")
+        with engine.begin() as conn:
+            for sentencia in sentencias:
+                conn.exec_driver_sql(sentencia)
+        engines.append(engine)
+        return engine
+
+    yield crear
+    for engine in engines:
+        engine.dispose()
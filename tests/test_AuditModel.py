@@ -0,0 +1,126 @@
+# tests/test_AuditModel.py
+
+import base64
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import insert
+
+from Models.AuditModel import AuditModel, AuditoriaLog, Base
+
+decodificar = AuditModel.decodificar_datos
+
+
+def modelo_sobre(engine):
+    # Como en los benchmarks: sin pasar por el registro de engines ni crear triggers
+    modelo = AuditModel.__new__(AuditModel)
+    modelo.engine = engine
+    modelo.modo_trigger = 'completo'
+    Base.metadata.create_all(engine)
+    return modelo
+
+
+def cursor_de(valor):
+    return base64.urlsafe_b64encode(json.dumps(valor).encode('utf-8')).decode('ascii')
+
+
+def test_decodificar_insert_y_delete():
+    assert decodificar('INSERT', '[{"id": 1, "a": 2}]') == [
+        {"clave": {"posicion": 0}, "antes": None, "despues": {"id": 1, "a": 2}}]
+    assert decodificar('DELETE', '[{"id": 1, "a": 2}]', ['id']) == [
+        {"clave": {"id": 1}, "antes": {"id": 1, "a": 2}, "despues": None}]
+
+
+def test_decodificar_vacio():
+    assert decodificar('UPDATE', None) == []
+    assert decodificar('INSERT', '') == []
+
+
+def test_decodificar_update_empareja_por_clave():
+    datos = '[{"id": 1, "a": 2}, {"id": 2, "a": 3}] -> [{"id": 2, "a": 4}, {"id": 1, "a": 5}]'
+    assert decodificar('UPDATE', datos, ['id']) == [
+        {"clave": {"id": 1}, "antes": {"id": 1, "a": 2}, "despues": {"id": 1, "a": 5}},
+        {"clave": {"id": 2}, "antes": {"id": 2, "a": 3}, "despues": {"id": 2, "a": 4}},
+    ]
+
+
+def test_decodificar_update_sin_clave_no_empareja_por_posicion():
+    datos = '[{"a": 2}, {"a": 3}] -> [{"a": 4}, {"a": 5}]'
+    assert decodificar('UPDATE', datos) == [
+        {"clave": None, "antes": [{"a": 2}, {"a": 3}], "despues": [{"a": 4}, {"a": 5}]}]
+    # Con una sola fila no hay ambigüedad
+    assert decodificar('UPDATE', '[{"a": 2}] -> [{"a": 5}]') == [
+        {"clave": {"posicion": 0}, "antes": {"a": 2}, "despues": {"a": 5}}]
+
+
+def test_decodificar_diferencial_por_ordinal():
+    datos = json.dumps({"k": {"0": {"n": "id", "v": 5}},
+                        "c": {"0": {"n": "a.b", "a": 1, "d": 2}, "1": {"n": "x", "d": 3}},
+                        "omitidas": ["notas"]})
+    assert decodificar('UPDATE', datos) == [{
+        "clave": {"id": 5},
+        "antes": {"a.b": 1, "x": None},
+        "despues": {"a.b": 2, "x": 3},
+        "omitidas": ["notas"],
+    }]
+
+
+def test_decodificar_diferencial_por_nombre():
+    # Registros escritos por triggers anteriores, indexados por nombre de columna
+    datos = '{"k": {"id": 5}, "c": {"x": {"a": 1, "d": 2}}}'
+    assert decodificar('UPDATE', datos) == [{"clave": {"id": 5}, "antes": {"x": 1}, "despues": {"x": 2}}]
+
+
+@pytest.mark.parametrize('cursor', [
+    cursor_de({"a": 1}), cursor_de([1, 2]), cursor_de(["2024-01-01", "x"]), cursor_de(["no es fecha", 3]),
+    cursor_de(["2024-01-01", True]), '%%%', 'ñ', 5,
+])
+def test_cursor_no_valido(cursor):
+    with pytest.raises(ValueError):
+        AuditModel.decodificar_cursor(cursor)
+
+
+def test_limite_fuera_de_rango(crear_engine):
+    modelo = modelo_sobre(crear_engine())
+    for limite in (0, -1, 100000, 'x', [1]):
+        with pytest.raises(ValueError):
+            modelo.consultar_log(limite=limite)
+
+
+def test_consultar_log_pagina_tabla_y_archivo(crear_engine, tmp_path, monkeypatch):
+    monkeypatch.setenv('AUDITORIA_ARCHIVO_DIR', str(tmp_path / 'archivo'))
+    modelo = modelo_sobre(crear_engine())
+    inicio = datetime(2024, 1, 1)
+    with modelo.engine.begin() as conn:
+        conn.execute(insert(AuditoriaLog.__table__), [
+            {"id": i, "tabla": "t", "operacion": "INSERT", "usuario": "u",
+             "fecha_hora": inicio + timedelta(hours=i), "datos": json.dumps([{"id": i}])}
+            for i in range(1, 31)])
+    resumen = modelo.archivar_log(inicio + timedelta(hours=12), tamano_lote=5)
+    assert resumen["filas"] == 11
+
+    ids, cursor = [], None
+    while True:
+        pagina = modelo.consultar_log(columnas=['id'], limite=7, cursor=cursor, incluir_archivo=True)
+        ids.extend(registro['id'] for registro in pagina['registros'])
+        cursor = pagina['siguiente_cursor']
+        if cursor is None:
+            break
+    assert ids == list(range(30, 0, -1))
+
+    # Sin el archivo solo quedan las filas de la tabla
+    pagina = modelo.consultar_log(columnas=['id'], limite=100)
+    assert [registro['id'] for registro in pagina['registros']] == list(range(30, 11, -1))
+
+
+def test_consultar_log_decodifica_con_la_clave(crear_engine):
+    engine = crear_engine('base', "CREATE TABLE t (id INTEGER PRIMARY KEY, a INTEGER)")
+    modelo = modelo_sobre(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(AuditoriaLog.__table__), [{
+            "id": 1, "tabla": "t", "operacion": "UPDATE", "usuario": "u", "fecha_hora": datetime(2024, 1, 1),
+            "datos": '[{"id": 1, "a": 2}, {"id": 2, "a": 3}] -> [{"id": 2, "a": 4}, {"id": 1, "a": 5}]'}])
+    registro = modelo.consultar_log(columnas=['id'], decodificar=True)['registros'][0]
+    assert registro['id'] == 1
+    assert [cambio['clave'] for cambio in registro['cambios']] == [{"id": 1}, {"id": 2}]
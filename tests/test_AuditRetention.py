@@ -0,0 +1,71 @@
+# tests/test_AuditRetention.py
+
+import os
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import func, insert, select
+
+from Models.AuditModel import AuditoriaLog, Base
+from Models.AuditRetention import AuditRetention
+
+LOG = AuditoriaLog.__table__
+INICIO = datetime(2024, 1, 1)
+
+
+def poblar(engine, filas, tabla='t'):
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(LOG), [
+            {"id": i, "tabla": tabla, "operacion": "INSERT", "usuario": "u",
+             "fecha_hora": INICIO + timedelta(hours=i), "datos": f'[{{"id": {i}}}]'}
+            for i in range(1, filas + 1)])
+
+
+def test_archivar_y_consultar(crear_engine, tmp_path):
+    engine = crear_engine()
+    poblar(engine, 50)
+    retencion = AuditRetention(engine, LOG, str(tmp_path / 'archivo'), ventana='dia')
+    resumen = retencion.archivar(INICIO + timedelta(hours=40), tamano_lote=15)
+
+    assert resumen["filas"] == 39
+    assert resumen["lotes"] == 3
+    with engine.connect() as conn:
+        assert conn.execute(select(func.min(LOG.c.id))).scalar() == 40
+    indice = retencion.leer_indice()
+    assert sum(segmento["filas"] for segmento in indice) == 39
+    assert all(segmento["tablas"] == ['t'] for segmento in indice)
+
+    filas = retencion.consultar(lambda fila: True, 10)
+    assert [fila['id'] for fila in filas] == list(range(39, 29, -1))
+    assert filas[0]['fecha_hora'] == INICIO + timedelta(hours=39)
+
+    # desde solo descarta segmentos: el filtro decide fila a fila
+    desde = INICIO + timedelta(hours=30)
+    filas = retencion.consultar(lambda fila: fila['id'] % 2 == 0 and fila['fecha_hora'] >= desde, 100, desde=desde)
+    assert [fila['id'] for fila in filas] == list(range(38, 29, -2))
+
+
+def test_bases_distintas_no_comparten_archivo(crear_engine, tmp_path):
+    # Los mismos ids y fechas en dos bases: ningún segmento ni índice debe pisarse
+    primera, segunda = crear_engine('primera'), crear_engine('segunda')
+    poblar(primera, 20, tabla='a')
+    poblar(segunda, 20, tabla='b')
+    raiz = tmp_path / 'archivo'
+    retenciones = [AuditRetention(engine, LOG, str(raiz)) for engine in (primera, segunda)]
+    for retencion in retenciones:
+        retencion.archivar(INICIO + timedelta(days=1))
+
+    assert retenciones[0].directorio != retenciones[1].directorio
+    assert sorted(os.listdir(raiz)) == sorted(retencion.base for retencion in retenciones)
+    archivos = [{segmento["archivo"] for segmento in retencion.leer_indice()} for retencion in retenciones]
+    assert not archivos[0] & archivos[1]
+    for retencion, tabla in zip(retenciones, ('a', 'b')):
+        filas = retencion.consultar(lambda fila: True, 100)
+        assert len(filas) == 20
+        assert {fila['tabla'] for fila in filas} == {tabla}
+
+
+def test_ventana_no_valida(crear_engine):
+    with pytest.raises(ValueError):
+        AuditRetention(crear_engine(), LOG, ventana='semana')
@@ -0,0 +1,96 @@
+# tests/test_DmlParser.py
+
+import pytest
+from sqlalchemy.dialects import mssql, sqlite
+
+from Models.DmlParser import (ConsultaNoSoportada, analizar_completo, analizar_sentencia, dividir_nombre,
+                              limpiar_cache, nombre_calificado, nombre_sql)
+
+
+@pytest.fixture(autouse=True)
+def cache_limpia():
+    limpiar_cache()
+    yield
+    limpiar_cache()
+
+
+def test_insert_varias_filas():
+    sentencia = analizar_sentencia("INSERT INTO t (a, b) VALUES (1, 'x''y'), (-2, NULL)")
+    assert (sentencia.operacion, sentencia.esquema, sentencia.tabla) == ('INSERT', None, 't')
+    assert sentencia.columnas == ('a', 'b')
+    assert sentencia.filas == [{'a': '1', 'b': "'x''y'"}, {'a': '-2', 'b': 'NULL'}]
+    assert sentencia.parametrizable
+    assert sentencia.parametros() == [{'a': 1, 'b': "x'y"}, {'a': -2, 'b': None}]
+
+
+def test_update_con_esquema_y_claves():
+    sentencia = analizar_sentencia("UPDATE dbo.[Order Details] SET qty = 5, note = N'hola' WHERE id = 3 AND k = 'z'")
+    assert (sentencia.operacion, sentencia.esquema, sentencia.tabla) == ('UPDATE', 'dbo', 'Order Details')
+    assert sentencia.valores == {'qty': '5', 'note': "N'hola'"}
+    assert sentencia.donde == "id = 3 AND k = 'z'"
+    assert sentencia.parametros() == ({'qty': 5, 'note': 'hola'}, {'id': 3, 'k': 'z'})
+
+
+def test_expresiones_y_where_libre_no_son_parametrizables():
+    sentencia = analizar_sentencia("UPDATE t SET a = a + 1 WHERE id = 3")
+    assert sentencia.valores == {'a': 'a + 1'}
+    assert not sentencia.parametrizable
+
+    sentencia = analizar_sentencia("DELETE FROM t WHERE id > 3")
+    assert sentencia.donde == 'id > 3'
+    assert sentencia.claves is None
+    assert not sentencia.parametrizable
+
+
+def test_delete_con_punto_y_coma():
+    sentencia = analizar_sentencia("DELETE FROM t WHERE id = 3;")
+    assert sentencia.donde == 'id = 3'
+    assert sentencia.parametros() == ({}, {'id': 3})
+
+
+@pytest.mark.parametrize('query', ["SELECT * FROM t", "DROP TABLE t", "INSERT INTO t (a) VALUES (1) ¤"])
+def test_sentencias_no_soportadas(query):
+    assert analizar_sentencia(query) is None
+
+
+@pytest.mark.parametrize('query', [
+    "INSERT INTO t (a, b) VALUES (1, 'x')",
+    "UPDATE t SET a = 1.5e3, b = N'ñ' WHERE id = 7",
+    "DELETE FROM t WHERE id = -4",
+])
+def test_ruta_rapida_coincide_con_la_completa(query):
+    # La segunda llamada sale de la caché de plantillas: debe dar lo mismo que tokenizar la sentencia
+    for _ in range(2):
+        rapida, completa = analizar_sentencia(query), analizar_completo(query)
+        assert (rapida.operacion, rapida.tabla, rapida.filas, rapida.valores, rapida.donde, rapida.claves) == \
+               (completa.operacion, completa.tabla, completa.filas, completa.valores, completa.donde, completa.claves)
+
+
+@pytest.mark.parametrize('nombre, esperado', [
+    ('t', (None, 't')),
+    ('dbo.t', ('dbo', 't')),
+    ('[dbo].[Order Details]', ('dbo', 'Order Details')),
+    ('db.dbo.[a.b]', ('db.dbo', 'a.b')),
+    ('[a]]b]', (None, 'a]b')),
+])
+def test_dividir_nombre(nombre, esperado):
+    assert dividir_nombre(nombre) == esperado
+    # La forma canónica vuelve a dividirse en las mismas partes
+    assert dividir_nombre(nombre_calificado(*esperado)) == esperado
+
+
+@pytest.mark.parametrize('nombre', ['', 'a..b', '[x', 'a.'])
+def test_dividir_nombre_invalido(nombre):
+    with pytest.raises(ConsultaNoSoportada):
+        dividir_nombre(nombre)
+
+
+def test_nombre_calificado():
+    assert nombre_calificado(None, 't') == 't'
+    assert nombre_calificado('dbo', 'Order Details') == 'dbo.[Order Details]'
+    assert nombre_calificado('ventas', 'a]b') == 'ventas.[a]]b]'
+
+
+def test_nombre_sql_cita_cada_parte():
+    assert nombre_sql('dbo.[Order Details]', mssql.dialect().identifier_preparer) == 'dbo.[Order Details]'
+    assert nombre_sql('[a"b]', sqlite.dialect().identifier_preparer) == '"a""b"'
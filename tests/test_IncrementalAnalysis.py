@@ -0,0 +1,87 @@
+# tests/test_IncrementalAnalysis.py
+
+import json
+
+import pytest
+
+from services.DataAnomaly import DataAnomalyService
+from services.IncrementalAnalysis import IncrementalAnalysis
+from services.IntegridadReferencialRelacionalService import IntegridadReferencialRelacionalService
+from services.IntegridadReferencialService import IntegridadReferencialService
+from services.SchemaSnapshot import load_schema_snapshot
+
+ESQUEMA = [
+    "CREATE TABLE clientes (id INTEGER PRIMARY KEY, nombre TEXT)",
+    "CREATE TABLE pedidos (id INTEGER PRIMARY KEY, clientes_id INTEGER REFERENCES clientes (id) ON DELETE CASCADE)",
+    "CREATE TABLE productos (id INTEGER PRIMARY KEY, nombre TEXT)",
+    "CREATE TABLE lineas (id INTEGER PRIMARY KEY, pedidos_id INTEGER REFERENCES pedidos (id), productos_id INTEGER)",
+    "CREATE TABLE suelta (codigo TEXT PRIMARY KEY)",
+]
+
+# Cada paso cambia el esquema de una forma que afecta a tablas distintas de la alterada
+CAMBIOS = [
+    ["CREATE TABLE proveedores (id INTEGER PRIMARY KEY)",
+     "CREATE TABLE compras (id INTEGER PRIMARY KEY, proveedores_id INTEGER, clientes_id INTEGER)"],
+    ["DROP TABLE productos"],
+    ["DROP TABLE suelta", "CREATE TABLE suelta (codigo TEXT, id INTEGER PRIMARY KEY)"],
+    ["CREATE TABLE productos (productos_id INTEGER PRIMARY KEY, lineas_id INTEGER REFERENCES lineas (id))"],
+]
+
+
+def canonico(valor):
+    # Las secciones son listas de hallazgos: se comparan sin depender del orden de las tablas
+    if hasattr(valor, 'to_dict'):
+        valor = valor.to_dict()
+    if isinstance(valor, dict):
+        return {clave: canonico(v) for clave, v in valor.items()}
+    if isinstance(valor, list):
+        return sorted((canonico(v) for v in valor), key=lambda v: json.dumps(v, sort_keys=True, default=str))
+    return valor
+
+
+def completo(tipo, engine, snapshot):
+    if tipo == 'anomalias':
+        return DataAnomalyService(engine, snapshot).analyze_data_anomalies()
+    if tipo == 'integridad_referencial':
+        servicio = IntegridadReferencialService(engine, snapshot)
+        anomalias, _ = servicio.verificar_integridad_referencial()
+        return {"anomalias": anomalias, "acciones_definidas": servicio.verificar_acciones_definidas()}
+    return IntegridadReferencialRelacionalService(engine, snapshot, 'nombres').analyze_referential_relationships()
+
+
+@pytest.mark.parametrize('tipo', ['anomalias', 'integridad_referencial', 'integridad_relacional'])
+def test_incremental_matches_full_run(crear_engine, tipo):
+    engine = crear_engine('base', *ESQUEMA)
+    analisis = IncrementalAnalysis()
+
+    snapshot = load_schema_snapshot(engine)
+    resultado, cambios = analisis.analizar(engine, tipo, snapshot)
+    assert not cambios["incremental"]
+    assert canonico(resultado) == canonico(completo(tipo, engine, snapshot))
+
+    for sentencias in CAMBIOS:
+        with engine.begin() as conn:
+            for sentencia in sentencias:
+                conn.exec_driver_sql(sentencia)
+        snapshot = load_schema_snapshot(engine)
+        resultado, cambios = analisis.analizar(engine, tipo, snapshot)
+        assert cambios["incremental"]
+        assert canonico(resultado) == canonico(completo(tipo, engine, snapshot)), sentencias
+
+
+def test_unchanged_schema_recalculates_nothing(crear_engine):
+    engine = crear_engine('base', *ESQUEMA)
+    analisis = IncrementalAnalysis()
+    primero, _ = analisis.analizar(engine, 'anomalias', load_schema_snapshot(engine))
+    segundo, cambios = analisis.analizar(engine, 'anomalias', load_schema_snapshot(engine))
+    assert cambios["tablas_recalculadas"] == 0
+    assert canonico(segundo) == canonico(primero)
+
+
+def test_invalidate_forces_full_run(crear_engine):
+    engine = crear_engine('base', *ESQUEMA)
+    analisis = IncrementalAnalysis()
+    analisis.analizar(engine, 'anomalias', load_schema_snapshot(engine))
+    analisis.invalidate(engine)
+    _, cambios = analisis.analizar(engine, 'anomalias', load_schema_snapshot(engine))
+    assert not cambios["incremental"]
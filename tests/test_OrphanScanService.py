@@ -0,0 +1,110 @@
+# tests/test_OrphanScanService.py
+
+import pytest
+from sqlalchemy import event
+
+from services.OrphanScanService import OrphanScanService
+from services.SchemaSnapshot import load_schema_snapshot
+
+PADRE = "CREATE TABLE padre (id INTEGER PRIMARY KEY)"
+HIJA = "CREATE TABLE hija (id INTEGER PRIMARY KEY, padre_id INTEGER REFERENCES padre (id))"
+
+
+def values(table_name, rows):
+    return f"INSERT INTO {table_name} VALUES " + ', '.join(
+        '(' + ', '.join('NULL' if value is None else repr(value) for value in row) + ')' for row in rows)
+
+
+def service(engine, **options):
+    return OrphanScanService(engine, load_schema_snapshot(engine), **options)
+
+
+def relation(scan_service, child='hija'):
+    return next(r for r in scan_service.get_relations() if r['tabla_hija'] == child)
+
+
+def count_pages(engine):
+    pages = []
+    event.listen(engine, 'before_cursor_execute',
+                 lambda conn, cursor, statement, *args: pages.append(statement) if 'huerfana' in statement else None)
+    return pages
+
+
+def test_sparse_keys_are_paged_by_key(crear_engine):
+    # Claves muy separadas: cada página son las siguientes chunk_size filas, no un rango fijo de ids
+    keys = [1, 10 ** 6, 5 * 10 ** 9, 7 * 10 ** 12, 9 * 10 ** 15]
+    engine = crear_engine('base', PADRE, HIJA, values('padre', [(1,)]),
+                          values('hija', [(key, 1 if index % 2 else 99) for index, key in enumerate(keys)]))
+    pages = count_pages(engine)
+    result = service(engine, chunk_size=2).scan_relation(relation(service(engine)))
+
+    assert result['error'] is None
+    assert result['filas_revisadas'] == 5
+    assert result['huerfanos'] == 3
+    assert not result['truncado']
+    assert len(pages) == 3
+    assert [entry['clave'] for entry in result['muestra']] == [keys[0], keys[2], keys[4]]
+
+
+def test_exact_multiple_of_chunk_size(crear_engine):
+    engine = crear_engine('base', PADRE, HIJA, values('padre', [(1,)]),
+                          values('hija', [(key, 1) for key in range(1, 5)]))
+    pages = count_pages(engine)
+    result = service(engine, chunk_size=2).scan_relation(relation(service(engine)))
+    assert (result['filas_revisadas'], result['huerfanos'], result['truncado']) == (4, 0, False)
+    # La última página vacía confirma el final
+    assert len(pages) == 3
+
+
+def test_row_budget_truncates(crear_engine):
+    engine = crear_engine('base', PADRE, HIJA, values('hija', [(key, 7) for key in range(1, 11)]))
+    result = service(engine, chunk_size=2, row_budget=3).scan_relation(relation(service(engine)))
+    assert result['truncado']
+    assert result['filas_revisadas'] == 4
+    assert result['huerfanos'] == 4
+
+
+def test_nulls_are_not_orphans(crear_engine):
+    engine = crear_engine('base', PADRE, HIJA, values('padre', [(1,)]),
+                          values('hija', [(1, None), (2, 1), (3, None), (4, 2)]))
+    result = service(engine, chunk_size=3, sample_size=1).scan_relation(relation(service(engine)))
+    assert result['huerfanos'] == 1
+    assert result['muestra'] == [{'clave': 4, 'valor': 2}]
+
+
+def test_composite_foreign_key_checks_every_column(crear_engine):
+    engine = crear_engine(
+        'base',
+        "CREATE TABLE padre (a INTEGER, b INTEGER, PRIMARY KEY (a, b))",
+        "CREATE TABLE hija (id INTEGER PRIMARY KEY, a INTEGER, b INTEGER, FOREIGN KEY (a, b) REFERENCES padre (a, b))",
+        values('padre', [(1, 1), (2, 2)]),
+        # (1, 2) coincide con padres distintos en cada columna, pero el par no existe
+        values('hija', [(1, 1, 1), (2, 1, 2), (3, 2, 2), (4, None, 5)]))
+    scan_service = service(engine, chunk_size=2)
+    found = relation(scan_service)
+    assert found['columnas_hija'] == ['a', 'b']
+    result = scan_service.scan_relation(found)
+    assert result['error'] is None
+    assert result['huerfanos'] == 1
+    assert result['muestra'] == [{'clave': 2, 'valor': {'a': 1, 'b': 2}}]
+
+
+@pytest.mark.parametrize('row_budget, truncated', [(10, False), (2, True)])
+def test_table_without_integer_key(crear_engine, row_budget, truncated):
+    engine = crear_engine('base', PADRE,
+                          "CREATE TABLE hija (codigo TEXT PRIMARY KEY, padre_id INTEGER REFERENCES padre (id))",
+                          values('padre', [(1,)]), values('hija', [('a', 1), ('b', 2), ('c', 3)]))
+    result = service(engine, row_budget=row_budget).scan_relation(relation(service(engine)))
+    assert result['truncado'] is truncated
+    if truncated:
+        assert (result['filas_revisadas'], result['huerfanos']) == (0, 0)
+    else:
+        assert (result['filas_revisadas'], result['huerfanos']) == (3, 2)
+        assert sorted(entry['valor'] for entry in result['muestra']) == [2, 3]
+
+
+def test_missing_parent_column_is_reported(crear_engine):
+    engine = crear_engine('base', PADRE, HIJA)
+    scan_service = service(engine)
+    result = scan_service.scan_relation({**relation(scan_service), 'columnas_padre': ['no_existe']})
+    assert result['error'] is not None
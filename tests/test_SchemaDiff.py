@@ -0,0 +1,68 @@
+# tests/test_SchemaDiff.py
+
+from services.SchemaDiff import diff_snapshots
+from services.SchemaSnapshot import ColumnInfo, ForeignKeyInfo, SchemaSnapshot, TableInfo
+
+
+def clientes(*extra_columns, primary_key=('id',), unique_constraints=()):
+    return TableInfo('clientes', [ColumnInfo('id', 'int', False), ColumnInfo('nombre', 'varchar'), *extra_columns],
+                     primary_key, unique_constraints=unique_constraints)
+
+
+def pedidos(foreign_keys=()):
+    return TableInfo('pedidos', [ColumnInfo('id', 'int', False), ColumnInfo('clientes_id', 'int')], ('id',),
+                     foreign_keys)
+
+
+FK_CLIENTE = ForeignKeyInfo('fk_pedidos_clientes', 'pedidos', ['clientes_id'], 'clientes', ['id'])
+
+
+def test_same_snapshot_is_empty():
+    snapshot = SchemaSnapshot('sqlite', [clientes(), pedidos()])
+    assert diff_snapshots(snapshot, snapshot).is_empty()
+    # Tablas equivalentes en snapshots distintos tampoco cuentan como alteradas
+    assert diff_snapshots(snapshot, SchemaSnapshot('sqlite', [clientes(), pedidos()])).is_empty()
+
+
+def test_added_and_removed_tables():
+    old = SchemaSnapshot('sqlite', [clientes(), pedidos()])
+    new = SchemaSnapshot('sqlite', [clientes(), TableInfo('productos', [ColumnInfo('id', 'int')], ('id',))])
+    diff = diff_snapshots(old, new)
+    assert diff.added_tables == {'productos'}
+    assert diff.removed_tables == {'pedidos'}
+    assert diff.altered_tables == {}
+    assert diff.changed_tables() == {'productos', 'pedidos'}
+
+
+def test_altered_columns_and_keys():
+    old = SchemaSnapshot('sqlite', [clientes(ColumnInfo('email', 'varchar')), pedidos()])
+    new = SchemaSnapshot('sqlite', [
+        clientes(ColumnInfo('email', 'nvarchar'), ColumnInfo('alta', 'date'), primary_key=('id', 'nombre'),
+                 unique_constraints=[('email',)]),
+        pedidos([FK_CLIENTE]),
+    ])
+    diff = diff_snapshots(old, new)
+    assert set(diff.altered_tables) == {'clientes', 'pedidos'}
+
+    table_diff = diff.altered_tables['clientes']
+    assert table_diff.added_columns == ['alta']
+    assert table_diff.removed_columns == []
+    assert table_diff.altered_columns == ['email']
+    assert table_diff.primary_key_changed()
+    assert table_diff.to_dict()["clave_primaria"] == {"antes": ['id'], "despues": ['id', 'nombre']}
+    assert table_diff.to_dict()["restricciones_unicas"] == {"agregadas": [['email']], "eliminadas": []}
+
+    table_diff = diff.altered_tables['pedidos']
+    assert not table_diff.primary_key_changed()
+    assert table_diff.to_dict()["fks_agregadas"] == ['fk_pedidos_clientes']
+    assert "clave_primaria" not in table_diff.to_dict()
+
+
+def test_to_dict_is_sorted():
+    old = SchemaSnapshot('sqlite', [])
+    new = SchemaSnapshot('sqlite', [pedidos(), clientes()])
+    assert diff_snapshots(old, new).to_dict() == {
+        "tablas_agregadas": ['clientes', 'pedidos'],
+        "tablas_eliminadas": [],
+        "tablas_alteradas": {},
+    }